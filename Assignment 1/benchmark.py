@@ -0,0 +1,148 @@
+"""
+Throughput benchmarks for the LFSR implementations in lfsr.py.
+
+Run with:
+    python benchmark.py [--bits N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from lfsr import GeneralLFSR, parallel_keystream, _pack_bits, _run_int, _tap_mask
+from lfsr_cipher import encrypt_stream
+
+try:
+    from lfsr_batch import BatchLFSR
+except ImportError:  # numpy is optional
+    BatchLFSR = None
+
+# 16-bit maximal-length configuration used by every benchmark
+SIZE = 16
+TAPS = [0, 2, 11, 15]
+SEED = [1, 0, 1, 1, 0, 0, 1, 0, 1, 0, 0, 1, 1, 1, 0, 1]
+
+
+def _timed(func):
+    """Run func once and return (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+class ListLFSR:
+    """
+    The original list-based GeneralLFSR stepping: the state is a list of bits
+    rebuilt on every step. Kept here as the reference every engine is
+    reported against.
+    """
+    def __init__(self, size, taps, initial_state):
+        self.size = size
+        self.taps = taps
+        self.state = initial_state
+
+    def next_stream_bit(self):
+        stream_bit = self.state[0]
+        feedback = 0
+        for i in self.taps:
+            feedback ^= self.state[i]
+        self.state = [feedback] + self.state[:-1]
+        return stream_bit
+
+
+def bench_list(bits):
+    """Reference list-based stepping (ListLFSR)."""
+    lfsr = ListLFSR(SIZE, TAPS, list(SEED))
+    return _timed(lambda: [lfsr.next_stream_bit() for _ in range(bits)])
+
+
+def bench_stepping(bits):
+    """Bit-by-bit stepping of the packed register (next_stream_bit)."""
+    lfsr = GeneralLFSR(SIZE, TAPS, list(SEED))
+    return _timed(lambda: [lfsr.next_stream_bit() for _ in range(bits)])
+
+
+def bench_int(bits):
+    """Integer engine on its own."""
+    return _timed(lambda: _run_int(_pack_bits(SEED), SIZE, _tap_mask(SIZE, TAPS), bits))
+
+
+def bench_table(bits):
+    """Table-driven engine (next_bits), including building the lookup tables."""
+    lfsr = GeneralLFSR(SIZE, TAPS, list(SEED))
+    return _timed(lambda: lfsr.next_bits(bits))
+
+
+def bench_parallel(bits, workers):
+    """Process-parallel generation with jump-ahead (parallel_keystream)."""
+    lfsr = GeneralLFSR(SIZE, TAPS, list(SEED))
+    return _timed(lambda: parallel_keystream(lfsr, bits // 8, workers=workers))
+
+
+def bench_batch(registers, steps):
+    """Batch stepping of many registers: GeneralLFSR loop vs BatchLFSR."""
+    seeds = [[(n >> i) & 1 for i in range(SIZE)] for n in range(1, registers + 1)]
+    lfsrs = [GeneralLFSR(SIZE, TAPS, list(seed)) for seed in seeds]
+    _, loop_time = _timed(lambda: [[lfsr.next_stream_bit() for _ in range(steps)] for lfsr in lfsrs])
+    batch = BatchLFSR(SIZE, TAPS, seeds)
+    _, batch_time = _timed(lambda: batch.run(steps))
+    return loop_time, batch_time
+
+
+def bench_cipher(nbytes):
+    """File encryption throughput of encrypt_stream, in bytes per second."""
+    with tempfile.TemporaryDirectory() as tmp:
+        src_path, dst_path = os.path.join(tmp, 'plain.bin'), os.path.join(tmp, 'cipher.bin')
+        with open(src_path, 'wb') as f:
+            f.write(os.urandom(nbytes))
+        lfsr = GeneralLFSR(SIZE, TAPS, list(SEED))
+        with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+            _, elapsed = _timed(lambda: encrypt_stream(src, dst, lfsr))
+    return nbytes / elapsed
+
+
+def report(name, bits, elapsed, baseline=None):
+    rate = bits / elapsed
+    line = f"{name:<32}{bits:>12} bits  {elapsed:8.3f} s  {rate / 1e6:8.2f} Mbit/s"
+    if baseline is not None:
+        line += f"  ({baseline / elapsed:5.1f}x)"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LFSR keystream generation.")
+    parser.add_argument('--bits', type=int, default=1_000_000, help="Number of stream bits to generate.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes for the parallel benchmark.")
+    parser.add_argument('--registers', type=int, default=2000, help="Registers in the batch benchmark.")
+    args = parser.parse_args()
+
+    # Speedups are relative to the list-based reference
+    reference, list_time = bench_list(args.bits)
+    report("list reference (ListLFSR)", args.bits, list_time)
+    stepped, step_time = bench_stepping(args.bits)
+    if stepped != reference:
+        raise SystemExit("next_stream_bit() does not match the list reference.")
+    report("bit-by-bit (next_stream_bit)", args.bits, step_time, list_time)
+    _, int_time = bench_int(args.bits)
+    report("integer engine", args.bits, int_time, list_time)
+    _, table_time = bench_table(args.bits)
+    report("table (next_bits)", args.bits, table_time, list_time)
+    print(f"{'':<32}table vs integer engine: {int_time / table_time:.1f}x")
+    _, parallel_time = bench_parallel(args.bits, args.workers)
+    report("parallel (parallel_keystream)", args.bits, parallel_time, list_time)
+
+    rate = bench_cipher(args.bits // 8)
+    print(f"{'encrypt_stream (file)':<32}{args.bits // 8:>12} bytes {rate / 1e6:8.2f} MB/s"
+          f"  ({8 * rate * list_time / args.bits:5.1f}x)")
+
+    if BatchLFSR is not None:
+        steps = max(1, args.bits // args.registers)
+        loop_time, batch_time = bench_batch(args.registers, steps)
+        total = args.registers * steps
+        list_total_time = list_time * total / args.bits # The reference at the same number of bits
+        report(f"{args.registers} x GeneralLFSR loop", total, loop_time, list_total_time)
+        report(f"BatchLFSR ({args.registers} registers)", total, batch_time, list_total_time)
+
+
+if __name__ == "__main__":
+    main()
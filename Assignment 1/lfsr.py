@@ -1,86 +1,424 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# Table-driven stepping: each lookup round advances the register by
+# _TABLE_STEPS steps, with one 256-entry table per byte of state
+_TABLE_STEPS = 64
+_TABLE_MAX_SIZE = 128
+_TABLE_CACHE_SIZE = 32
+
+
+def _pack_bits(bits):
+    """Pack a state list into an integer where bit i holds state[i]."""
+    value = 0
+    for i, b in enumerate(bits):
+        value |= b << i
+    return value
+
+
+def _unpack_bits(value, size):
+    """Unpack an integer into a state list of the given size (bit i -> state[i])."""
+    return [(value >> i) & 1 for i in range(size)]
+
+
+def _tap_mask(size, taps):
+    """
+    Build the feedback mask for a tap sequence. Taps are XORed, so a repeated
+    tap cancels out exactly as it does in the list implementation.
+    """
+    mask = 0
+    for i in taps:
+        if not -size <= i < size:
+            raise ValueError(f"Tap index {i} is out of range for a {size}-bit register.")
+        mask ^= 1 << (i % size)
+    return mask
+
+
+def _run_int(state, size, mask, nbits):
+    """
+    Integer engine: advance a packed register by nbits steps.
+
+    The register is held in one integer (bit i = state[i]), so a step is a
+    popcount parity for the feedback and a left shift for the "shift right"
+    of the state list. The shift is left unmasked for a whole byte: after 8
+    steps bits 8..1 hold the 8 stream bits, MSB-first, and the register is
+    truncated once per byte instead of once per bit. A partial final byte
+    is padded with zeros. Returns (new_state, bytes).
+    """
+    full = (1 << size) - 1
+    out = bytearray()
+    for _ in range(nbits >> 3):
+        for _ in range(8):
+            state = (state << 1) | ((state & mask).bit_count() & 1)
+        out.append((state >> 1) & 0xFF)
+        state &= full
+    rest = nbits & 7
+    if rest:
+        for _ in range(rest):
+            state = (state << 1) | ((state & mask).bit_count() & 1)
+        out.append(((state >> 1) << (8 - rest)) & 0xFF)
+        state &= full
+    return state, bytes(out)
+
+
+@lru_cache(maxsize=_TABLE_CACHE_SIZE)
+def _step_tables(size, mask):
+    """
+    Build the lookup tables for table-driven stepping, cached per (size, mask).
+
+    The register is linear over GF(2), so the state and the stream bits after
+    _TABLE_STEPS steps are the XOR of the results for each byte of the initial
+    state on its own (as in table-driven CRC). Entry v of table c holds those
+    results for state byte c == v, packed as new_state | stream_bits << size.
+    """
+    basis = []
+    for j in range(size):
+        state, out = _run_int(1 << j, size, mask, _TABLE_STEPS)
+        basis.append(state | (int.from_bytes(out, 'big') << size))
+    tables = []
+    for c in range(0, size, 8):
+        table = [0] * 256
+        for v in range(1, 256):
+            bit = c + (v & -v).bit_length() - 1
+            table[v] = table[v & (v - 1)] ^ (basis[bit] if bit < size else 0)
+        tables.append(tuple(table))
+    return tuple(tables)
+
+
+def _run_table(state, size, mask, nbits):
+    """
+    Table engine: advance a packed register by nbits steps (a multiple of
+    _TABLE_STEPS) with one lookup per state byte every _TABLE_STEPS steps.
+    Returns (new_state, bytes) like _run_int().
+    """
+    full = (1 << size) - 1
+    nbytes = _TABLE_STEPS // 8
+    lookups = [(8 * c, table) for c, table in enumerate(_step_tables(size, mask))]
+    out = bytearray()
+    for _ in range(nbits // _TABLE_STEPS):
+        acc = 0
+        for shift, table in lookups:
+            acc ^= table[(state >> shift) & 0xFF]
+        state = acc & full
+        out += (acc >> size).to_bytes(nbytes, 'big')
+    return state, bytes(out)
+
+
+def _generate(state, size, mask, nbits):
+    """
+    Advance a packed register by nbits steps, using the table engine for whole
+    lookup rounds when the register is small enough and the integer engine for
+    the rest. Returns (new_state, bytes).
+    """
+    if size > _TABLE_MAX_SIZE or nbits < 4 * _TABLE_STEPS:
+        return _run_int(state, size, mask, nbits)
+    table_bits = nbits - nbits % _TABLE_STEPS
+    state, head = _run_table(state, size, mask, table_bits)
+    state, tail = _run_int(state, size, mask, nbits - table_bits)
+    return state, head + tail
+
+
+def _transition_matrix(size, mask):
+    """
+    Return the one-step transition of a packed register as a GF(2) matrix.
+
+    Row r is a bit mask over the current state whose parity gives bit r of the
+    next state: row 0 is the tap mask (feedback), row r takes bit r - 1 (shift).
+    """
+    return [mask] + [1 << (r - 1) for r in range(1, size)]
+
+
+def _matrix_apply(matrix, state):
+    """Multiply a GF(2) matrix by a packed state vector."""
+    result = 0
+    for r, row in enumerate(matrix):
+        result |= ((row & state).bit_count() & 1) << r
+    return result
+
+
+def _matrix_multiply(a, b):
+    """Return the GF(2) product a * b (apply b first, then a)."""
+    product = []
+    for row in a:
+        acc = 0
+        j = 0
+        while row:
+            if row & 1:
+                acc ^= b[j]
+            row >>= 1
+            j += 1
+        product.append(acc)
+    return product
+
+
+def _jump_state(state, size, mask, n):
+    """
+    Advance a packed register by n steps in O(size^2 * log n) word operations
+    by applying the binary powers M, M^2, M^4, ... of the transition matrix.
+    """
+    matrix = _transition_matrix(size, mask)
+    while n:
+        if n & 1:
+            state = _matrix_apply(matrix, state)
+        n >>= 1
+        if n:
+            matrix = _matrix_multiply(matrix, matrix)
+    return state
+
+
 class BasicLFSR:
     """
     A 4-bit Linear Feedback Shift Register (LFSR) with fixed taps at R0 and R3 (indices 3 and 0), initialized to 0110.
+
+    The state is kept packed in one integer (bit i = state[i]); get_state() and
+    set_state() still exchange lists of bits.
     """
+    __slots__ = ('_state',)
+
     def __init__(self):
         # Initial state: 0110, where state[0]=R3, state[1]=R2, state[2]=R1, state[3]=R0
-        self.state = [0, 1, 1, 0]
+        self._state = _pack_bits([0, 1, 1, 0])
     
     def set_state(self, state):
         """Set the state to a 4-bit list of 0s and 1s."""
         if len(state) != 4 or not all(b in [0, 1] for b in state):
             raise ValueError("State must be a list of 4 bits (0 or 1).")
-        self.state = state
+        self._state = _pack_bits(state)
     
     def get_state(self):
         """Return the current state."""
-        return self.state
+        return _unpack_bits(self._state, 4)
+
+    state = property(get_state, set_state)
+
+    def snapshot(self):
+        """Capture the current state in O(1); pass the result to restore()."""
+        return self._state
+
+    def restore(self, snapshot):
+        """Rewind to a state captured with snapshot()."""
+        self._state = snapshot
     
     def next_stream_bit(self):
         """
         Generate the next stream bit (R0), compute the feedback as R0 XOR R3,
         shift the state right, and insert feedback at R3.
         """
-        stream_bit = self.state[3] # R0 is shifted out as the stream bit
-        feedback = self.state[3] ^ self.state[0] # R0 XOR R3
-        self.state = [feedback] + self.state[:-1] # Shift right, new R3 = feedback
+        state = self._state
+        stream_bit = (state >> 3) & 1 # R0 is shifted out as the stream bit
+        feedback = ((state >> 3) ^ state) & 1 # R0 XOR R3
+        self._state = ((state << 1) & 0xF) | feedback # Shift right, new R3 = feedback
         return stream_bit
 
 
 class GeneralLFSR:
     """
     A customizable Linear Feedback Shift Register (LFSR) with variable size and tap positions.
+
+    The state is kept packed in one integer (bit i = state[i]) and the taps as
+    an XOR mask, in __slots__, so an instance takes a fixed, small amount of
+    memory regardless of its size. get_state() and set_state() still exchange
+    lists of bits. The state and taps attributes are settable properties; size
+    is read-only (use set_size()), and no other attributes can be added.
     """
+    __slots__ = ('_size', '_mask', '_state', '_origin', '_position')
+
     def __init__(self, size, taps, initial_state=None):
         """Initialize with register size, tap indices and optional initial state."""
-        self.size = size
-        self.taps = taps
+        self._size = size
+        self._mask = _tap_mask(size, taps)
         if initial_state is None:
-            self.state = [0] * size
+            self._state = 0
         else:
             if len(initial_state) != size or not all(b in [0, 1] for b in initial_state):
-                raise ValueError("Initial state must be a list of {size} bits.")
-            self.state = initial_state
+                raise ValueError(f"Initial state must be a list of {size} bits.")
+            self._state = _pack_bits(initial_state)
+        self._mark_origin()
     
+    def _mark_origin(self):
+        """Remember the current state as keystream offset 0 for seek()."""
+        self._origin = self._state
+        self._position = 0
+
     def set_size(self, size):
         """Set the register size and reset state and taps."""
-        self.size = size
-        self.state = [0] * size
-        self.taps = []
+        self._size = size
+        self._state = 0
+        self._mask = 0
+        self._mark_origin()
     
     def get_size(self):
         """Return the current register size."""
-        return self.size
+        return self._size
     
     def set_state(self, state):
         """Set the state to a list matching the register size."""
-        if len(state) != self.size or not all(b in [0, 1] for b in state):
-            raise ValueError("State must be a list of {size} bits.")
-        self.state = state
+        if len(state) != self._size or not all(b in [0, 1] for b in state):
+            raise ValueError(f"State must be a list of {self._size} bits.")
+        self._state = _pack_bits(state)
+        self._mark_origin()
     
     def get_state(self):
         """Return the current state."""
-        return self.state
+        return _unpack_bits(self._state, self._size)
     
     def set_taps(self, taps):
         """Set the tap sequence (indices for XOR feedback)."""
-        self.taps = taps
+        self._mask = _tap_mask(self._size, taps)
+
+    def get_taps(self):
+        """Return the tap positions (a repeated tap cancels out, so it is not listed)."""
+        return [i for i in range(self._size) if (self._mask >> i) & 1]
+
+    def _assign_size(self, size):
+        raise AttributeError("size is read-only; use set_size(), which also resets the state and taps.")
+
+    size = property(get_size, _assign_size)
+    state = property(get_state, set_state)
+    taps = property(get_taps, set_taps)
     
     def reset(self):
         """Reset the state to all zeros."""
-        self.state = [0] * self.size
+        self._state = 0
+        self._mark_origin()
+
+    def snapshot(self):
+        """Capture the current state and keystream offset in O(1); pass the result to restore()."""
+        return (self._state, self._position)
+
+    def restore(self, snapshot):
+        """Rewind to a state and keystream offset captured with snapshot()."""
+        state, position = snapshot
+        if state >> self._size:
+            raise ValueError(f"Snapshot does not fit a {self._size}-bit register.")
+        self._state, self._position = state, position
+
+    def to_bytes(self):
+        """
+        Serialize the register size, taps and current state.
+
+        Format: size as a little-endian uint16, then the tap mask and the state,
+        each as ceil(size / 8) little-endian bytes.
+        """
+        width = (self._size + 7) // 8
+        return (
+            self._size.to_bytes(2, 'little')
+            + self._mask.to_bytes(width, 'little')
+            + self._state.to_bytes(width, 'little')
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a register from to_bytes() output; its current state becomes offset 0."""
+        size = int.from_bytes(data[:2], 'little')
+        width = (size + 7) // 8
+        if len(data) != 2 + 2 * width:
+            raise ValueError("Serialized register has the wrong length.")
+        lfsr = cls(size, [])
+        lfsr._mask = int.from_bytes(data[2:2 + width], 'little')
+        lfsr._state = int.from_bytes(data[2 + width:], 'little')
+        if lfsr._mask >> size or lfsr._state >> size:
+            raise ValueError(f"Serialized taps or state do not fit a {size}-bit register.")
+        lfsr._mark_origin()
+        return lfsr
     
     def next_stream_bit(self):
         """
         Generate the next stream bit (R0), compute the feedback by XORing the tap positions,
         shift the state right and insert feedback at the most significant bit.
         """
-        stream_bit = self.state[0] # R0 (least significant bit)
-        feedback = 0
-        for i in self.taps:
-            feedback ^= self.state[i] # XOR all tap positions
-        self.state = [feedback] + self.state[:-1] # Shift right, new MSB = feedback
-        return stream_bit
+        state = self._state
+        feedback = (state & self._mask).bit_count() & 1 # XOR all tap positions
+        self._state = ((state << 1) & ((1 << self._size) - 1)) | feedback # Shift right, new MSB = feedback
+        self._position += 1
+        return state & 1 # R0 (least significant bit)
+
+    def next_bits(self, n):
+        """
+        Generate the next n stream bits using the table or integer engine.
+
+        Returns the bits packed MSB-first into ceil(n / 8) bytes (the last byte is
+        zero-padded). The output and the resulting state are identical to calling
+        next_stream_bit() n times.
+        """
+        if n < 0:
+            raise ValueError("Number of bits must be non-negative.")
+        self._state, out = _generate(self._state, self._size, self._mask, n)
+        self._position += n
+        return out
+
+    def next_bytes(self, n):
+        """Generate the next n bytes (8 * n stream bits) of keystream."""
+        return self.next_bits(8 * n)
+
+    def jump(self, n):
+        """
+        Advance the register by n steps without generating the stream bits,
+        using binary powers of the GF(2) transition matrix.
+        """
+        if n < 0:
+            raise ValueError("Jump distance must be non-negative.")
+        self._state = _jump_state(self._state, self._size, self._mask, n)
+        self._position += n
+
+    def seek(self, offset):
+        """
+        Move to the given keystream bit offset, counted from the state set by
+        the constructor, set_state(), set_size() or reset().
+        """
+        if offset < 0:
+            raise ValueError("Offset must be non-negative.")
+        if offset < self._position:
+            self._state = self._origin
+            self._position = 0
+        self.jump(offset - self._position)
+
+    def tell(self):
+        """Return the current keystream bit offset."""
+        return self._position
+
+
+def _keystream_chunk(size, taps, state, start_bit, nbytes):
+    """Worker: jump a private copy of the register to start_bit and generate nbytes."""
+    lfsr = GeneralLFSR(size, taps, state)
+    lfsr.jump(start_bit)
+    return lfsr.next_bytes(nbytes)
+
+
+def parallel_keystream(lfsr, nbytes, workers=None, chunk_size=None):
+    """
+    Generate the next nbytes of keystream from a GeneralLFSR across processes.
+
+    The output is split into byte-aligned chunks; each worker jumps its own copy
+    of the register to the start of its chunk and generates that segment, and
+    the segments are written in order into one preallocated bytearray. The
+    result is byte-identical to lfsr.next_bytes(nbytes), and lfsr is advanced
+    past the generated keystream in the same way.
+    """
+    if nbytes < 0:
+        raise ValueError("Number of bytes must be non-negative.")
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        # A few chunks per worker keeps the pool busy when chunks finish unevenly
+        chunk_size = max(1 << 16, -(-nbytes // (4 * workers)))
+    if workers == 1 or nbytes <= chunk_size:
+        return bytearray(lfsr.next_bytes(nbytes))
+
+    out = bytearray(nbytes)
+    view = memoryview(out)
+    size, taps, state = lfsr.get_size(), list(lfsr.taps), list(lfsr.get_state())
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        offsets = range(0, nbytes, chunk_size)
+        futures = [
+            pool.submit(_keystream_chunk, size, taps, state, 8 * offset, min(chunk_size, nbytes - offset))
+            for offset in offsets
+        ]
+        for offset, future in zip(offsets, futures):
+            chunk = future.result()
+            view[offset:offset + len(chunk)] = chunk
+    lfsr.jump(8 * nbytes)
+    return out
 
 
 if __name__ == "__main__":
@@ -99,3 +437,19 @@ if __name__ == "__main__":
         state = lfsr_general.get_state()
         stream_bit = lfsr_general.next_stream_bit()
         print(f"t={i}: State: {state}, Stream bit: {stream_bit}")
+
+    # Verify jump-ahead against stepping the register manually
+    print("\n======== Jump-ahead verification ========")
+    size, taps = 16, [0, 2, 11, 15]
+    seed = [1, 0, 1, 1, 0, 0, 1, 0, 1, 0, 0, 1, 1, 1, 0, 1]
+    for n in [0, 1, 15, 1000, 65535, 123457]:
+        stepped = GeneralLFSR(size, taps, list(seed))
+        for _ in range(n):
+            stepped.next_stream_bit()
+        jumped = GeneralLFSR(size, taps, list(seed))
+        jumped.jump(n)
+        print(f"n={n}: jump matches manual stepping: {jumped.get_state() == stepped.get_state()}")
+    jumped.seek(1000)
+    stepped = GeneralLFSR(size, taps, list(seed))
+    stepped.next_bits(1000)
+    print(f"seek(1000) after jump matches manual stepping: {jumped.get_state() == stepped.get_state()}")
@@ -0,0 +1,443 @@
+"""
+Analysis tools for GeneralLFSR tap sets and keystreams.
+
+Polynomials over GF(2) are stored as Python ints (bit k is the coefficient of
+x^k). A GeneralLFSR of size n with taps T produces a stream satisfying
+u[k] = XOR(u[k - 1 - i] for i in T), so its characteristic polynomial is
+x^n + sum(x^(n - 1 - i) for i in T).
+"""
+import math
+import random
+from itertools import combinations
+
+from lfsr import GeneralLFSR, _pack_bits, _tap_mask
+
+
+# ---------------------------------------------------------------------------
+# GF(2) polynomial arithmetic
+# ---------------------------------------------------------------------------
+
+def _poly_mod(a, mod):
+    """Return a mod `mod` for GF(2) polynomials."""
+    degree = mod.bit_length() - 1
+    while a.bit_length() - 1 >= degree:
+        a ^= mod << (a.bit_length() - 1 - degree)
+    return a
+
+
+def _poly_mulmod(a, b, mod):
+    """Return a * b mod `mod`, where a is already reduced."""
+    top = 1 << (mod.bit_length() - 1)
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        b >>= 1
+        a <<= 1
+        if a & top:
+            a ^= mod
+    return result
+
+
+def _poly_powmod(base, exponent, mod):
+    """Return base^exponent mod `mod` by square-and-multiply."""
+    result = _poly_mod(1, mod)
+    base = _poly_mod(base, mod)
+    while exponent:
+        if exponent & 1:
+            result = _poly_mulmod(result, base, mod)
+        base = _poly_mulmod(base, base, mod)
+        exponent >>= 1
+    return result
+
+
+def _poly_gcd(a, b):
+    while b:
+        a, b = b, _poly_mod(a, b)
+    return a
+
+
+# ---------------------------------------------------------------------------
+# Integer factorization (for the order of x modulo a polynomial)
+# ---------------------------------------------------------------------------
+
+def _is_probable_prime(n):
+    """Deterministic Miller-Rabin for n < 3.3e24, probabilistic beyond."""
+    if n < 2:
+        return False
+    small = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+    for p in small:
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in small:
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _pollard_brent(n):
+    """Return a non-trivial factor of the composite n."""
+    if n % 2 == 0:
+        return 2
+    while True:
+        y, c, m = random.randrange(1, n), random.randrange(1, n), 128
+        g = r = q = 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = math.gcd(q, n)
+                k += m
+            r *= 2
+        if g == n:
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = math.gcd(abs(x - ys), n)
+        if g != n:
+            return g
+
+
+def _prime_factors(n):
+    """Return the set of distinct prime factors of n."""
+    factors = set()
+    for p in (2, 3, 5, 7, 11, 13):
+        while n % p == 0:
+            factors.add(p)
+            n //= p
+    pending = [n] if n > 1 else []
+    while pending:
+        m = pending.pop()
+        if _is_probable_prime(m):
+            factors.add(m)
+        else:
+            d = _pollard_brent(m)
+            pending.extend([d, m // d])
+    return factors
+
+
+# ---------------------------------------------------------------------------
+# Tap-set analysis
+# ---------------------------------------------------------------------------
+
+def characteristic_polynomial(size, taps):
+    """Return the characteristic polynomial of a GeneralLFSR configuration."""
+    poly, mask = 1 << size, _tap_mask(size, taps)
+    for i in range(size):
+        if (mask >> i) & 1:
+            poly ^= 1 << (size - 1 - i)
+    return poly
+
+
+def is_irreducible(poly):
+    """Rabin's irreducibility test for a GF(2) polynomial of degree >= 1."""
+    degree = poly.bit_length() - 1
+    if degree < 1:
+        return False
+    if degree == 1:
+        return True
+    x = 0b10
+
+    def frobenius(k):
+        # x^(2^k) mod poly by k repeated squarings
+        value = x
+        for _ in range(k):
+            value = _poly_mulmod(value, value, poly)
+        return value
+
+    if frobenius(degree) != _poly_mod(x, poly):
+        return False
+    for q in _prime_factors(degree):
+        if _poly_gcd(poly, frobenius(degree // q) ^ _poly_mod(x, poly)) != 1:
+            return False
+    return True
+
+
+def _order_of_x(poly):
+    """Multiplicative order of x modulo an irreducible polynomial."""
+    order = (1 << (poly.bit_length() - 1)) - 1
+    for q in _prime_factors(order):
+        while order % q == 0 and _poly_powmod(0b10, order // q, poly) == 1:
+            order //= q
+    return order
+
+
+def is_primitive(poly):
+    """Return True if poly is a primitive polynomial over GF(2)."""
+    if not poly & 1 or not is_irreducible(poly):
+        return False
+    return _order_of_x(poly) == (1 << (poly.bit_length() - 1)) - 1
+
+
+def is_maximal_length(size, taps):
+    """Return True if the taps give the maximal period 2^size - 1 for every non-zero state."""
+    return is_primitive(characteristic_polynomial(size, taps))
+
+
+def maximal_length_taps(size, max_taps=4):
+    """
+    Yield tap lists with at most max_taps taps that give a maximal-length
+    register of the given size. The last register bit is always tapped,
+    since otherwise the period cannot be maximal.
+    """
+    for count in range(max_taps):
+        for rest in combinations(range(size - 1), count):
+            taps = list(rest) + [size - 1]
+            if is_maximal_length(size, taps):
+                yield taps
+
+
+# ---------------------------------------------------------------------------
+# Period and cycle detection
+# ---------------------------------------------------------------------------
+
+def find_cycle(lfsr, max_steps=None):
+    """
+    Brent's cycle detection on the state sequence of a GeneralLFSR.
+
+    Returns (tail, period): the number of steps before the state enters its
+    cycle and the cycle length. Only two states are kept in memory, but the
+    running time is proportional to tail + period; max_steps bounds it.
+    """
+    size = lfsr.get_size()
+    full, mask = (1 << size) - 1, _tap_mask(size, lfsr.taps)
+    start = _pack_bits(lfsr.get_state())
+
+    power = length = 1
+    tortoise = start
+    hare = ((start << 1) & full) | ((start & mask).bit_count() & 1)
+    steps = 1
+    while tortoise != hare:
+        if power == length:
+            tortoise = hare
+            power *= 2
+            length = 0
+        hare = ((hare << 1) & full) | ((hare & mask).bit_count() & 1)
+        length += 1
+        steps += 1
+        if max_steps is not None and steps > max_steps:
+            raise ValueError(f"No cycle found within {max_steps} steps.")
+
+    tortoise = hare = start
+    for _ in range(length):
+        hare = ((hare << 1) & full) | ((hare & mask).bit_count() & 1)
+    tail = 0
+    while tortoise != hare:
+        tortoise = ((tortoise << 1) & full) | ((tortoise & mask).bit_count() & 1)
+        hare = ((hare << 1) & full) | ((hare & mask).bit_count() & 1)
+        tail += 1
+    return tail, length
+
+
+def period(lfsr, max_steps=None):
+    """
+    Return the period of the state sequence of a GeneralLFSR.
+
+    When the characteristic polynomial is irreducible (including every
+    maximal-length tap set) the period of a non-zero state is the order of x
+    modulo that polynomial, found from the factorization of 2^size - 1 without
+    stepping the register. Other tap sets fall back to find_cycle().
+    """
+    if not any(lfsr.get_state()):
+        return 1
+    poly = characteristic_polynomial(lfsr.get_size(), lfsr.taps)
+    if is_irreducible(poly):
+        return _order_of_x(poly)
+    return find_cycle(lfsr, max_steps)[1]
+
+
+# ---------------------------------------------------------------------------
+# Berlekamp-Massey
+# ---------------------------------------------------------------------------
+
+def berlekamp_massey(bits):
+    """
+    Return (length, taps) of the shortest recurrence that generates bits,
+    with taps in GeneralLFSR convention (u[k] = XOR(u[k - 1 - i] for i in taps)).
+    """
+    connection, previous = 1, 1  # C(x) and B(x), bit j = coefficient of x^j
+    length, shift = 0, 1
+    window = 0  # bit j holds bits[n - j]
+    for n, bit in enumerate(bits):
+        window = (window << 1) | bit
+        if not (connection & window).bit_count() & 1:
+            shift += 1
+        elif 2 * length <= n:
+            connection, previous = connection ^ (previous << shift), connection
+            length = n + 1 - length
+            shift = 1
+        else:
+            connection ^= previous << shift
+            shift += 1
+    taps = [j - 1 for j in range(1, length + 1) if (connection >> j) & 1]
+    return length, taps
+
+
+def _solve_gf2(equations, unknowns):
+    """
+    Solve linear equations over GF(2), each a (mask, constant) pair where bit j
+    of mask is the coefficient of unknown j. Return (solution, kernel): one
+    solution, with free unknowns set to 0, and a basis of the homogeneous
+    system's solutions, all as bit masks. Return None if there is no solution.
+    """
+    rows = [list(equation) for equation in equations]
+    pivots = []  # (column, row), rows reduced so a pivot column appears in its row only
+    for column in range(unknowns):
+        row = next((r for r in rows if (r[0] >> column) & 1 and all(r is not p for _, p in pivots)), None)
+        if row is None:
+            continue
+        for other in rows:
+            if other is not row and (other[0] >> column) & 1:
+                other[0] ^= row[0]
+                other[1] ^= row[1]
+        pivots.append((column, row))
+    if any(mask == 0 and const for mask, const in rows):
+        return None
+    solution = 0
+    for column, (_, const) in pivots:
+        solution |= const << column
+    pivot_columns = {column for column, _ in pivots}
+    kernel = []
+    for free in range(unknowns):
+        if free not in pivot_columns:
+            vector = 1 << free
+            for column, (mask, _) in pivots:
+                if (mask >> free) & 1:
+                    vector |= 1 << column
+            kernel.append(vector)
+    return solution, kernel
+
+
+def _connections(bits, length, taps):
+    """
+    Yield the connection polynomials of degree at most length that generate
+    bits (bit j = coefficient of x^j), Berlekamp-Massey's first. It is the only
+    one when at least 2 * length bits are observed; otherwise the others are
+    the rest of the solutions of the linear system, 2^(2 * length - len(bits))
+    or more of them.
+    """
+    connection = 1
+    for i in taps:
+        connection |= 1 << (i + 1)
+    yield connection
+    # Unknown j - 1 is c_j: bits[t] = XOR(c_j * bits[t - j]) for length <= t < len(bits)
+    equations = [
+        (sum(bits[t - j] << (j - 1) for j in range(1, length + 1)), bits[t])
+        for t in range(length, len(bits))
+    ]
+    _, kernel = _solve_gf2(equations, length)
+    for combination in range(1, 1 << len(kernel)):
+        delta = 0
+        for k, vector in enumerate(kernel):
+            if (combination >> k) & 1:
+                delta ^= vector
+        yield connection ^ (delta << 1)
+
+
+def _initial_state(bits, length, connection):
+    """
+    Return the initial state of a GeneralLFSR of size length with the given
+    connection polynomial whose stream starts with bits, or None. The register
+    outputs state[0] first and its feedback bits after that, so the rest of
+    the state is solved from the recurrence over GF(2).
+    """
+    # Sequence u[0..]: u[length - 1 + t] = bits[t]; u[0 .. length - 2] are unknown.
+    # Express each u[m] as (unknowns mask, constant) and require the recurrence
+    # u[m] = XOR(c_j * u[m - j]) for length <= m <= 2 * length - 2.
+    hidden = length - 1
+    known = lambda m: (0, bits[m - hidden]) if m >= hidden else (1 << m, 0)
+    equations = []
+    for m in range(length, 2 * length - 1):
+        mask, const = known(m)
+        for j in range(1, length + 1):
+            if (connection >> j) & 1:
+                term_mask, term_const = known(m - j)
+                mask ^= term_mask
+                const ^= term_const
+        equations.append((mask, const))
+    solved = _solve_gf2(equations, hidden)
+    if solved is None:
+        return None
+    solution = solved[0]
+    # state[i] = u[length - 1 - i]
+    return [bits[0]] + [(solution >> (length - 1 - i)) & 1 for i in range(1, length)]
+
+
+def recover_lfsr(bits):
+    """
+    Return a minimal GeneralLFSR whose stream starts with the observed bits.
+
+    The register size is the linear complexity from berlekamp_massey(). Its
+    connection polynomial is tried first; with fewer than 2 * size bits
+    observed, it is not the only one of that degree, and the connection
+    polynomial it returns may not fit a register whose first output is
+    state[0], so the others are searched too. Raises ValueError if no
+    register of that size reproduces the stream.
+    """
+    bits = list(bits)
+    length, taps = berlekamp_massey(bits)
+    if length == 0:
+        return GeneralLFSR(1, [], [0])
+    for connection in _connections(bits, length, taps):
+        state = _initial_state(bits, length, connection)
+        if state is None:
+            continue
+        taps = [j - 1 for j in range(1, length + 1) if (connection >> j) & 1]
+        check = GeneralLFSR(length, taps, list(state))
+        if [check.next_stream_bit() for _ in range(len(bits))] == bits:
+            return GeneralLFSR(length, taps, state)
+    raise ValueError(f"No GeneralLFSR of size {length}, the stream's linear complexity, reproduces the stream.")
+
+
+if __name__ == "__main__":
+    # Maximal-length detection and period without stepping the register
+    print("======== Maximal-length tap sets ========")
+    for size, taps in [(4, [0, 3]), (4, [1, 3]), (16, [0, 2, 11, 15]), (16, [0, 2, 3, 15]), (32, [0, 1, 21, 31]), (64, [0, 1, 10, 63])]:
+        lfsr = GeneralLFSR(size, taps, [1] + [0] * (size - 1))
+        print(f"size={size}, taps={taps}: maximal={is_maximal_length(size, taps)}, period={period(lfsr)}")
+
+    # Cross-check period() against Brent cycle detection on small registers
+    print("\n======== Period vs. Brent cycle detection ========")
+    rng = random.Random(7)
+    matches = True
+    for _ in range(200):
+        size = rng.randint(2, 12)
+        taps = rng.sample(range(size), rng.randint(1, size))
+        lfsr = GeneralLFSR(size, taps, [rng.randint(0, 1) for _ in range(size)])
+        matches &= period(lfsr) == find_cycle(lfsr)[1]
+    print(f"period() matches find_cycle() on 200 random registers: {matches}")
+
+    # Recover registers from their output with Berlekamp-Massey
+    print("\n======== Berlekamp-Massey recovery ========")
+    for size, taps in [(16, [0, 2, 11, 15]), (32, [0, 1, 21, 31]), (64, [0, 1, 10, 63])]:
+        original = GeneralLFSR(size, taps, [rng.randint(0, 1) for _ in range(size)])
+        observed = [original.next_stream_bit() for _ in range(2 * size + 16)]
+        recovered = recover_lfsr(observed)
+        replay = [recovered.next_stream_bit() for _ in range(len(observed) + 500)]
+        expected = observed + [original.next_stream_bit() for _ in range(500)]
+        print(f"size={size}: recovered size={recovered.get_size()}, taps={recovered.taps}, "
+              f"stream matches: {replay == expected}")
+
+    # Short streams: the Berlekamp-Massey polynomial of [1,0,0,1,1,1,0,0,0]
+    # leaves no consistent initial state, another degree-5 polynomial does
+    observed = [1, 0, 0, 1, 1, 1, 0, 0, 0]  # GeneralLFSR(5, [0, 1, 3, 4], [1, 1, 0, 1, 1])
+    recovered = recover_lfsr(observed)
+    print(f"{observed}: recovered size={recovered.get_size()}, taps={recovered.taps}, "
+          f"stream matches: {[recovered.next_stream_bit() for _ in range(len(observed))] == observed}")
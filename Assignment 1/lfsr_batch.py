@@ -0,0 +1,130 @@
+import numpy as np
+
+from lfsr import GeneralLFSR, _tap_mask
+
+# numpy >= 2.0 has a vectorized popcount; older versions fall back to XOR folding
+_bitwise_count = getattr(np, 'bitwise_count', None)
+
+
+def _parity64(words):
+    """Return the parity (0 or 1) of every uint64 word in an array."""
+    if _bitwise_count is not None:
+        return (_bitwise_count(words) & 1).astype(np.uint64)
+    words = words ^ (words >> np.uint64(32))
+    words ^= words >> np.uint64(16)
+    words ^= words >> np.uint64(8)
+    words ^= words >> np.uint64(4)
+    words ^= words >> np.uint64(2)
+    words ^= words >> np.uint64(1)
+    return words & np.uint64(1)
+
+
+class BatchLFSR:
+    """
+    N GeneralLFSR registers of the same size stepped together with NumPy.
+
+    Registers of up to 64 bits are packed one per uint64 word (bit i = state[i]),
+    so a step for the whole batch is a handful of vectorized word operations.
+    Larger registers are kept as an (N, size) uint8 bit matrix. Each register
+    may have its own taps, and row n of every result matches a GeneralLFSR
+    built with the same size, taps and initial state.
+    """
+    PACKED_MAX_SIZE = 64
+
+    def __init__(self, size, taps, states):
+        """
+        Initialize with the register size, the taps and an (N, size) array of
+        initial states. taps is either one tap list shared by every register or
+        a list of N tap lists.
+        """
+        states = np.asarray(states, dtype=np.uint8)
+        if states.ndim != 2 or states.shape[1] != size or (states > 1).any():
+            raise ValueError(f"States must be an (N, {size}) array of bits.")
+        count = states.shape[0]
+        if taps and isinstance(taps[0], (list, tuple, np.ndarray)):
+            if len(taps) != count:
+                raise ValueError("Per-register taps must have one tap list per register.")
+            tap_lists = taps
+        else:
+            tap_lists = [taps] * count
+        masks = [_tap_mask(size, t) for t in tap_lists]
+
+        self.size = size
+        self.packed = size <= self.PACKED_MAX_SIZE
+        if self.packed:
+            weights = np.uint64(1) << np.arange(size, dtype=np.uint64)
+            self._states = (states.astype(np.uint64) * weights).sum(axis=1, dtype=np.uint64)
+            self._masks = np.array(masks, dtype=np.uint64)
+            self._full = np.uint64((1 << size) - 1)
+        else:
+            self._states = states.copy()
+            self._masks = np.array([[(m >> i) & 1 for i in range(size)] for m in masks], dtype=np.uint8)
+
+    @classmethod
+    def from_lfsrs(cls, lfsrs):
+        """Build a batch from GeneralLFSR instances that share one register size."""
+        size = lfsrs[0].get_size()
+        if any(lfsr.get_size() != size for lfsr in lfsrs):
+            raise ValueError("All registers in a batch must have the same size.")
+        return cls(size, [list(lfsr.taps) for lfsr in lfsrs], [lfsr.get_state() for lfsr in lfsrs])
+
+    def __len__(self):
+        return self._states.shape[0]
+
+    def get_states(self):
+        """Return the current states as an (N, size) uint8 array."""
+        if not self.packed:
+            return self._states.copy()
+        shifts = np.arange(self.size, dtype=np.uint64)
+        return ((self._states[:, None] >> shifts) & np.uint64(1)).astype(np.uint8)
+
+    def to_lfsrs(self):
+        """Return the registers as GeneralLFSR instances (mainly for checking results)."""
+        states = self.get_states()
+        if self.packed:
+            masks = [int(m) for m in self._masks]
+        else:
+            masks = [int(sum(int(b) << i for i, b in enumerate(row))) for row in self._masks]
+        return [
+            GeneralLFSR(self.size, [i for i in range(self.size) if (m >> i) & 1], row.tolist())
+            for m, row in zip(masks, states)
+        ]
+
+    def run(self, steps):
+        """
+        Step every register `steps` times and return the stream bits as an
+        (N, steps) uint8 matrix, where row n is the output of register n.
+        """
+        out = np.empty((len(self), steps), dtype=np.uint8)
+        states, masks = self._states, self._masks
+        if self.packed:
+            one, full = np.uint64(1), self._full
+            for t in range(steps):
+                out[:, t] = states & one
+                feedback = _parity64(states & masks)
+                states = ((states << one) & full) | feedback
+        else:
+            for t in range(steps):
+                out[:, t] = states[:, 0]
+                feedback = np.bitwise_xor.reduce(states & masks, axis=1)
+                states[:, 1:] = states[:, :-1].copy()
+                states[:, 0] = feedback
+        self._states = states
+        return out
+
+
+if __name__ == "__main__":
+    # Verify the batch against GeneralLFSR row by row
+    rng = np.random.default_rng(2024)
+    for size in [4, 16, 64, 80]:
+        count, steps = 200, 300
+        states = rng.integers(0, 2, size=(count, size))
+        taps = [sorted(rng.choice(size, size=rng.integers(1, size + 1), replace=False).tolist()) for _ in range(count)]
+        batch = BatchLFSR(size, taps, states)
+        out = batch.run(steps)
+        matches = True
+        for n in range(count):
+            lfsr = GeneralLFSR(size, taps[n], states[n].tolist())
+            expected = [lfsr.next_stream_bit() for _ in range(steps)]
+            matches &= out[n].tolist() == expected and batch.get_states()[n].tolist() == lfsr.get_state()
+        print(f"size={size}: batch of {count} matches GeneralLFSR row by row: {matches}")
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from .profiling import install_hooks, profiling_settings
+
+        options = profiling_settings()
+        if options['SAMPLE_RATE'] or options['ALLOW_HEADER']:
+            install_hooks()
@@ -0,0 +1,97 @@
+"""
+Archival of soft-deleted rows: headers deleted before a cutoff are moved,
+with their details and sell allocations, from the hot tables to the archive
+tables (models.ArchivedModel), then deleted items that nothing refers to
+any more. Each batch is copied and deleted in one transaction.
+"""
+from collections import Counter
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from .models import (
+    Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, SellAllocation, StockMovement, ReportJob,
+    ArchivedItem, ArchivedPurchaseHeader, ArchivedPurchaseDetail, ArchivedSellHeader, ArchivedSellDetail,
+    ArchivedSellAllocation
+)
+
+BATCH_SIZE = 500 # Headers or items moved per transaction
+INSERT_BATCH_SIZE = 1000 # Rows per INSERT into an archive table
+
+def archivable_sales(cutoff):
+    """Sell headers deleted before cutoff, in id order. Those still in the ledger stay."""
+    return SellHeader.all_objects.filter(is_deleted=True, updated_at__lt=cutoff).exclude(
+        Exists(StockMovement.objects.filter(sell_detail__header=OuterRef('pk')))
+    ).order_by('id')
+
+def archivable_purchases(cutoff):
+    """
+    Purchase headers deleted before cutoff, in id order. Lots that sales
+    were allocated from (including deleted sales not archived yet) stay.
+    """
+    return PurchaseHeader.all_objects.filter(is_deleted=True, updated_at__lt=cutoff).exclude(
+        Exists(SellAllocation.all_objects.filter(purchase_detail__header=OuterRef('pk')))
+    ).exclude(
+        Exists(StockMovement.objects.filter(purchase_detail__header=OuterRef('pk')))
+    ).order_by('id')
+
+def archivable_items(cutoff):
+    """Items deleted before cutoff without details, ledger rows or report jobs left, in id order."""
+    return Item.all_objects.filter(is_deleted=True, updated_at__lt=cutoff).exclude(
+        Exists(PurchaseDetail.all_objects.filter(item=OuterRef('pk')))
+    ).exclude(
+        Exists(SellDetail.all_objects.filter(item=OuterRef('pk')))
+    ).exclude(
+        Exists(StockMovement.objects.filter(item=OuterRef('pk')))
+    ).exclude(
+        Exists(ReportJob.objects.filter(item=OuterRef('pk')))
+    ).order_by('id')
+
+def move(queryset, archive_model):
+    """Copy the rows of queryset into archive_model and delete them. Returns the number of rows."""
+    fields = [field.attname for field in archive_model._meta.concrete_fields if field.attname != 'archived_at']
+    rows = [archive_model(**row) for row in queryset.values(*fields)]
+    archive_model.objects.bulk_create(rows, batch_size=INSERT_BATCH_SIZE)
+    queryset.delete()
+    return len(rows)
+
+def archive_batch(archivable, batch_size, moves):
+    """
+    Move up to batch_size rows of the archivable queryset. moves(ids) lists
+    (queryset, archive_model, name) to move, dependents first. Returns a
+    Counter of rows moved per name.
+    """
+    counts = Counter()
+    with transaction.atomic():
+        ids = list(archivable.select_for_update().values_list('pk', flat=True)[:batch_size])
+        if ids:
+            for queryset, archive_model, name in moves(ids):
+                counts[name] += move(queryset, archive_model)
+    return counts
+
+def archive_deleted(cutoff, batch_size=BATCH_SIZE, progress=None):
+    """
+    Archive the rows soft-deleted before cutoff (a datetime): sales first,
+    which releases the lots they were allocated from, then purchases, then
+    items. progress(counts) is called after each batch. Returns a Counter of
+    rows moved per table.
+    """
+    stages = [
+        (archivable_sales, lambda ids: [
+            (SellAllocation.all_objects.filter(sell_detail__header__in=ids), ArchivedSellAllocation, 'sell_allocations'),
+            (SellDetail.all_objects.filter(header__in=ids), ArchivedSellDetail, 'sell_details'),
+            (SellHeader.all_objects.filter(pk__in=ids), ArchivedSellHeader, 'sell_headers'),
+        ]),
+        (archivable_purchases, lambda ids: [
+            (PurchaseDetail.all_objects.filter(header__in=ids), ArchivedPurchaseDetail, 'purchase_details'),
+            (PurchaseHeader.all_objects.filter(pk__in=ids), ArchivedPurchaseHeader, 'purchase_headers'),
+        ]),
+        (archivable_items, lambda ids: [
+            (Item.all_objects.filter(pk__in=ids), ArchivedItem, 'items'), # Stock snapshots are deleted with them
+        ]),
+    ]
+    total = Counter()
+    for archivable, moves in stages:
+        while counts := archive_batch(archivable(cutoff), batch_size, moves):
+            total.update(counts)
+            if progress is not None:
+                progress(total)
+    return total
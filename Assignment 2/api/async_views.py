@@ -0,0 +1,48 @@
+"""
+Async versions of the read endpoints for ASGI deployments. They return the
+same JSON as the DRF views (DRF views are synchronous) and use the async ORM,
+so a worker can serve other requests while one waits for the database.
+"""
+from django.http import JsonResponse
+from rest_framework.exceptions import NotFound, ValidationError
+from .cache import aget_report_dict
+from .models import Item
+from .pagination import KeysetPagination
+from .reports import StockReport
+from .serializers import ItemSerializer
+from .views import ItemViewSet, ReportError, report_dates
+
+async def item_list(request):
+    """GET /async/items/, like GET /items/."""
+    paginator = KeysetPagination()
+    try:
+        items = await paginator.apaginate_queryset(ItemViewSet.queryset.all(), request, ItemViewSet)
+        data = ItemSerializer(items, many=True, context={'request': request}).data
+    except NotFound as error:
+        return JsonResponse({"detail": error.detail}, status=404)
+    except ValidationError as error:
+        return JsonResponse(error.detail, status=400)
+    return JsonResponse({'next': paginator.get_next_link(), 'results': data})
+
+async def item_detail(request, code):
+    """GET /async/items/{code}/, like GET /items/{code}/."""
+    try:
+        item = await ItemViewSet.queryset.aget(code=code)
+        data = ItemSerializer(item, context={'request': request}).data
+    except Item.DoesNotExist:
+        return JsonResponse({"detail": "No Item matches the given query."}, status=404)
+    except ValidationError as error:
+        return JsonResponse(error.detail, status=400)
+    return JsonResponse(data)
+
+async def report(request, item_code):
+    """GET /async/report/{item_code}/, like GET /report/{item_code}/ (and sharing its cache)."""
+    try:
+        start_date, end_date = report_dates(request.GET)
+    except ReportError as error:
+        return JsonResponse({"error": error.message}, status=error.status)
+    try:
+        item = await Item.objects.aget(code=item_code, is_deleted=False)
+    except Item.DoesNotExist:
+        return JsonResponse({"error": "Item not found."}, status=404)
+    return JsonResponse({"result": await aget_report_dict(StockReport(item, start_date, end_date))})
@@ -0,0 +1,160 @@
+"""
+Repeatable benchmarks of the main endpoints through the Django test client:
+item list pages, item lookups, purchase and sale postings (FIFO) and stock
+reports. Each scenario records latency percentiles, throughput and queries
+per request. Everything runs in a transaction that is rolled back, so runs
+against the same database (e.g. from generate_data) are comparable.
+"""
+import random
+import time
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .cache import bump_item_versions
+from .models import Item, PurchaseDetail, SellDetail, StockMovement
+from .synthetic import Popularity
+
+SCENARIOS = ['item_list', 'item_detail', 'purchase', 'sale', 'report']
+COMPARED = ['throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_avg'] # Shown by compare()
+
+def percentile(values, fraction):
+    """The value at fraction (0-1) of sorted values, by the nearest-rank method."""
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+def summarize(latencies, queries, errors):
+    """Statistics of one scenario from its per-request latencies (s) and query counts."""
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / sum(latencies), 1),
+        'mean_ms': round(1000 * sum(latencies) / len(latencies), 3),
+        'p50_ms': round(1000 * percentile(ordered, 0.50), 3),
+        'p95_ms': round(1000 * percentile(ordered, 0.95), 3),
+        'p99_ms': round(1000 * percentile(ordered, 0.99), 3),
+        'max_ms': round(1000 * ordered[-1], 3),
+        'queries_avg': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+class BenchmarkSuite:
+    """
+    Run the scenarios with requests timed requests each, after warmup
+    untimed ones. Items are picked with the same skewed popularity as the
+    generated data (see synthetic.Popularity), so popular items are served
+    from the cache after their first request, as in production. Reports
+    cover report_days up to the latest transaction.
+    """
+    def __init__(self, requests=200, warmup=10, scenarios=SCENARIOS, report_days=365, skew=1.0, seed=0):
+        self.requests = requests
+        self.warmup = warmup
+        self.scenarios = scenarios
+        self.report_days = report_days
+        self.skew = skew
+        self.seed = seed
+
+    def dataset(self):
+        """Row counts of the data benchmarked."""
+        return {
+            'items': Item.objects.filter(is_deleted=False).count(),
+            'purchase_details': PurchaseDetail.objects.count(),
+            'sell_details': SellDetail.objects.count(),
+            'movements': StockMovement.objects.count(),
+        }
+
+    def run(self):
+        """Run the scenarios and return {'created_at', 'database', 'dataset', 'options', 'scenarios'}."""
+        items = list(Item.objects.filter(is_deleted=False).order_by('code').only('id', 'code'))
+        if not items:
+            raise ValueError("No items to benchmark. Run generate_data first.")
+        result = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'dataset': self.dataset(),
+            'options': {'requests': self.requests, 'warmup': self.warmup, 'report_days': self.report_days,
+                        'skew': self.skew, 'seed': self.seed},
+            'scenarios': {},
+        }
+        # The test client's host, and a rollback so postings leave no trace
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            try:
+                with transaction.atomic():
+                    self.client = APIClient()
+                    self.rng = random.Random(self.seed)
+                    self.popularity = Popularity(items, self.skew, self.rng)
+                    for name in self.scenarios:
+                        result['scenarios'][name] = self.run_scenario(name)
+                    transaction.set_rollback(True)
+            finally:
+                # Versions were bumped by the rolled back postings; bump again so nothing cached from them is read
+                bump_item_versions(item.pk for item in items)
+        return result
+
+    def run_scenario(self, name):
+        request = getattr(self, f'setup_{name}')()
+        for _ in range(self.warmup):
+            request()
+        latencies, queries, errors = [], [], 0
+        for _ in range(self.requests):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request()
+                latencies.append(time.perf_counter() - start)
+            queries.append(len(captured))
+            errors += response.status_code >= 400
+        return summarize(latencies, queries, errors)
+
+    # Each setup_* prepares a scenario and returns a function sending one request
+
+    def setup_item_list(self):
+        """Walk the item list page by page, starting over after the last one."""
+        pages = {'next': None}
+        def request():
+            response = self.client.get(pages['next'] or '/items/')
+            pages['next'] = response.json().get('next')
+            return response
+        return request
+
+    def setup_item_detail(self):
+        return lambda: self.client.get(f'/items/{self.popularity.pick().code}/')
+
+    def setup_purchase(self):
+        self.client.post('/purchase/', {'code': 'BENCH-P', 'date': date.today(), 'description': 'Benchmark'}, format='json')
+        return lambda: self.client.post('/purchase/BENCH-P/details/', {
+            'item_code': self.popularity.pick().code, 'quantity': 10, 'unit_price': '10.00'
+        }, format='json')
+
+    def setup_sale(self):
+        """Sell one unit of popular items in stock."""
+        self.client.post('/sell/', {'code': 'BENCH-S', 'date': date.today(), 'description': 'Benchmark'}, format='json')
+        in_stock = set(Item.objects.filter(is_deleted=False, stock__gt=0).values_list('code', flat=True))
+        if not in_stock:
+            raise ValueError("No items in stock to sell. Run generate_data first.")
+        def request():
+            while (code := self.popularity.pick().code) not in in_stock:
+                pass
+            return self.client.post('/sell/BENCH-S/details/', {'item_code': code, 'quantity': 1}, format='json')
+        return request
+
+    def setup_report(self):
+        end_date = StockMovement.objects.aggregate(last=Max('date'))['last'] or date.today()
+        params = {'start_date': end_date - timedelta(days=self.report_days - 1), 'end_date': end_date}
+        return lambda: self.client.get(f'/report/{self.popularity.pick().code}/', params)
+
+def compare(result, baseline):
+    """Lines comparing the scenarios of result with a baseline result, as percent changes."""
+    lines = [f"{'scenario':<12}" + ''.join(f"{metric:>24}" for metric in COMPARED)]
+    for name, stats in result['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        cells = []
+        for metric in COMPARED:
+            if before is None or not before[metric]:
+                cells.append(f"{stats[metric]:>24}")
+            else:
+                cells.append(f"{before[metric]} -> {stats[metric]} ({100 * (stats[metric] / before[metric] - 1):+.0f}%)".rjust(24))
+        lines.append(f"{name:<12}" + ''.join(cells))
+    return lines
@@ -0,0 +1,148 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+CACHE_ALIAS = getattr(settings, 'WAREHOUSE_CACHE', 'default') # Any Django cache backend (locmem, Redis, ...)
+REPORT_CACHE_MAX_ROWS = 10_000 # Larger reports are not cached, use the streaming endpoint for those
+
+_MISSING = object()
+
+class CacheMetrics:
+    """Thread-safe hit and miss counters per kind of cached value (item, report)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = {}
+            self.misses = {}
+
+    def record(self, kind, hit):
+        with self._lock:
+            counts = self.hits if hit else self.misses
+            counts[kind] = counts.get(kind, 0) + 1
+
+    def snapshot(self):
+        """Return {kind: {'hits', 'misses', 'hit_rate'}}."""
+        with self._lock:
+            result = {}
+            for kind in sorted(set(self.hits) | set(self.misses)):
+                hits, misses = self.hits.get(kind, 0), self.misses.get(kind, 0)
+                result[kind] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+            return result
+
+cache_metrics = CacheMetrics()
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+def _version_key(item_id):
+    return f'item-version:{item_id}'
+
+def item_version(item_id):
+    """
+    The current data version of an item. A missing counter (never set, or
+    evicted) starts from the clock, so it never repeats a version that
+    earlier cache entries were stored under.
+    """
+    cache = _cache()
+    version = cache.get(_version_key(item_id))
+    if version is None:
+        cache.add(_version_key(item_id), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(item_id))
+    return version
+
+async def aitem_version(item_id):
+    """item_version() with the cache's async API."""
+    cache = _cache()
+    version = await cache.aget(_version_key(item_id))
+    if version is None:
+        await cache.aadd(_version_key(item_id), time.time_ns(), timeout=None)
+        version = await cache.aget(_version_key(item_id))
+    return version
+
+def _bump(item_ids):
+    cache = _cache()
+    for item_id in item_ids:
+        try:
+            cache.incr(_version_key(item_id))
+        except ValueError: # No counter yet: any version from the clock is new
+            cache.set(_version_key(item_id), time.time_ns(), timeout=None)
+
+def bump_item_versions(item_ids):
+    """
+    Invalidate everything cached for these items by bumping their versions,
+    now and again when the transaction commits. The second bump discards
+    values that readers cached from pre-commit data after the first one.
+    """
+    item_ids = list(item_ids)
+    _bump(item_ids)
+    transaction.on_commit(lambda: _bump(item_ids))
+
+def read_through(kind, key, item_id, load, cacheable=lambda value: True):
+    """
+    Return the value cached under key for the item's current version, or
+    load() it and cache it. The version is read before loading, so a value
+    loaded during a concurrent posting is stored under a version that the
+    posting's commit makes obsolete.
+    """
+    cache = _cache()
+    versioned_key = f'{key}:v{item_version(item_id)}'
+    value = cache.get(versioned_key, _MISSING)
+    cache_metrics.record(kind, value is not _MISSING)
+    if value is _MISSING:
+        value = load()
+        if cacheable(value):
+            cache.set(versioned_key, value, timeout=None)
+    return value
+
+async def aread_through(kind, key, item_id, load, cacheable=lambda value: True):
+    """read_through() for async views; load is a coroutine function."""
+    cache = _cache()
+    versioned_key = f'{key}:v{await aitem_version(item_id)}'
+    value = await cache.aget(versioned_key, _MISSING)
+    cache_metrics.record(kind, value is not _MISSING)
+    if value is _MISSING:
+        value = await load()
+        if cacheable(value):
+            await cache.aset(versioned_key, value, timeout=None)
+    return value
+
+def get_item(code):
+    """
+    A live item by code, like Item.objects.get(code=code, is_deleted=False).
+    The code's item id is cached on first use and the item row under the
+    item's version afterwards.
+    """
+    from .models import Item
+
+    cache = _cache()
+    item_id = cache.get(f'item-code:{code}')
+    if item_id is not None:
+        try:
+            return read_through('item', f'item:{item_id}', item_id,
+                                lambda: Item.objects.get(pk=item_id, code=code, is_deleted=False))
+        except Item.DoesNotExist: # Deleted, or the code now belongs to another item
+            cache.delete(f'item-code:{code}')
+    else:
+        cache_metrics.record('item', False)
+    item = Item.objects.get(code=code, is_deleted=False)
+    cache.set(f'item-code:{code}', item.pk, timeout=None)
+    return item
+
+def get_report_dict(report):
+    """StockReport.as_dict() of a report, cached per (item, start, end, version)."""
+    return read_through(
+        'report', f'report:{report.item.pk}:{report.start_date}:{report.end_date}', report.item.pk,
+        report.as_dict, cacheable=lambda result: len(result['items']) <= REPORT_CACHE_MAX_ROWS
+    )
+
+async def aget_report_dict(report):
+    """get_report_dict() for async views, building the report with the async ORM."""
+    return await aread_through(
+        'report', f'report:{report.item.pk}:{report.start_date}:{report.end_date}', report.item.pk,
+        report.aas_dict, cacheable=lambda result: len(result['items']) <= REPORT_CACHE_MAX_ROWS
+    )
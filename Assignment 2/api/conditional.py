@@ -0,0 +1,89 @@
+"""
+Conditional GET for polled endpoints. Responses carry an ETag and, where
+the data has a modification time, Last-Modified. A request whose
+If-None-Match (or If-Modified-Since) still matches is answered with 304 Not
+Modified after one cheap query of updated_at timestamps and ledger ids,
+without loading the objects, serializing them or replaying a report.
+"""
+import hashlib
+from django.db.models import DateTimeField, Max, OuterRef, Subquery, Value
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from .models import Item, StockMovement
+
+def make_etag(request, version):
+    """
+    A weak ETag of the data version and of the query string and Accept
+    header, which select the representation (?fields=, report dates, format).
+    """
+    key = repr((version, request.META.get('QUERY_STRING', ''), request.META.get('HTTP_ACCEPT', '')))
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()}"'
+
+def conditional_get(request, version, last_modified, respond):
+    """
+    Answer with 304 Not Modified if the request's validators match version
+    (any value with a stable repr identifying the data) and last_modified (a
+    datetime or None), else with respond(). 200 and 304 responses get the
+    validators and Cache-Control: no-cache, so clients revalidate on every
+    poll instead of reusing a response by heuristic freshness.
+    """
+    etag = make_etag(request, version)
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = respond()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+def ledger_item(code):
+    """
+    A live item with last_movement, the id of its latest ledger movement, or
+    None. Postings and reposts stamp the item's updated_at and every change
+    of its ledger writes a movement with a higher id, so the two change
+    whenever the item's reports do. One query; the movement id is read from
+    stock_movement_position_idx.
+    """
+    latest = StockMovement.objects.filter(item=OuterRef('pk')).values('item').annotate(last=Max('id')).values('last')
+    return Item.objects.filter(code=code).annotate(last_movement=Subquery(latest)).first()
+
+class ConditionalGetMixin:
+    """
+    Conditional list and retrieve for viewsets of BaseModel rows. A page's
+    version is the ids and updated_at of its rows (the paginator's extra row
+    included, so the next link is covered); an object's is its updated_at.
+    With detail_model set, the latest updated_at of each row's details counts
+    too: posting a detail creates a row and deleting a header stamps them.
+    The check is one query, run before the page or object is loaded.
+    """
+    detail_model = None
+    VERSION_FIELDS = ('pk', 'updated_at', 'details_updated_at')
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.with_versions(self.filter_queryset(self.get_queryset()))
+        rows = self.paginator.page_values(queryset, request, self, *self.VERSION_FIELDS)
+        respond = super().list
+        return conditional_get(request, rows, None, lambda: respond(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        respond = super().retrieve
+        row = self.with_versions(self.get_queryset()).filter(**lookup).values_list(*self.VERSION_FIELDS).first()
+        if row is None:
+            return respond(request, *args, **kwargs) # 404
+        last_modified = max(filter(None, row[1:]))
+        return conditional_get(request, row, last_modified, lambda: respond(request, *args, **kwargs))
+
+    def with_versions(self, queryset):
+        """queryset annotated with details_updated_at, the latest updated_at of each row's details (deleted ones included)."""
+        if self.detail_model is None:
+            details_updated_at = Value(None, output_field=DateTimeField())
+        else:
+            details_updated_at = Subquery(self.detail_model.all_objects.filter(header=OuterRef('pk')).values(
+                'header'
+            ).annotate(last=Max('updated_at')).values('last'))
+        return queryset.prefetch_related(None).annotate(details_updated_at=details_updated_at)
@@ -0,0 +1,119 @@
+import gzip
+import logging
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from .models import ReportJob
+from .reports import StockReport
+
+logger = logging.getLogger(__name__)
+
+STALE_AFTER = timedelta(hours=1) # Running jobs older than this are assumed lost with their worker
+
+def job_dir():
+    return Path(settings.REPORT_JOB_DIR)
+
+def submit_job(item, start_date, end_date):
+    """
+    Queue a report job, or return the pending job for the same item and
+    range. Returns (job, created).
+    """
+    pending = ReportJob.objects.filter(
+        item=item, start_date=start_date, end_date=end_date,
+        status__in=[ReportJob.QUEUED, ReportJob.RUNNING]
+    )
+    job = pending.first()
+    if job is not None:
+        return job, False
+    try:
+        with transaction.atomic():
+            return ReportJob.objects.create(item=item, start_date=start_date, end_date=end_date), True
+    except IntegrityError: # An identical request queued its job first
+        return pending.get(), False
+
+def claim_jobs(limit):
+    """
+    Claim up to limit queued jobs, oldest first. A job is claimed with a
+    conditional UPDATE, so several workers can share the queue without
+    running a job twice.
+    """
+    claimed = []
+    for job in ReportJob.objects.filter(status=ReportJob.QUEUED).order_by('id')[:limit]:
+        now = timezone.now()
+        if ReportJob.objects.filter(pk=job.pk, status=ReportJob.QUEUED).update(status=ReportJob.RUNNING, started_at=now):
+            job.status, job.started_at = ReportJob.RUNNING, now
+            claimed.append(job)
+    return claimed
+
+def requeue_stale_jobs():
+    """Put jobs that have been running for longer than STALE_AFTER back in the queue."""
+    return ReportJob.objects.filter(
+        status=ReportJob.RUNNING, started_at__lt=timezone.now() - STALE_AFTER
+    ).update(status=ReportJob.QUEUED, started_at=None)
+
+def run_job(job):
+    """
+    Generate the report of a claimed job into a gzipped NDJSON file (the
+    format of the streaming report endpoint) and record the outcome. The
+    file is written under a temporary name and renamed when complete.
+    """
+    name = f'report-{job.pk}.ndjson.gz'
+    path = job_dir() / name
+    partial = path.with_suffix('.part')
+    try:
+        job_dir().mkdir(parents=True, exist_ok=True)
+        report = StockReport(job.item, job.start_date, job.end_date)
+        with gzip.open(partial, 'wt', encoding='utf-8', compresslevel=6) as output:
+            output.writelines(report.stream_ndjson())
+        os.replace(partial, path)
+    except Exception as exc:
+        logger.exception("Report job %s failed", job.pk)
+        partial.unlink(missing_ok=True)
+        ReportJob.objects.filter(pk=job.pk).update(status=ReportJob.FAILED, finished_at=timezone.now(), error=str(exc))
+        return False
+    ReportJob.objects.filter(pk=job.pk).update(
+        status=ReportJob.DONE, finished_at=timezone.now(), result_file=name, result_size=path.stat().st_size
+    )
+    return True
+
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+class ReportWorker:
+    """
+    Runs queued report jobs in a bounded thread pool. The queue is polled
+    every poll_interval seconds while there is a free thread.
+    """
+    def __init__(self, threads=2, poll_interval=1.0):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+
+    def run(self, once=False):
+        """Process jobs until stop() is called, or until the queue is empty with once=True."""
+        requeue_stale_jobs()
+        running = set()
+        with ThreadPoolExecutor(self.threads) as pool:
+            while not self.stopping.is_set():
+                running = {future for future in running if not future.done()}
+                free = self.threads - len(running)
+                jobs = claim_jobs(free) if free else []
+                for job in jobs:
+                    running.add(pool.submit(_run_in_thread, job))
+                if once and not jobs and not running:
+                    break
+                if running and not free:
+                    wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                elif not jobs:
+                    self.stopping.wait(self.poll_interval)
+
+    def stop(self):
+        self.stopping.set()
@@ -0,0 +1,223 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .cache import bump_item_versions
+from .models import Item, PurchaseHeader, SellAllocation, StockMovement
+from .reports import CHUNK_SIZE, merge_events, purchases, sell_allocations
+
+BATCH_SIZE = 1000 # Rows per INSERT when the ledger is written in bulk
+
+def purchase_movement(detail):
+    """An unsaved movement for a purchase detail."""
+    return StockMovement(
+        item_id=detail.item_id,
+        date=detail.date,
+        kind=StockMovement.PURCHASE,
+        purchase_detail=detail,
+        quantity=detail.quantity,
+        unit_price=detail.unit_price
+    )
+
+def sale_movement(sell_detail, lot, quantity, day):
+    """An unsaved movement for quantity units of a sell detail taken from a lot."""
+    return StockMovement(
+        item_id=sell_detail.item_id,
+        date=day,
+        kind=StockMovement.SALE,
+        purchase_detail=lot,
+        sell_detail=sell_detail,
+        quantity=quantity,
+        unit_price=lot.unit_price
+    )
+
+def last_movement(item_id, day):
+    """The item's last movement dated on or before day, or None."""
+    return StockMovement.objects.filter(item_id=item_id, date__lte=day).order_by('-date', '-sequence').only(
+        'date', 'sequence', 'kind', 'purchase_detail', 'sell_detail', 'balance_qty', 'balance'
+    ).first()
+
+def balance_at(item, day):
+    """The item's (stock quantity, stock value) at the end of day, from one index lookup."""
+    movement = last_movement(item.pk, day)
+    if movement is None:
+        return 0, Decimal('0.00')
+    return movement.balance_qty, movement.balance
+
+def ledger_key(movement):
+    """
+    The order of a movement within its item and date: purchases before sales,
+    purchases by purchase detail and sales by sell detail, as rebuild_ledger()
+    replays them. The movements of one sell detail keep their (FIFO) order.
+    """
+    if movement.kind == StockMovement.PURCHASE:
+        return movement.kind, movement.purchase_detail_id
+    return movement.kind, movement.sell_detail_id
+
+def record_movements(movements):
+    """
+    Add new movements (unsaved, in posting order) to the ledger, in
+    ledger_key() order on their date with the running balances at that
+    point, and shift the balances of the item's later movements (after a
+    back-dated posting) by their change. New movements usually come after the
+    existing ones of their date, which costs a lookup and an UPDATE per item
+    and date, and the INSERT. When one goes before them (a purchase dated on
+    a day with sales, or a header moved to another date), the day's movements
+    are renumbered, which costs a read and a bulk UPDATE more. The caller
+    holds the items' row locks, so the postings of an item are placed one at
+    a time.
+    """
+    groups = defaultdict(list)
+    for movement in movements:
+        groups[movement.item_id, movement.date].append(movement)
+
+    placed = {} # {item_id: (date, balance_qty, balance)} after the item's last group placed here
+    added = defaultdict(lambda: [0, 0]) # Change of the groups placed here per item
+    shifts = []
+    renumbered = [] # Existing movements placed after new ones on their date
+    for item_id, day in sorted(groups):
+        new = sorted(groups[item_id, day], key=ledger_key) # Stable, so FIFO order within a sell detail is kept
+        # Existing rows are read before any shift, so later ones still lack this batch's changes
+        last = last_movement(item_id, day)
+        if last is not None and last.date == day and ledger_key(new[0]) < ledger_key(last):
+            existing = list(StockMovement.objects.filter(item_id=item_id, date=day).order_by('sequence').only(
+                'kind', 'purchase_detail', 'sell_detail', 'quantity', 'unit_price', 'balance_qty', 'balance'
+            ))
+            quantity, value = existing[0].change()
+            balance_qty = existing[0].balance_qty - quantity + added[item_id][0]
+            balance = existing[0].balance - value + added[item_id][1]
+            rows, sequence = sorted(existing + new, key=ledger_key), 0
+            renumbered += existing
+        else:
+            if item_id in placed and (last is None or last.date <= placed[item_id][0]):
+                _, balance_qty, balance = placed[item_id]
+            elif last is not None:
+                balance_qty = last.balance_qty + added[item_id][0]
+                balance = last.balance + added[item_id][1]
+            else:
+                balance_qty, balance = 0, Decimal(0)
+            rows, sequence = new, last.sequence if last is not None and last.date == day else 0
+
+        for movement in rows:
+            quantity, value = movement.change()
+            sequence += 1
+            balance_qty += quantity
+            balance += value
+            movement.sequence, movement.balance_qty, movement.balance = sequence, balance_qty, balance
+        placed[item_id] = (day, balance_qty, balance)
+        changes = [movement.change() for movement in new]
+        quantity, value = sum(change[0] for change in changes), sum(change[1] for change in changes)
+        added[item_id][0] += quantity
+        added[item_id][1] += value
+        shifts.append((item_id, day, quantity, value))
+
+    for item_id, day, quantity, value in shifts:
+        StockMovement.objects.filter(item_id=item_id, date__gt=day).update(
+            balance_qty=F('balance_qty') + quantity,
+            balance=F('balance') + value
+        )
+    # After the shifts: these balances were computed with the changes of earlier dates included
+    StockMovement.objects.bulk_update(renumbered, ['sequence', 'balance_qty', 'balance'], batch_size=BATCH_SIZE)
+    StockMovement.objects.bulk_create(movements, batch_size=BATCH_SIZE)
+
+def remove_movements(movements):
+    """Delete movements (a queryset) and shift the balances of each item's later movements back."""
+    rows = list(movements.only('id', 'item_id', 'date', 'sequence', 'kind', 'quantity', 'unit_price'))
+    StockMovement.objects.filter(pk__in=[row.pk for row in rows]).delete()
+    for row in rows:
+        quantity, value = row.change()
+        StockMovement.objects.filter(
+            Q(date__gt=row.date) | Q(date=row.date, sequence__gt=row.sequence), item_id=row.item_id
+        ).update(
+            balance_qty=F('balance_qty') - quantity,
+            balance=F('balance') - value
+        )
+
+def stamp_items(item_ids):
+    """
+    Lock the items in id order and stamp their updated_at, as postings do,
+    so conditional GETs of their reports see that the reports changed.
+    """
+    list(Item.all_objects.select_for_update().filter(pk__in=item_ids).order_by('pk'))
+    Item.all_objects.filter(pk__in=item_ids).update(updated_at=timezone.now())
+
+def repost_header(header):
+    """
+    Replace the movements of a purchase or sell header's details after its
+    date or deleted flag changed: they are removed and, unless the header is
+    deleted, recorded again on its current date.
+    """
+    with transaction.atomic():
+        item_ids = set(header.details.values_list('item_id', flat=True))
+        stamp_items(item_ids)
+        if isinstance(header, PurchaseHeader):
+            remove_movements(StockMovement.objects.filter(kind=StockMovement.PURCHASE, purchase_detail__header=header))
+            if not header.is_deleted:
+                record_movements([purchase_movement(detail) for detail in header.details.order_by('id')])
+        else:
+            remove_movements(StockMovement.objects.filter(sell_detail__header=header))
+            if not header.is_deleted:
+                allocations = SellAllocation.objects.filter(sell_detail__header=header).select_related(
+                    'sell_detail', 'purchase_detail'
+                ).order_by('sell_detail_id', 'id')
+                record_movements([
+                    sale_movement(allocation.sell_detail, allocation.purchase_detail, allocation.quantity, header.date)
+                    for allocation in allocations
+                ])
+
+def remove_header_movements(header_model, header_ids):
+    """
+    Remove the movements of the details of many purchase or sell headers
+    being deleted, as repost_header() does for one, with their items locked.
+    Returns the ids of the items.
+    """
+    detail_model = header_model._meta.get_field('details').related_model
+    with transaction.atomic():
+        item_ids = set(detail_model.all_objects.filter(header_id__in=header_ids).values_list('item_id', flat=True))
+        stamp_items(item_ids)
+        if header_model is PurchaseHeader:
+            remove_movements(StockMovement.objects.filter(kind=StockMovement.PURCHASE, purchase_detail__header__in=header_ids))
+        else:
+            remove_movements(StockMovement.objects.filter(sell_detail__header__in=header_ids))
+    return item_ids
+
+def rebuild_ledger(item):
+    """
+    Rebuild an item's ledger from its purchases and sell allocations, replayed
+    in date order with purchases first on each date. Runs with the item row
+    locked. Returns the number of movements written.
+    """
+    with transaction.atomic():
+        list(Item.all_objects.select_for_update().filter(pk=item.pk))
+        StockMovement.objects.filter(item=item).delete()
+        events = merge_events(
+            purchases(item, None, date.max).iterator(chunk_size=CHUNK_SIZE),
+            sell_allocations(item, None, date.max).iterator(chunk_size=CHUNK_SIZE)
+        )
+        batch, count = [], 0
+        balance_qty, balance = 0, Decimal(0)
+        day, sequence = None, 0
+        for event_date, kind, obj in events:
+            sequence = sequence + 1 if event_date == day else 1
+            day = event_date
+            if kind == StockMovement.PURCHASE:
+                movement = StockMovement(purchase_detail_id=obj.pk, unit_price=obj.unit_price)
+            else:
+                movement = StockMovement(purchase_detail_id=obj.purchase_detail_id, sell_detail_id=obj.sell_detail_id,
+                                         unit_price=obj.purchase_detail.unit_price)
+            movement.item, movement.date, movement.sequence, movement.kind = item, day, sequence, kind
+            movement.quantity = obj.quantity
+            quantity, value = movement.change()
+            balance_qty += quantity
+            balance += value
+            movement.balance_qty, movement.balance = balance_qty, balance
+            batch.append(movement)
+            if len(batch) >= BATCH_SIZE:
+                StockMovement.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        StockMovement.objects.bulk_create(batch)
+        bump_item_versions([item.pk]) # Reports are read from the ledger
+    return count + len(batch)
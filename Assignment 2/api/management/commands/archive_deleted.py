@@ -0,0 +1,25 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.archive import BATCH_SIZE, archive_deleted
+
+class Command(BaseCommand):
+    help = "Move soft-deleted headers (with details and allocations) and items to the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.WAREHOUSE_ARCHIVE_AFTER_DAYS,
+                            help="Archive rows deleted more than this many days ago")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Headers or items moved per transaction")
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError("--days must be at least 0 and --batch-size at least 1.")
+
+        def progress(counts):
+            if options['verbosity'] > 1:
+                self.stderr.write(', '.join(f"{count} {name}" for name, count in counts.items()))
+
+        counts = archive_deleted(timezone.now() - timedelta(days=options['days']), options['batch_size'], progress)
+        moved = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items()) or "nothing"
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved}."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from api.ledger import rebuild_ledger
+from api.models import Item
+
+class Command(BaseCommand):
+    help = "Rebuild the stock ledger from purchases and sell allocations, e.g. after upgrading."
+
+    def add_arguments(self, parser):
+        parser.add_argument('item_codes', nargs='*', help="Items to rebuild (default: all items)")
+
+    def handle(self, *args, **options):
+        items = Item.objects.filter(is_deleted=False).order_by('code')
+        if options['item_codes']:
+            items = items.filter(code__in=options['item_codes'])
+
+        total = 0
+        for item in items.iterator():
+            written = rebuild_ledger(item)
+            total += written
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{item.code}: {written} movements")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {total} movements."))
@@ -0,0 +1,54 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api.benchmarks import SCENARIOS, BenchmarkSuite, compare
+
+class Command(BaseCommand):
+    help = "Benchmark the main endpoints against the current database and write the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+        parser.add_argument('--requests', type=int, default=200, help="Timed requests per scenario")
+        parser.add_argument('--warmup', type=int, default=10, help="Untimed requests before each scenario")
+        parser.add_argument('--report-days', type=int, default=365, help="Days covered by each report")
+        parser.add_argument('--skew', type=float, default=1.0, help="Item popularity skew, as in generate_data")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--compare', help="Results of an earlier run (JSON) to compare with")
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}. Choose from {', '.join(SCENARIOS)}.")
+        if options['requests'] < 1 or options['report_days'] < 1:
+            raise CommandError("--requests and --report-days must be at least 1.")
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Cannot read {options['compare']}: {error}")
+
+        suite = BenchmarkSuite(
+            requests=options['requests'], warmup=options['warmup'], scenarios=options['scenarios'] or SCENARIOS,
+            report_days=options['report_days'], skew=options['skew'], seed=options['seed']
+        )
+        try:
+            result = suite.run()
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        for name, stats in result['scenarios'].items():
+            self.stdout.write(
+                f"{name:<12}{stats['throughput_rps']:>9.1f} req/s  p50 {stats['p50_ms']:8.2f} ms  "
+                f"p95 {stats['p95_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms  "
+                f"{stats['queries_avg']:6.1f} queries  {stats['errors']} errors"
+            )
+        if baseline is not None:
+            self.stdout.write("")
+            for line in compare(result, baseline):
+                self.stdout.write(line)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {options['output']}."))
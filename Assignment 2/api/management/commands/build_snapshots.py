@@ -0,0 +1,34 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Item, StockSnapshot
+from api.reports import build_snapshots
+
+class Command(BaseCommand):
+    help = "Build month-end stock snapshots so reports do not replay each item's whole history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('item_codes', nargs='*', help="Items to build (default: all items)")
+        parser.add_argument('--until', help="Last date to snapshot, YYYY-MM-DD (default: end of last month)")
+        parser.add_argument('--rebuild', action='store_true', help="Delete existing snapshots first")
+
+    def handle(self, *args, **options):
+        until = None
+        if options['until']:
+            try:
+                until = datetime.strptime(options['until'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid date format. Use YYYY-MM-DD.")
+
+        items = Item.objects.filter(is_deleted=False).order_by('code')
+        if options['item_codes']:
+            items = items.filter(code__in=options['item_codes'])
+        if options['rebuild']:
+            StockSnapshot.objects.filter(item__in=items).delete()
+
+        total = 0
+        for item in items.iterator():
+            created = build_snapshots(item, until)
+            total += created
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{item.code}: {created} snapshots")
+        self.stdout.write(self.style.SUCCESS(f"Built {total} snapshots."))
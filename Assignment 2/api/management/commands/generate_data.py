@@ -0,0 +1,49 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from api.synthetic import SyntheticData
+
+class Command(BaseCommand):
+    help = "Generate synthetic items, purchases and sales (e.g. for benchmarks) with bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000)
+        parser.add_argument('--purchases', type=int, default=10_000, help="Purchase headers")
+        parser.add_argument('--sales', type=int, default=10_000, help="Sell headers (those finding no stock are skipped)")
+        parser.add_argument('--lines', type=int, default=5, help="Maximum details per header (1 to N, uniform)")
+        parser.add_argument('--years', type=int, default=3, help="Years of history ending at --end-date")
+        parser.add_argument('--end-date', help="Last document date, YYYY-MM-DD (default: today)")
+        parser.add_argument('--skew', type=float, default=1.0, help="Item popularity skew (0: uniform, 1: Zipf)")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same options give the same data")
+        parser.add_argument('--prefix', default='GEN', help="Prefix of the generated item and header codes")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Headers written per transaction")
+
+    def handle(self, *args, **options):
+        end_date = None
+        if options['end_date']:
+            try:
+                end_date = datetime.strptime(options['end_date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid date format. Use YYYY-MM-DD.")
+        if min(options['items'], options['lines'], options['years'], options['batch_size']) < 1:
+            raise CommandError("--items, --lines, --years and --batch-size must be at least 1.")
+
+        data = SyntheticData(
+            items=options['items'], purchases=options['purchases'], sales=options['sales'], lines=options['lines'],
+            end_date=end_date, years=options['years'], skew=options['skew'], seed=options['seed'],
+            prefix=options['prefix'], batch_size=options['batch_size']
+        )
+        if data.exists():
+            raise CommandError(f"Data with prefix {options['prefix']} already exists. Use another --prefix.")
+
+        def progress(posted, total):
+            if options['verbosity'] > 1:
+                self.stderr.write(f"{posted}/{total} headers ({time.perf_counter() - start:.1f}s)")
+
+        start = time.perf_counter()
+        counts = data.generate(progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['items']} items, {counts['purchases']} purchases ({counts['purchase_lines']} lines) and "
+            f"{counts['sales']} sales ({counts['sale_lines']} lines), {counts['movements']} ledger movements, "
+            f"in {time.perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,20 @@
+import signal
+from django.core.management.base import BaseCommand
+from api.jobs import ReportWorker
+
+class Command(BaseCommand):
+    help = "Run queued background report jobs in a pool of threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help="Jobs run at the same time")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds between queue polls when idle")
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+
+    def handle(self, *args, **options):
+        worker = ReportWorker(threads=max(options['threads'], 1), poll_interval=options['poll'])
+        # Finish the running jobs on Ctrl-C or SIGTERM, then exit
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: worker.stop())
+        self.stdout.write(f"Report worker running with {worker.threads} thread(s).")
+        worker.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS("Report worker stopped."))
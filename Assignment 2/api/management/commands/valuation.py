@@ -0,0 +1,33 @@
+from datetime import date, datetime
+from django.core.management.base import BaseCommand, CommandError
+from api.valuation import StockValuation
+
+class Command(BaseCommand):
+    help = "Write the FIFO stock valuation of all items (e.g. for month-end close) as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--end-date', help="Valuation date, YYYY-MM-DD (default: today)")
+        parser.add_argument('--start-date', help="Start of the period for opening stock and movements, YYYY-MM-DD")
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='csv')
+        parser.add_argument('--workers', type=int, default=1, help="Value item ranges in this many threads")
+        parser.add_argument('--output', help="File to write (default: stdout)")
+
+    def parse_date(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError("Invalid date format. Use YYYY-MM-DD.")
+
+    def handle(self, *args, **options):
+        end_date = self.parse_date(options['end_date']) if options['end_date'] else date.today()
+        start_date = self.parse_date(options['start_date']) if options['start_date'] else None
+        valuation = StockValuation(end_date, start_date, workers=max(options['workers'], 1))
+        chunks = getattr(valuation, f"stream_{options['format']}")()
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(chunks)
+            self.stderr.write(self.style.SUCCESS(f"Wrote valuation to {options['output']}."))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.3 on 2026-10-17 09:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_header_dates(apps, schema_editor):
+    """Fill the denormalized date of existing details from their headers."""
+    PurchaseHeader = apps.get_model('api', 'PurchaseHeader')
+    PurchaseDetail = apps.get_model('api', 'PurchaseDetail')
+    PurchaseDetail.objects.update(
+        date=Subquery(PurchaseHeader.objects.filter(pk=OuterRef('header_id')).values('date')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchasedetail',
+            name='date',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(copy_header_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='purchasedetail',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name='purchasedetail',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('remaining_quantity__gt', 0)), fields=['item', 'date', 'id'], name='purchase_open_lot_idx'),
+        ),
+    ]
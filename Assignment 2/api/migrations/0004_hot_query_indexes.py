@@ -0,0 +1,54 @@
+# Generated by Django 5.1.3 on 2026-10-17 17:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def analyze(apps, schema_editor):
+    """
+    Refresh planner statistics, so the planner sees that the partial indexes
+    are far smaller than the full ones (SQLite has none until ANALYZE runs).
+    """
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('ANALYZE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='purchasedetail',
+            name='item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='purchase_details', to='api.item'),
+        ),
+        migrations.AlterField(
+            model_name='selldetail',
+            name='item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sell_details', to='api.item'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['code'], name='item_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchasedetail',
+            index=models.Index(fields=['item', 'date'], name='purchase_item_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseheader',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['date', 'id'], name='purchase_header_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='selldetail',
+            index=models.Index(fields=['item', 'header'], name='sell_item_header_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sellheader',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['date', 'id'], name='sell_header_live_idx'),
+        ),
+        migrations.RunPython(analyze, migrations.RunPython.noop),
+    ]
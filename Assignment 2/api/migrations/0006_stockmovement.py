@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('sequence', models.PositiveIntegerField()),
+                ('kind', models.PositiveSmallIntegerField(choices=[(0, 'Purchase'), (1, 'Sale')])),
+                ('quantity', models.IntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('balance_qty', models.IntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('item', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='api.item')),
+                ('purchase_detail', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='api.purchasedetail')),
+                ('sell_detail', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='api.selldetail')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'date', 'sequence'], name='stock_movement_position_idx')],
+            },
+        ),
+    ]
@@ -1,13 +1,34 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from .cache import bump_item_versions
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def soft_delete(self):
+        """
+        Mark the live rows deleted with one UPDATE, without loading them or
+        calling delete() per row. updated_at records the deletion time, which
+        the archive_deleted command uses. Returns the number of rows deleted.
+        """
+        return self.filter(is_deleted=False).update(is_deleted=True, updated_at=timezone.now())
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """Default manager of BaseModel models: live rows only. Use all_objects to include deleted rows."""
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
 
 class BaseModel(models.Model):
     """
     Abstract base model for common fields and soft delete functionality.
+    `objects` (the default manager, also used for related lookups such as
+    header.details) only returns live rows; `all_objects` returns all rows.
     """
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
     class Meta:
         abstract = True
     
@@ -16,6 +37,39 @@ class BaseModel(models.Model):
         self.is_deleted = True
         self.save()
 
+class ItemQuerySet(SoftDeleteQuerySet):
+    def soft_delete(self):
+        """Soft delete the items and invalidate their cached rows and reports."""
+        with transaction.atomic():
+            item_ids = list(self.filter(is_deleted=False).values_list('pk', flat=True))
+            count = Item.all_objects.filter(pk__in=item_ids).update(is_deleted=True, updated_at=timezone.now())
+            bump_item_versions(item_ids)
+        return count
+
+class HeaderQuerySet(SoftDeleteQuerySet):
+    def soft_delete(self):
+        """
+        Soft delete purchase or sell headers with their details, like
+        delete() on each: their movements leave the stock ledger, and the
+        snapshots and cached data of their items are invalidated. Headers and
+        details are updated with one UPDATE each.
+        """
+        from .ledger import remove_header_movements
+
+        with transaction.atomic():
+            headers = list(self.filter(is_deleted=False).values_list('pk', 'date'))
+            if not headers:
+                return 0
+            header_ids = [pk for pk, _ in headers]
+            item_ids = remove_header_movements(self.model, header_ids)
+            now = timezone.now()
+            self.model.all_objects.filter(pk__in=header_ids).update(is_deleted=True, updated_at=now)
+            detail_model = self.model._meta.get_field('details').related_model
+            detail_model.all_objects.filter(header_id__in=header_ids, is_deleted=False).update(is_deleted=True, updated_at=now)
+            StockSnapshot.invalidate(item_ids, min(day for _, day in headers))
+            bump_item_versions(item_ids)
+        return len(headers)
+
 class Item(BaseModel):
     code = models.CharField(max_length=50, unique=True)
     name = models.CharField(max_length=100)
@@ -24,38 +78,96 @@ class Item(BaseModel):
     stock = models.IntegerField(default=0) # Current stock quantity
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0) # Current balance value
 
+    objects = SoftDeleteManager.from_queryset(ItemQuerySet)()
+    all_objects = ItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Live items in code order, for listing
+            models.Index(fields=['code'], name='item_live_idx', condition=models.Q(is_deleted=False)),
+        ]
+
     def __str__(self):
         return self.code
 
+    def save(self, *args, **kwargs):
+        """Save the item and invalidate its cached row and reports."""
+        super().save(*args, **kwargs)
+        bump_item_versions([self.pk])
+
 class PurchaseHeader(BaseModel):
     code = models.CharField(max_length=50, unique=True)
     date = models.DateField()
     description = models.TextField()
 
+    objects = SoftDeleteManager.from_queryset(HeaderQuerySet)()
+    all_objects = HeaderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Live headers in date order, for listing
+            models.Index(fields=['date', 'id'], name='purchase_header_live_idx', condition=models.Q(is_deleted=False)),
+        ]
+
     def __str__(self):
         return self.code
     
+    def save(self, *args, **kwargs):
+        """Save the header and keep the denormalized date of its details in sync."""
+        previous = previous_header_state(self)
+        super().save(*args, **kwargs)
+        self.details.exclude(date=self.date).update(date=self.date)
+        invalidate_header_snapshots(self, previous)
+
     def delete(self, *args, **kwargs):
         """Soft delete the header and its details."""
         self.is_deleted = True
         self.save()
-        self.details.update(is_deleted=True)
+        self.details.soft_delete()
 
 class PurchaseDetail(BaseModel):
     header = models.ForeignKey(PurchaseHeader, on_delete=models.CASCADE, related_name='details')
-    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='purchase_details')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='purchase_details', db_index=False) # Covered by purchase_item_date_idx
     quantity = models.IntegerField()
     unit_price = models.DecimalField(max_digits=15, decimal_places=2)
     remaining_quantity = models.IntegerField(default=0) # Tracks unsold quantity for FIFO
+    date = models.DateField() # Denormalized header date, used to order lots for FIFO
+
+    class Meta:
+        indexes = [
+            # Open lots of an item in FIFO order, see services.open_lots()
+            models.Index(
+                fields=['item', 'date', 'id'],
+                name='purchase_open_lot_idx',
+                condition=models.Q(remaining_quantity__gt=0, is_deleted=False),
+            ),
+            # All purchases of an item in date order, see reports.purchases()
+            models.Index(fields=['item', 'date'], name='purchase_item_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.header.code} - {self.item.code} - {self.quantity}"
 
+    def save(self, *args, **kwargs):
+        """Copy the header date onto new details."""
+        if self.date is None:
+            self.date = self.header.date
+        super().save(*args, **kwargs)
+
 class SellHeader(BaseModel):
     code = models.CharField(max_length=50, unique=True)
     date = models.DateField()
     description = models.TextField()
 
+    objects = SoftDeleteManager.from_queryset(HeaderQuerySet)()
+    all_objects = HeaderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Live headers in date order, for listing
+            models.Index(fields=['date', 'id'], name='sell_header_live_idx', condition=models.Q(is_deleted=False)),
+        ]
+
     def __str__(self):
         return self.code
     
@@ -63,13 +175,24 @@ class SellHeader(BaseModel):
         """Soft delete the header and its details."""
         self.is_deleted = True
         self.save()
-        self.details.update(is_deleted=True)
+        self.details.soft_delete()
+
+    def save(self, *args, **kwargs):
+        previous = previous_header_state(self)
+        super().save(*args, **kwargs)
+        invalidate_header_snapshots(self, previous)
 
 class SellDetail(BaseModel):
     header = models.ForeignKey(SellHeader, on_delete=models.CASCADE, related_name='details')
-    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='sell_details')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='sell_details', db_index=False) # Covered by sell_item_header_idx
     quantity = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            # Sales of an item with their headers, see reports.sell_allocations()
+            models.Index(fields=['item', 'header'], name='sell_item_header_idx'),
+        ]
+
     def __str__(self):
         return f"{self.header.code} - {self.item.code} - {self.quantity}"
 
@@ -83,3 +206,185 @@ class SellAllocation(BaseModel):
 
     class Meta:
         unique_together = ('sell_detail', 'purchase_detail')
+
+class StockSnapshot(models.Model):
+    """
+    Open FIFO lots and balances of an item after all transactions dated on or
+    before `date` (a month end), so reports can start here instead of
+    replaying the item's whole history. Snapshots are a cache: they are deleted
+    when a transaction dated on or before them is posted, moved or deleted,
+    and rebuilt by the build_snapshots command.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='snapshots')
+    date = models.DateField()
+    lots = models.JSONField(default=list) # [[purchase_detail_id, quantity, unit_price], ...] in FIFO order
+    balance_qty = models.IntegerField()
+    balance = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('item', 'date')
+
+    def __str__(self):
+        return f"{self.item.code} - {self.date}"
+
+    @classmethod
+    def invalidate(cls, items, since):
+        """Delete the snapshots of items (ids or a queryset) dated on or after since."""
+        cls.objects.filter(item__in=items, date__gte=since).delete()
+
+class StockMovement(models.Model):
+    """
+    Stock ledger: one row per purchase detail and per sell allocation of an
+    item, in (date, sequence) order, with the item's running quantity and
+    value after the movement. On each date, purchases come before sales,
+    each in detail id order (ledger.ledger_key()), whether the rows were
+    posted one by one or rebuilt. A balance on any date is the last row on or
+    before it, and a report over a range is one index range scan. Rows are
+    written by the posting functions in services.py and moved when a header
+    changes date or is deleted (see ledger.py).
+    """
+    PURCHASE, SALE = 0, 1 # Purchases sort before sales on the same date, see ledger.ledger_key()
+    KINDS = [(PURCHASE, 'Purchase'), (SALE, 'Sale')]
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='movements', db_index=False) # Covered by stock_movement_position_idx
+    date = models.DateField()
+    sequence = models.PositiveIntegerField() # Posting order within the item and date
+    kind = models.PositiveSmallIntegerField(choices=KINDS)
+    purchase_detail = models.ForeignKey(PurchaseDetail, on_delete=models.CASCADE, related_name='movements') # The lot bought, or the lot a sale depleted
+    sell_detail = models.ForeignKey(SellDetail, on_delete=models.CASCADE, related_name='movements', null=True)
+    quantity = models.IntegerField()
+    unit_price = models.DecimalField(max_digits=15, decimal_places=2)
+    balance_qty = models.IntegerField() # Running stock quantity after this movement
+    balance = models.DecimalField(max_digits=15, decimal_places=2) # Running stock value after this movement
+
+    class Meta:
+        indexes = [
+            # Ledger order, see ledger.balance_at() and reports.movements()
+            models.Index(fields=['item', 'date', 'sequence'], name='stock_movement_position_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item.code} - {self.date} #{self.sequence}"
+
+    def change(self):
+        """The (quantity, value) this movement adds to the item's balances."""
+        value = self.quantity * self.unit_price
+        return (self.quantity, value) if self.kind == self.PURCHASE else (-self.quantity, -value)
+
+def previous_header_state(header):
+    """The stored date, deleted flag, code and description of a header, or None for a new header."""
+    if header.pk is None:
+        return None
+    return type(header).all_objects.filter(pk=header.pk).values('date', 'is_deleted', 'code', 'description').first()
+
+def invalidate_header_snapshots(header, previous):
+    """
+    Move the ledger rows of the header's details and invalidate the snapshots
+    and cached reports of its items when its date or deleted flag changed.
+    When only its code or description changed, quantities are unaffected and
+    only the cached reports (which show them) are invalidated, and the items
+    stamped so conditional GETs of the reports see the change.
+    """
+    from .ledger import repost_header, stamp_items
+
+    if previous is None:
+        return
+    if (previous['date'], previous['is_deleted']) != (header.date, header.is_deleted):
+        repost_header(header)
+        item_ids = set(header.details.values_list('item', flat=True))
+        StockSnapshot.invalidate(item_ids, min(previous['date'], header.date))
+        bump_item_versions(item_ids)
+    elif (previous['code'], previous['description']) != (header.code, header.description):
+        item_ids = set(header.details.values_list('item', flat=True))
+        stamp_items(item_ids)
+        bump_item_versions(item_ids)
+
+class ReportJob(models.Model):
+    """
+    A stock report generated in the background by the report_worker command.
+    Jobs form a queue in this table: the worker claims queued jobs, writes
+    the report to a gzipped NDJSON file and records the outcome. At most one
+    job per (item, start_date, end_date) is pending at a time, so identical
+    requests share a job.
+    """
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='report_jobs')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    result_file = models.CharField(max_length=255, blank=True) # Relative to settings.REPORT_JOB_DIR
+    result_size = models.BigIntegerField(null=True) # Compressed bytes
+    error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['item', 'start_date', 'end_date'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='report_job_pending_unique',
+            ),
+        ]
+        indexes = [
+            # The queue, oldest first
+            models.Index(fields=['id'], name='report_job_queue_idx', condition=models.Q(status='queued')),
+        ]
+
+    def __str__(self):
+        return f"{self.item.code} {self.start_date} - {self.end_date} ({self.status})"
+
+class ArchivedModel(models.Model):
+    """
+    Abstract base of the archive tables, which hold soft-deleted rows moved
+    out of the hot tables by the archive_deleted command. Rows keep their id
+    and timestamps (updated_at is when they were deleted). References are
+    plain ids, since the rows they point to may be archived as well.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+
+class ArchivedItem(ArchivedModel):
+    code = models.CharField(max_length=50, db_index=True)
+    name = models.CharField(max_length=100)
+    unit = models.CharField(max_length=20)
+    description = models.TextField()
+    stock = models.IntegerField()
+    balance = models.DecimalField(max_digits=15, decimal_places=2)
+
+class ArchivedPurchaseHeader(ArchivedModel):
+    code = models.CharField(max_length=50, db_index=True)
+    date = models.DateField()
+    description = models.TextField()
+
+class ArchivedPurchaseDetail(ArchivedModel):
+    header_id = models.BigIntegerField(db_index=True)
+    item_id = models.BigIntegerField()
+    quantity = models.IntegerField()
+    unit_price = models.DecimalField(max_digits=15, decimal_places=2)
+    remaining_quantity = models.IntegerField()
+    date = models.DateField()
+
+class ArchivedSellHeader(ArchivedModel):
+    code = models.CharField(max_length=50, db_index=True)
+    date = models.DateField()
+    description = models.TextField()
+
+class ArchivedSellDetail(ArchivedModel):
+    header_id = models.BigIntegerField(db_index=True)
+    item_id = models.BigIntegerField()
+    quantity = models.IntegerField()
+
+class ArchivedSellAllocation(ArchivedModel):
+    sell_detail_id = models.BigIntegerField(db_index=True)
+    purchase_detail_id = models.BigIntegerField()
+    quantity = models.IntegerField()
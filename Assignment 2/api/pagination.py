@@ -0,0 +1,124 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+def query_params(request):
+    """Query parameters of a DRF request or a plain Django request."""
+    return getattr(request, 'query_params', request.GET)
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on the view's `ordering` fields (ascending, the last
+    one unique). The cursor holds the ordering values of the last row of a
+    page, and the next page is read with a range condition on an index that
+    starts with those fields, so page N costs the same as page 1.
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, page_size = self._page_queryset(queryset, request, view)
+        rows = list(queryset[:page_size + 1]) # One extra row tells whether there is a next page
+        return self._page(rows, page_size)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() with the async ORM, for async views."""
+        queryset, page_size = self._page_queryset(queryset, request, view)
+        rows = [row async for row in queryset[:page_size + 1]]
+        return self._page(rows, page_size)
+
+    def page_values(self, queryset, request, view, *fields):
+        """
+        values_list(*fields) of the rows paginate_queryset() would read for
+        the request, the extra row included, without loading the objects.
+        """
+        queryset, page_size = self._page_queryset(queryset, request, view)
+        return list(queryset.values_list(*fields)[:page_size + 1])
+
+    def _page_queryset(self, queryset, request, view):
+        """The ordered queryset starting after the cursor, and the page size."""
+        self.request = request
+        self.ordering = getattr(view, 'ordering', self.ordering)
+        self.fields = [queryset.model._meta.get_field(name) for name in self.ordering]
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        return queryset, self.get_page_size(request)
+
+    def _page(self, rows, page_size):
+        self.next_position = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_position = [field.value_from_object(rows[-1]) for field in self.fields]
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(query_params(request).get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def after(self, position):
+        """
+        Rows after position in the ordering:
+        `a >= x AND (a > x OR (a = x AND (b > y OR ...)))`. The outer `a >= x`
+        lets the database bound an index range scan on the leading field.
+        """
+        pairs = [(field.name, value) for field, value in zip(self.fields, position)]
+        name, value = pairs[-1]
+        condition = Q(**{f'{name}__gt': value})
+        for name, value in reversed(pairs[:-1]):
+            condition = Q(**{f'{name}__gt': value}) | (Q(**{name: value}) & condition)
+        name, value = pairs[0]
+        return Q(**{f'{name}__gte': value}) & condition
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        """The position from the cursor parameter, or None on the first page."""
+        encoded = query_params(request).get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            if not isinstance(position, list) or len(position) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(self.fields, position)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,269 @@
+import contextvars
+import functools
+import json
+import logging
+import random
+import threading
+from bisect import bisect_left
+from collections import Counter
+from time import perf_counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SAMPLE_RATE': 0.0, # Fraction of requests profiled in detail (queries, serializers)
+    'ALLOW_HEADER': False, # Also profile requests sent with `X-Profile: 1`
+    'SLOW_REQUEST_MS': 1000, # Requests slower than this are logged
+    'DUPLICATE_QUERIES': 5, # The same SQL this many times in a request is reported as N+1
+}
+
+# Latency histogram buckets: upper bounds in seconds, 10% apart from 0.1 ms to about 2 minutes
+BUCKETS = [0.0001 * 1.1 ** n for n in range(148)]
+
+_profile = contextvars.ContextVar('request_profile', default=None)
+
+def profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'WAREHOUSE_PROFILING', {})}
+
+class RequestProfile:
+    """Queries, database time and serializer time of one profiled request."""
+    def __init__(self):
+        self.queries = Counter() # SQL (with placeholders) -> executions
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.in_serializer = False
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    def duplicates(self, threshold):
+        """[(sql, count), ...] of the statements run at least threshold times, most frequent first."""
+        return [(sql, count) for sql, count in self.queries.most_common() if count >= threshold]
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of values (at most 10% high)."""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+        return self.max
+
+class RequestMetrics:
+    """
+    Thread-safe latency histograms per URL name, plus query, database and
+    serializer totals of the profiled requests.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.urls = {}
+
+    def record(self, url_name, seconds, status, profile=None, duplicates=False):
+        with self._lock:
+            stats = self.urls.get(url_name)
+            if stats is None:
+                stats = self.urls[url_name] = {
+                    'latency': _Histogram(), 'errors': 0,
+                    'profiled': 0, 'queries': 0, 'db_time': 0.0, 'serializer_time': 0.0, 'n_plus_one': 0,
+                }
+            stats['latency'].add(seconds)
+            if status >= 500:
+                stats['errors'] += 1
+            if profile is not None:
+                stats['profiled'] += 1
+                stats['queries'] += profile.query_count
+                stats['db_time'] += profile.db_time
+                stats['serializer_time'] += profile.serializer_time
+                stats['n_plus_one'] += duplicates
+
+    def snapshot(self):
+        """Return {url_name: {'count', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', ...}}."""
+        with self._lock:
+            result = {}
+            for url_name in sorted(self.urls):
+                stats = self.urls[url_name]
+                latency, profiled = stats['latency'], stats['profiled']
+                result[url_name] = {
+                    'count': latency.count,
+                    'errors': stats['errors'],
+                    'mean_ms': 1000 * latency.total / latency.count,
+                    'p50_ms': 1000 * latency.percentile(0.50),
+                    'p95_ms': 1000 * latency.percentile(0.95),
+                    'p99_ms': 1000 * latency.percentile(0.99),
+                    'max_ms': 1000 * latency.max,
+                    'profiled': profiled,
+                    'queries_avg': stats['queries'] / profiled if profiled else None,
+                    'db_ms_avg': 1000 * stats['db_time'] / profiled if profiled else None,
+                    'serializer_ms_avg': 1000 * stats['serializer_time'] / profiled if profiled else None,
+                    'n_plus_one': stats['n_plus_one'],
+                }
+            return result
+
+request_metrics = RequestMetrics()
+
+def _record_query(execute, sql, params, many, context):
+    """Database execute wrapper: time the query if the current request is profiled."""
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.db_time += perf_counter() - start
+        profile.queries[sql] += 1
+
+def _add_query_hook(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+def _timed(method):
+    """Time a serializer entry point; nested calls count once, in the outermost one."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        profile = _profile.get()
+        if profile is None or profile.in_serializer:
+            return method(*args, **kwargs)
+        profile.in_serializer = True
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            profile.serializer_time += perf_counter() - start
+            profile.in_serializer = False
+    wrapper.profiled = True
+    return wrapper
+
+def install_hooks():
+    """
+    Install the profiling hooks: a wrapper on every new database connection
+    and timers on DRF's serializer entry points (validation and .data).
+    They only do work while a request is being profiled. Called from
+    ApiConfig.ready() when profiling can be enabled.
+    """
+    from rest_framework import serializers
+
+    connection_created.connect(_add_query_hook, dispatch_uid='api.profiling')
+    for connection in connections.all(initialized_only=True): # Already open in this thread
+        _add_query_hook(None, connection)
+    for cls, name in ((serializers.BaseSerializer, 'is_valid'), (serializers.ListSerializer, 'is_valid')):
+        method = cls.__dict__[name]
+        if not getattr(method, 'profiled', False):
+            setattr(cls, name, _timed(method))
+    data = serializers.BaseSerializer.__dict__['data']
+    if not getattr(data.fget, 'profiled', False):
+        serializers.BaseSerializer.data = property(_timed(data.fget))
+
+class ProfilingMiddleware:
+    """
+    Record the latency of every request in request_metrics, by URL name, and
+    add a Server-Timing header. A sample of requests (SAMPLE_RATE, or
+    `X-Profile: 1` when ALLOW_HEADER is set) is profiled in detail: query
+    count, database time, repeated queries (N+1) and serializer time. Slow
+    requests, and profiled requests with N+1 queries, are logged as JSON.
+    Streaming bodies are produced after the middleware returns and are not
+    included. Put it first in MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        options = profiling_settings()
+        self.sample_rate = options['SAMPLE_RATE']
+        self.allow_header = options['ALLOW_HEADER']
+        self.slow = options['SLOW_REQUEST_MS'] / 1000
+        self.duplicate_threshold = options['DUPLICATE_QUERIES']
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start, profile, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                _profile.reset(token)
+        return self.finish(request, response, start, profile)
+
+    async def __acall__(self, request):
+        start, profile, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                _profile.reset(token)
+        return self.finish(request, response, start, profile)
+
+    def sampled(self, request):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        return self.allow_header and request.headers.get('X-Profile') == '1'
+
+    def start(self, request):
+        if not self.sampled(request):
+            return perf_counter(), None, None
+        profile = RequestProfile()
+        return perf_counter(), profile, _profile.set(profile)
+
+    def finish(self, request, response, start, profile):
+        elapsed = perf_counter() - start
+        match = request.resolver_match
+        url_name = match.view_name if match is not None else '<unresolved>'
+        duplicates = profile.duplicates(self.duplicate_threshold) if profile is not None else []
+        request_metrics.record(url_name, elapsed, response.status_code, profile, bool(duplicates))
+
+        timings = []
+        if profile is not None:
+            timings.append(f'db;dur={1000 * profile.db_time:.2f};desc="{profile.query_count} queries"')
+            timings.append(f'serializer;dur={1000 * profile.serializer_time:.2f}')
+        timings.append(f'total;dur={1000 * elapsed:.2f}')
+        response['Server-Timing'] = ', '.join(timings)
+
+        if elapsed >= self.slow or duplicates:
+            self.log(request, response, url_name, elapsed, profile, duplicates)
+        return response
+
+    def log(self, request, response, url_name, elapsed, profile, duplicates):
+        record = {
+            'event': 'slow_request' if elapsed >= self.slow else 'n_plus_one',
+            'method': request.method,
+            'path': request.path,
+            'url_name': url_name,
+            'status': response.status_code,
+            'duration_ms': round(1000 * elapsed, 2),
+        }
+        if profile is not None:
+            record.update({
+                'queries': profile.query_count,
+                'db_ms': round(1000 * profile.db_time, 2),
+                'serializer_ms': round(1000 * profile.serializer_time, 2),
+                'duplicate_queries': [{'sql': sql, 'count': count} for sql, count in duplicates],
+            })
+        logger.warning(json.dumps(record), extra={'request_profile': record})
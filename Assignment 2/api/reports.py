@@ -0,0 +1,346 @@
+import calendar
+import csv
+import json
+from collections import deque
+from datetime import date, timedelta
+from decimal import Decimal
+from heapq import merge
+from django.db import transaction
+from django.db.models.functions import Coalesce
+from .models import Item, PurchaseDetail, SellAllocation, StockMovement, StockSnapshot
+
+PURCHASE, SELL = StockMovement.PURCHASE, StockMovement.SALE # Event kinds; purchases come before sales on the same date
+CHUNK_SIZE = 2000 # Rows fetched per round trip (server-side cursors where supported)
+
+CSV_COLUMNS = [
+    'date', 'description', 'code',
+    'in_qty', 'in_price', 'in_total',
+    'out_qty', 'out_price', 'out_total',
+    'stock_qty', 'stock_price', 'stock_total',
+    'balance_qty', 'balance'
+]
+
+class _Echo:
+    """File-like object that returns what is written, so csv.writer can format single rows."""
+    def write(self, value):
+        return value
+
+def purchases(item, after, until):
+    """
+    Purchases of an item dated after `after` (None for no lower bound) up to
+    `until`, in FIFO order. With sell_allocations(), the source the ledger is
+    rebuilt from.
+    """
+    queryset = PurchaseDetail.objects.filter(item=item, date__lte=until, header__is_deleted=False)
+    if after is not None:
+        queryset = queryset.filter(date__gt=after)
+    return queryset.select_related('header').only(
+        'id', 'date', 'quantity', 'unit_price', 'header__code', 'header__description'
+    ).order_by('date', 'id')
+
+def sell_allocations(item, after, until):
+    """Sell allocations of an item dated after `after` up to `until`, ordered by sale date."""
+    queryset = SellAllocation.objects.filter(
+        sell_detail__item=item,
+        sell_detail__header__date__lte=until,
+        sell_detail__header__is_deleted=False
+    )
+    if after is not None:
+        queryset = queryset.filter(sell_detail__header__date__gt=after)
+    return queryset.select_related('sell_detail__header', 'purchase_detail').only(
+        'id', 'quantity', 'purchase_detail_id', 'purchase_detail__unit_price',
+        'sell_detail__header__date', 'sell_detail__header__code', 'sell_detail__header__description'
+    ).order_by('sell_detail__header__date', 'sell_detail_id', 'id')
+
+def merge_events(purchase_details, allocations):
+    """
+    Merge purchases and sell allocations, each already in date order, into
+    one stream of (date, kind, obj) ordered by date.
+    """
+    purchase_events = ((pd.date, PURCHASE, pd) for pd in purchase_details)
+    sell_events = ((a.sell_detail.header.date, SELL, a) for a in allocations)
+    return merge(purchase_events, sell_events, key=lambda event: event[:2])
+
+def movements(item, after, until):
+    """
+    Ledger movements of an item dated after `after` (None for no lower bound)
+    up to `until`, with their headers, in ledger order: one range scan of the
+    stock_movement_position_idx index.
+    """
+    queryset = StockMovement.objects.filter(item=item, date__lte=until)
+    if after is not None:
+        queryset = queryset.filter(date__gt=after)
+    return queryset.annotate(
+        code=Coalesce('sell_detail__header__code', 'purchase_detail__header__code'),
+        description=Coalesce('sell_detail__header__description', 'purchase_detail__header__description')
+    ).order_by('date', 'sequence').values_list(
+        'date', 'kind', 'quantity', 'unit_price', 'purchase_detail_id', 'code', 'description', named=True
+    )
+
+def events(item, after, until):
+    """The item's movements as a stream, read in chunks so it uses constant memory."""
+    return movements(item, after, until).iterator(chunk_size=CHUNK_SIZE)
+
+def nearest_snapshots(item, before):
+    return StockSnapshot.objects.filter(item=item, date__lt=before).order_by('-date')
+
+def nearest_snapshot(item, before):
+    """The latest snapshot of an item dated before `before`, or None."""
+    return nearest_snapshots(item, before).first()
+
+class StockState:
+    """
+    Open FIFO lots and running balances of an item while its transactions are
+    replayed. Lots are [lot_id, qty, price, total] lists kept in a deque in
+    FIFO order, so each event costs amortized O(1).
+    """
+    def __init__(self, lots=(), balance_qty=0, balance=0.0):
+        self.lots = deque()
+        self.by_id = {}
+        for lot_id, qty, price in lots:
+            self._add(lot_id, qty, price)
+        self.balance_qty = balance_qty
+        self.balance = balance
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        if snapshot is None:
+            return cls()
+        return cls(snapshot.lots, snapshot.balance_qty, float(snapshot.balance))
+
+    def _add(self, lot_id, qty, price):
+        lot = [lot_id, qty, price, float(qty * price)]
+        self.lots.append(lot)
+        self.by_id[lot_id] = lot
+
+    def apply(self, movement):
+        """Apply a ledger movement. Returns (qty, price, total)."""
+        qty = movement.quantity
+        price = float(movement.unit_price)
+        total = float(qty * price)
+        if movement.kind == PURCHASE:
+            self._add(movement.purchase_detail_id, qty, price)
+            self.balance_qty += qty
+            self.balance += total
+        else:
+            self._deplete(movement.purchase_detail_id, qty, price)
+            self.balance_qty -= qty
+            self.balance -= total
+        return qty, price, total
+
+    def _deplete(self, lot_id, qty, price):
+        """Take qty from the allocated lot, then drop depleted lots from the front."""
+        lot = self.by_id.get(lot_id)
+        candidates = [lot] if lot is not None and lot[1] > 0 else (
+            # The allocated lot is not open here: fall back to the first open
+            # lot with the same price
+            [lot for lot in self.lots if lot[2] == price and lot[1] > 0]
+        )
+        for lot in candidates:
+            take = min(lot[1], qty)
+            lot[1] -= take
+            lot[3] = float(lot[1] * lot[2])
+            qty -= take
+            if qty <= 0:
+                break
+        while self.lots and self.lots[0][1] <= 0:
+            del self.by_id[self.lots.popleft()[0]]
+
+    def open_lots(self):
+        return [lot for lot in self.lots if lot[1] > 0]
+
+    def snapshot(self, item, day):
+        """An unsaved StockSnapshot of this state."""
+        return StockSnapshot(
+            item=item,
+            date=day,
+            lots=[[lot_id, qty, price] for lot_id, qty, price, _ in self.open_lots()],
+            balance_qty=self.balance_qty,
+            balance=Decimal(f'{self.balance:.2f}')
+        )
+
+def month_end(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+def build_snapshots(item, until=None):
+    """
+    Create month-end snapshots of an item up to `until` (default: the end of
+    last month), continuing from its latest snapshot. Months without
+    transactions get no snapshot, since the previous one is just as close.
+    Returns the number of snapshots created.
+
+    Runs with the item row locked, so a back-dated posting waits for the build
+    to commit and then invalidates what it made stale.
+    """
+    until = until or date.today().replace(day=1) - timedelta(days=1)
+    with transaction.atomic():
+        list(Item.all_objects.select_for_update().filter(pk=item.pk))
+        latest = StockSnapshot.objects.filter(item=item, date__lte=until).order_by('-date').first()
+        state = StockState.from_snapshot(latest)
+        snapshots = []
+        pending = None # Month end of the events applied since the last snapshot
+        for movement in events(item, latest.date if latest else None, until):
+            if pending is not None and movement.date > pending:
+                snapshots.append(state.snapshot(item, pending))
+                pending = None
+            state.apply(movement)
+            pending = month_end(movement.date)
+        if pending is not None and pending <= until:
+            snapshots.append(state.snapshot(item, pending))
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=500)
+    return len(snapshots)
+
+class StockReport:
+    """
+    FIFO stock report for one item over a date range.
+
+    The stock state at the start of the range is rebuilt from the nearest
+    snapshot before it (or from the beginning of the item's history) by
+    replaying the transactions in between. Transactions are read from the
+    stock ledger with their headers in one range scan, already in order.
+    """
+    DATE_FORMAT = '%d-%m-%Y'
+    STREAM_BATCH = 200 # Rows joined into each chunk of a streamed response
+
+    def __init__(self, item, start_date, end_date):
+        self.item = item
+        self.start_date = start_date
+        self.end_date = end_date
+        self.summary = {
+            'in_qty': 0,
+            'out_qty': 0,
+            'balance_qty': 0,
+            'balance': 0
+        }
+
+    def rows(self):
+        """
+        Yield one transaction row per event. The summary is complete once the
+        generator is exhausted.
+        """
+        snapshot = nearest_snapshot(self.item, self.start_date)
+        yield from self._replay(snapshot, events(self.item, snapshot.date if snapshot else None, self.end_date))
+
+    def _replay(self, snapshot, rows):
+        """Replay ledger rows from the snapshot's state, yielding a transaction for each row in the range."""
+        state = StockState.from_snapshot(snapshot)
+        summary = self.summary
+
+        for movement in rows:
+            qty, price, total = state.apply(movement)
+            if movement.date < self.start_date:
+                continue # Replaying up to the opening state
+            transaction = {
+                "date": movement.date.strftime(self.DATE_FORMAT),
+                "description": movement.description,
+                "code": movement.code,
+                "in_qty": 0,
+                "in_price": 0,
+                "in_total": 0,
+                "out_qty": 0,
+                "out_price": 0,
+                "out_total": 0,
+            }
+            if movement.kind == PURCHASE:
+                transaction.update({
+                    "in_qty": qty,
+                    "in_price": price,
+                    "in_total": total
+                })
+                summary['in_qty'] += qty
+            else:
+                transaction.update({
+                    "out_qty": qty,
+                    "out_price": price,
+                    "out_total": total
+                })
+                summary['out_qty'] += qty
+
+            # Stock state after the event
+            lots = state.open_lots()
+            transaction.update({
+                "stock_qty": [lot[1] for lot in lots],
+                "stock_price": [lot[2] for lot in lots],
+                "stock_total": [lot[3] for lot in lots],
+                "balance_qty": state.balance_qty,
+                "balance": state.balance
+            })
+            yield transaction
+
+        summary.update({
+            "balance_qty": state.balance_qty,
+            "balance": state.balance
+        })
+
+    def _item_dict(self):
+        return {
+            'item_code': self.item.code,
+            'name': self.item.name,
+            'unit': self.item.unit
+        }
+
+    def _batched(self, lines):
+        """Join lines into chunks of STREAM_BATCH, so the server writes fewer, larger chunks."""
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= self.STREAM_BATCH:
+                yield ''.join(batch)
+                batch = []
+        if batch:
+            yield ''.join(batch)
+
+    def stream_ndjson(self):
+        """
+        Yield the report as newline-delimited JSON: the item, one line per
+        transaction and a trailing {"summary": ...} line.
+        """
+        def lines():
+            yield json.dumps(self._item_dict()) + '\n'
+            for transaction in self.rows():
+                yield json.dumps(transaction) + '\n'
+            yield json.dumps({'summary': self.summary}) + '\n'
+        return self._batched(lines())
+
+    def stream_csv(self):
+        """
+        Yield the report as CSV with one row per transaction and a trailing
+        summary row. Stock lists are space-separated within their cell.
+        """
+        writer = csv.writer(_Echo())
+        def lines():
+            yield writer.writerow(CSV_COLUMNS)
+            for transaction in self.rows():
+                yield writer.writerow([
+                    ' '.join(str(value) for value in transaction[column]) if isinstance(transaction[column], list)
+                    else transaction[column]
+                    for column in CSV_COLUMNS
+                ])
+            summary = self.summary
+            yield writer.writerow([
+                '', 'Summary', self.item.code,
+                summary['in_qty'], '', '',
+                summary['out_qty'], '', '',
+                '', '', '',
+                summary['balance_qty'], summary['balance']
+            ])
+        return self._batched(lines())
+
+    def as_dict(self):
+        """Build the complete report in memory."""
+        report = self._item_dict()
+        report['items'] = list(self.rows())
+        report['summary'] = self.summary
+        return report
+
+    async def aas_dict(self):
+        """
+        as_dict() with the async ORM: the same queries, awaited one after
+        another, then the same replay in memory.
+        """
+        snapshot = await nearest_snapshots(self.item, self.start_date).afirst()
+        rows = [movement async for movement in movements(self.item, snapshot.date if snapshot else None, self.end_date)]
+        report = self._item_dict()
+        report['items'] = list(self._replay(snapshot, rows))
+        report['summary'] = self.summary
+        return report
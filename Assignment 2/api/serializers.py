@@ -1,10 +1,49 @@
+from decimal import Decimal
 from rest_framework import serializers
-from .models import Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, SellAllocation
+from rest_framework.validators import UniqueValidator
+from .models import Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, ReportJob
+from .cache import get_item
+from .pagination import query_params
+from .services import post_purchase, post_sale, post_purchases_bulk, post_sales_bulk
 
-class ItemSerializer(serializers.ModelSerializer):
+def requested_fields(request):
+    """The field names in a GET request's ?fields= parameter, or None to serialize every field."""
+    if request is None or request.method != 'GET' or 'fields' not in query_params(request):
+        return None
+    return {name.strip() for name in query_params(request)['fields'].split(',') if name.strip()}
+
+def unique_code(model):
+    """
+    Field options checking that a code is unused, deleted rows included: they
+    keep their codes (the column is unique) until they are archived.
+    """
+    message = model._meta.get_field('code').error_messages['unique'] % {
+        'model_name': model._meta.verbose_name, 'field_label': 'code'
+    }
+    return {'validators': [UniqueValidator(queryset=model.all_objects.all(), message=message)]}
+
+class SparseFieldsMixin:
+    """
+    Serialize only the fields listed in ?fields=code,name,... on GET
+    requests. Applies to the top-level serializer of a view (the one that
+    gets the request in its context), not to nested serializers.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields is None:
+            return
+        unknown = fields - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': [f"Unknown field: {name}" for name in sorted(unknown)]})
+        for name in set(self.fields) - fields:
+            self.fields.pop(name)
+
+class ItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Item
         fields = ['code', 'name', 'unit', 'description', 'stock', 'balance']
+        extra_kwargs = {'code': unique_code(Item)}
 
 class PurchaseDetailSerializer(serializers.ModelSerializer):
     item_code = serializers.CharField(write_only=True)
@@ -21,29 +60,16 @@ class PurchaseDetailSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         """Create a purchase detail and update item stock/balance"""
-        item_code = validated_data.pop('item_code')
-        item = Item.objects.get(code=item_code, is_deleted=False)
-        header = self.context['header']
-        purchase_detail = PurchaseDetail.objects.create(
-            header=header,
-            item=item,
-            **validated_data
-        )
-        purchase_detail.remaining_quantity = purchase_detail.quantity
-        purchase_detail.save()
-
-        # Update item stock and balance
-        item.stock += purchase_detail.quantity
-        item.balance += purchase_detail.quantity * purchase_detail.unit_price
-        item.save()
-        return purchase_detail
+        item = get_item(validated_data['item_code'])
+        return post_purchase(self.context['header'], item, validated_data['quantity'], validated_data['unit_price'])
     
-class PurchaseHeaderSerializer(serializers.ModelSerializer):
+class PurchaseHeaderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     details = PurchaseDetailSerializer(many=True, read_only=True)
 
     class Meta:
         model = PurchaseHeader
         fields = ['code', 'date', 'description', 'details']
+        extra_kwargs = {'code': unique_code(PurchaseHeader)}
 
 class SellDetailSerializer(serializers.ModelSerializer):
     item_code = serializers.CharField(write_only=True)
@@ -59,51 +85,127 @@ class SellDetailSerializer(serializers.ModelSerializer):
         return representation
     
     def create(self, validated_data):
-        """Create a sell detail and update item stock/balance"""
-        item_code = validated_data.pop('item_code')
-        item = Item.objects.get(code=item_code, is_deleted=False)
-        header = self.context['header']
-        sell_detail = SellDetail.objects.create(
-            header=header,
-            item=item,
-            **validated_data
-        )
-
-        # Deplete stock using FIFO
-        remaining_quantity = sell_detail.quantity
-        purchase_details = PurchaseDetail.objects.filter(
-            item=item,
-            remaining_quantity__gt=0,
-            header__is_deleted=False
-        ).order_by('header__date')
-        total_cost = 0
-
-        for pd in purchase_details:
-            if remaining_quantity <= 0:
-                break
-            deplete_qty = min(pd.remaining_quantity, remaining_quantity)
-            SellAllocation.objects.create(
-                sell_detail=sell_detail,
-                purchase_detail=pd,
-                quantity=deplete_qty
-            )
-            pd.remaining_quantity -= deplete_qty
-            pd.save()
-            total_cost += deplete_qty * pd.unit_price
-            remaining_quantity -= deplete_qty
-        
-        if remaining_quantity > 0:
-            raise serializers.ValidationError("Not enough stock to fulfill the sale.")
-        
-        # Update item stock and balance
-        item.stock -= sell_detail.quantity
-        item.balance -= total_cost
-        item.save()
-        return sell_detail
-
-class SellHeaderSerializer(serializers.ModelSerializer):
+        """Create a sell detail and update item stock/balance (FIFO)"""
+        item = get_item(validated_data['item_code'])
+        return post_sale(self.context['header'], item, validated_data['quantity'])
+
+class SellHeaderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     details = SellDetailSerializer(many=True, read_only=True)
 
     class Meta:
         model = SellHeader
         fields = ['code', 'date', 'description', 'details']
+        extra_kwargs = {'code': unique_code(SellHeader)}
+
+class BulkDocumentListSerializer(serializers.ListSerializer):
+    """
+    Validate a batch of headers with nested details. Field validation runs
+    per document; header codes and item codes are then checked for the whole
+    batch with one lookup each, and every detail gets its resolved `item`.
+    Errors are returned as a list aligned with the submitted documents.
+    """
+    header_model = None
+    post = None
+
+    def to_internal_value(self, data):
+        documents = super().to_internal_value(data)
+        codes = [document['code'] for document in documents]
+        existing = self.header_model.all_objects.only('code').in_bulk(codes, field_name='code')
+        item_codes = {line['item_code'] for document in documents for line in document['details']}
+        items = Item.objects.in_bulk(item_codes, field_name='code')
+
+        errors = []
+        seen = set()
+        for document in documents:
+            document_errors = {}
+            if document['code'] in existing:
+                document_errors['code'] = [f"{self.header_model._meta.verbose_name} with this code already exists."]
+            elif document['code'] in seen:
+                document_errors['code'] = ["Duplicate code in this batch."]
+            seen.add(document['code'])
+            detail_errors = []
+            for line in document['details']:
+                line['item'] = items.get(line['item_code'])
+                detail_errors.append({'item_code': ["Item not found."]} if line['item'] is None else {})
+            if any(detail_errors):
+                document_errors['details'] = detail_errors
+            errors.append(document_errors)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return documents
+
+    def create(self, validated_data):
+        return type(self).post(validated_data)
+
+class BulkPurchaseListSerializer(BulkDocumentListSerializer):
+    header_model = PurchaseHeader
+    post = staticmethod(post_purchases_bulk)
+
+class BulkSellListSerializer(BulkDocumentListSerializer):
+    header_model = SellHeader
+    post = staticmethod(post_sales_bulk)
+
+class BulkPurchaseDetailSerializer(serializers.Serializer):
+    item_code = serializers.CharField(max_length=50)
+    quantity = serializers.IntegerField(min_value=1)
+    unit_price = serializers.DecimalField(max_digits=15, decimal_places=2, min_value=Decimal(0))
+
+class BulkSellDetailSerializer(serializers.Serializer):
+    item_code = serializers.CharField(max_length=50)
+    quantity = serializers.IntegerField(min_value=1)
+
+class BulkPurchaseHeaderSerializer(serializers.Serializer):
+    """A purchase header with its details, for bulk ingest (no per-row queries)."""
+    code = serializers.CharField(max_length=50)
+    date = serializers.DateField()
+    description = serializers.CharField()
+    details = BulkPurchaseDetailSerializer(many=True, allow_empty=False)
+
+    class Meta:
+        list_serializer_class = BulkPurchaseListSerializer
+
+class BulkSellHeaderSerializer(serializers.Serializer):
+    """A sell header with its details, for bulk ingest (no per-row queries)."""
+    code = serializers.CharField(max_length=50)
+    date = serializers.DateField()
+    description = serializers.CharField()
+    details = BulkSellDetailSerializer(many=True, allow_empty=False)
+
+    class Meta:
+        list_serializer_class = BulkSellListSerializer
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    item_code = serializers.CharField(max_length=50, write_only=True)
+    result_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'item_code', 'start_date', 'end_date', 'status',
+            'created_at', 'started_at', 'finished_at', 'result_size', 'error', 'result_url'
+        ]
+        read_only_fields = ['status', 'created_at', 'started_at', 'finished_at', 'result_size', 'error']
+
+    def to_representation(self, instance):
+        """Include item_code in the response"""
+        representation = super().to_representation(instance)
+        representation['item_code'] = instance.item.code
+        return representation
+
+    def get_result_url(self, instance):
+        if instance.status != ReportJob.DONE:
+            return None
+        request = self.context.get('request')
+        url = f'/report-jobs/{instance.pk}/result/'
+        return request.build_absolute_uri(url) if request else url
+
+    def validate_item_code(self, value):
+        try:
+            return get_item(value)
+        except Item.DoesNotExist:
+            raise serializers.ValidationError("Item not found.")
+
+    def validate(self, data):
+        if data['start_date'] > data['end_date']:
+            raise serializers.ValidationError({'end_date': ["Must not be before start_date."]})
+        return data
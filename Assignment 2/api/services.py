@@ -0,0 +1,359 @@
+import functools
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from django.db import transaction, DatabaseError
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import serializers
+from .cache import bump_item_versions
+from .ledger import purchase_movement, record_movements, sale_movement
+from .models import Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, SellAllocation, StockSnapshot
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 1000 # Rows per INSERT/UPDATE statement in bulk postings
+POSTING_RETRIES = 5 # Attempts for a posting that hits a serialization failure or deadlock
+RETRY_BACKOFF = 0.01 # Base delay in seconds, doubled after each failed attempt
+
+class PostingMetrics:
+    """
+    Thread-safe counters for the posting engine: committed postings, retries,
+    failures and the time spent waiting for locks (the transaction start and
+    row locks).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.postings = 0
+            self.retries = 0
+            self.failures = 0
+            self.lock_waits = 0
+            self.lock_wait_total = 0.0
+            self.lock_wait_max = 0.0
+
+    def record(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def record_lock_wait(self, seconds):
+        with self._lock:
+            self.lock_waits += 1
+            self.lock_wait_total += seconds
+            self.lock_wait_max = max(self.lock_wait_max, seconds)
+
+    def snapshot(self):
+        """Return the current counters as a dict."""
+        with self._lock:
+            return {
+                'postings': self.postings,
+                'retries': self.retries,
+                'failures': self.failures,
+                'lock_waits': self.lock_waits,
+                'lock_wait_avg_ms': 1000 * self.lock_wait_total / self.lock_waits if self.lock_waits else 0.0,
+                'lock_wait_max_ms': 1000 * self.lock_wait_max,
+            }
+
+posting_metrics = PostingMetrics()
+
+def _is_retryable(exc):
+    """True for serialization failures, deadlocks and lock timeouts on the supported databases."""
+    cause = exc.__cause__
+    if getattr(cause, 'sqlstate', None) in ('40001', '40P01') or getattr(cause, 'pgcode', None) in ('40001', '40P01'):
+        return True # PostgreSQL serialization_failure / deadlock_detected
+    if exc.args and exc.args[0] in (1205, 1213):
+        return True # MySQL lock wait timeout / deadlock
+    message = str(exc).lower()
+    return 'database is locked' in message or 'database table is locked' in message # SQLite
+
+def posting_transaction(func):
+    """
+    Run a posting function in its own transaction and retry it with
+    exponential backoff when the database reports a serialization failure or
+    deadlock. Inside an outer transaction the function runs in a savepoint and
+    is not retried, since only the outermost transaction can be replayed.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if transaction.get_connection().in_atomic_block:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        for attempt in range(1, POSTING_RETRIES + 1):
+            try:
+                start = time.perf_counter()
+                with transaction.atomic():
+                    # SQLite with transaction_mode IMMEDIATE waits for the write lock here
+                    posting_metrics.record_lock_wait(time.perf_counter() - start)
+                    result = func(*args, **kwargs)
+                posting_metrics.record(postings=1)
+                return result
+            except DatabaseError as exc:
+                if attempt == POSTING_RETRIES or not _is_retryable(exc):
+                    posting_metrics.record(failures=1)
+                    raise
+                posting_metrics.record(retries=1)
+                delay = RETRY_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random())
+                logger.info("Retrying %s after %s (attempt %d)", func.__name__, exc, attempt)
+                time.sleep(delay)
+    return wrapper
+
+def lock_items(item_ids):
+    """
+    Lock item rows in ascending id order, so concurrent postings always take
+    locks in the same order and cannot deadlock. Returns {id: item}.
+    """
+    start = time.perf_counter()
+    items = Item.all_objects.select_for_update().filter(pk__in=item_ids).order_by('pk')
+    locked = {item.pk: item for item in items}
+    posting_metrics.record_lock_wait(time.perf_counter() - start)
+    return locked
+
+def open_lots(item):
+    """
+    Open purchase lots of an item in FIFO order.
+    Served by the partial index purchase_open_lot_idx on (item, date, id).
+    """
+    return PurchaseDetail.objects.filter(
+        item=item,
+        remaining_quantity__gt=0,
+        is_deleted=False
+    ).order_by('date', 'id')
+
+def allocate_fifo(item, quantity):
+    """
+    Plan the FIFO depletion of quantity units of an item.
+    Returns ([(lot, qty), ...], total_cost) without writing anything; lots are
+    read lazily (and locked in FIFO order), so only the lots that are actually
+    touched are fetched.
+    """
+    plan = []
+    remaining_quantity = quantity
+    total_cost = 0
+    lots = open_lots(item).select_for_update().only('id', 'remaining_quantity', 'unit_price')
+    for lot in lots.iterator(chunk_size=100):
+        if remaining_quantity <= 0:
+            break
+        deplete_qty = min(lot.remaining_quantity, remaining_quantity)
+        plan.append((lot, deplete_qty))
+        total_cost += deplete_qty * lot.unit_price
+        remaining_quantity -= deplete_qty
+
+    if remaining_quantity > 0:
+        raise serializers.ValidationError("Not enough stock to fulfill the sale.")
+    return plan, total_cost
+
+@posting_transaction
+def post_purchase(header, item, quantity, unit_price):
+    """
+    Create a purchase detail and add it to item stock/balance and the stock
+    ledger. The counters are updated with F() expressions, so concurrent
+    postings cannot overwrite each other. Stock snapshots from the purchase
+    date on and cached data of the item are invalidated.
+    """
+    purchase_detail = PurchaseDetail.objects.create(
+        header=header,
+        item=item,
+        date=header.date,
+        quantity=quantity,
+        unit_price=unit_price,
+        remaining_quantity=quantity
+    )
+    Item.all_objects.filter(pk=item.pk).update(
+        stock=F('stock') + quantity,
+        balance=F('balance') + quantity * purchase_detail.unit_price,
+        updated_at=timezone.now()
+    )
+    record_movements([purchase_movement(purchase_detail)]) # Under the item row lock taken by the update
+    # After the item update, which waits for a snapshot build holding the item lock
+    StockSnapshot.invalidate([item.pk], header.date)
+    bump_item_versions([item.pk])
+    return purchase_detail
+
+@posting_transaction
+def post_sale(header, item, quantity):
+    """
+    Create a sell detail, deplete stock using FIFO and update item stock/balance
+    and the stock ledger (a movement per lot depleted). The item row and then
+    its lots (in FIFO order) are locked for the rest of the transaction, and a
+    failed sale rolls back completely. Uses a constant number of queries no
+    matter how many lots are touched. Stock snapshots from the sale date on and
+    cached data of the item are invalidated.
+    """
+    lock_items([item.pk])
+    plan, total_cost = allocate_fifo(item, quantity)
+    sell_detail = SellDetail.objects.create(header=header, item=item, quantity=quantity)
+
+    now = timezone.now()
+    for lot, deplete_qty in plan:
+        lot.remaining_quantity -= deplete_qty
+        lot.updated_at = now
+    SellAllocation.objects.bulk_create([
+        SellAllocation(sell_detail=sell_detail, purchase_detail=lot, quantity=deplete_qty)
+        for lot, deplete_qty in plan
+    ])
+    PurchaseDetail.all_objects.bulk_update([lot for lot, _ in plan], ['remaining_quantity', 'updated_at'])
+
+    # Update item stock and balance
+    Item.all_objects.filter(pk=item.pk).update(
+        stock=F('stock') - quantity,
+        balance=F('balance') - total_cost,
+        updated_at=now
+    )
+    record_movements([sale_movement(sell_detail, lot, deplete_qty, header.date) for lot, deplete_qty in plan])
+    StockSnapshot.invalidate([item.pk], header.date)
+    bump_item_versions([item.pk])
+    return sell_detail
+
+def _apply_item_deltas(deltas, since, now):
+    """
+    Add aggregated {item_id: [quantity, value]} deltas to item stock/balance,
+    one UPDATE per item in ascending id order, and invalidate stock snapshots
+    from the earliest date posted per item ({item_id: date}) and cached data
+    of the items.
+    """
+    for item_id in sorted(deltas):
+        quantity, value = deltas[item_id]
+        Item.all_objects.filter(pk=item_id).update(
+            stock=F('stock') + quantity,
+            balance=F('balance') + value,
+            updated_at=now
+        )
+    items_by_date = defaultdict(list)
+    for item_id, day in since.items():
+        items_by_date[day].append(item_id)
+    for day, item_ids in items_by_date.items():
+        StockSnapshot.invalidate(item_ids, day)
+    bump_item_versions(deltas)
+
+def _save_remaining_quantities(lots, now):
+    """
+    Write remaining_quantity of depleted lots with one UPDATE per distinct
+    value. After FIFO depletion nearly all of them are 0 (only the front lot
+    of each item is partially sold), so this is far cheaper than a CASE-based
+    bulk_update.
+    """
+    ids_by_value = defaultdict(list)
+    for lot in lots:
+        ids_by_value[lot.remaining_quantity].append(lot.pk)
+    for value, ids in ids_by_value.items():
+        for start in range(0, len(ids), BULK_BATCH_SIZE):
+            PurchaseDetail.all_objects.filter(pk__in=ids[start:start + BULK_BATCH_SIZE]).update(
+                remaining_quantity=value,
+                updated_at=now
+            )
+
+@posting_transaction
+def post_purchases_bulk(documents):
+    """
+    Create many purchase headers with their details in one transaction.
+    documents are validated header dicts whose details carry the resolved
+    `item`. Rows are written with bulk_create and stock/balance changes are
+    aggregated per item; the ledger costs a lookup and an UPDATE per item and date.
+    Returns the created headers.
+    """
+    headers = PurchaseHeader.objects.bulk_create([
+        PurchaseHeader(code=document['code'], date=document['date'], description=document['description'])
+        for document in documents
+    ], batch_size=BULK_BATCH_SIZE)
+
+    details = []
+    deltas = defaultdict(lambda: [0, 0])
+    since = {}
+    for header, document in zip(headers, documents):
+        for line in document['details']:
+            item, quantity, unit_price = line['item'], line['quantity'], line['unit_price']
+            details.append(PurchaseDetail(
+                header=header,
+                item=item,
+                date=header.date,
+                quantity=quantity,
+                unit_price=unit_price,
+                remaining_quantity=quantity
+            ))
+            delta = deltas[item.pk]
+            delta[0] += quantity
+            delta[1] += quantity * unit_price
+            since[item.pk] = min(since.get(item.pk, header.date), header.date)
+    PurchaseDetail.objects.bulk_create(details, batch_size=BULK_BATCH_SIZE)
+    _apply_item_deltas(deltas, since, timezone.now())
+    record_movements([purchase_movement(detail) for detail in details])
+    return headers
+
+@posting_transaction
+def post_sales_bulk(documents):
+    """
+    Create many sell headers with their details in one transaction, depleting
+    stock with FIFO in payload order (as if the lines were posted one by one).
+    The items and all their open lots are locked and loaded once, and the
+    allocation runs in memory. If any line lacks stock nothing is written and
+    a ValidationError lists the failing lines. Returns the created headers.
+    """
+    headers = SellHeader.objects.bulk_create([
+        SellHeader(code=document['code'], date=document['date'], description=document['description'])
+        for document in documents
+    ], batch_size=BULK_BATCH_SIZE)
+
+    item_ids = {line['item'].pk for document in documents for line in document['details']}
+    lock_items(item_ids)
+    lots = defaultdict(deque) # Open lots per item in FIFO order
+    open_lot_rows = PurchaseDetail.objects.filter(
+        item_id__in=item_ids,
+        remaining_quantity__gt=0,
+        is_deleted=False
+    ).select_for_update().order_by('item_id', 'date', 'id').only('id', 'item_id', 'remaining_quantity', 'unit_price')
+    for lot in open_lot_rows.iterator(chunk_size=BULK_BATCH_SIZE):
+        lots[lot.item_id].append(lot)
+
+    sell_details = []
+    planned = [] # (sell_detail, lot, quantity)
+    touched = {}
+    deltas = defaultdict(lambda: [0, 0])
+    since = {}
+    errors = []
+    for header, document in zip(headers, documents):
+        detail_errors = []
+        for line in document['details']:
+            item, quantity = line['item'], line['quantity']
+            sell_detail = SellDetail(header=header, item=item, quantity=quantity)
+            sell_details.append(sell_detail)
+            item_lots = lots[item.pk]
+            remaining_quantity = quantity
+            total_cost = 0
+            while remaining_quantity > 0 and item_lots:
+                lot = item_lots[0]
+                deplete_qty = min(lot.remaining_quantity, remaining_quantity)
+                planned.append((sell_detail, lot, deplete_qty))
+                touched[lot.pk] = lot
+                lot.remaining_quantity -= deplete_qty
+                total_cost += deplete_qty * lot.unit_price
+                remaining_quantity -= deplete_qty
+                if lot.remaining_quantity == 0:
+                    item_lots.popleft()
+            detail_errors.append({'quantity': ["Not enough stock to fulfill the sale."]} if remaining_quantity > 0 else {})
+            delta = deltas[item.pk]
+            delta[0] -= quantity
+            delta[1] -= total_cost
+            since[item.pk] = min(since.get(item.pk, header.date), header.date)
+        errors.append({'details': detail_errors} if any(detail_errors) else {})
+    if any(errors):
+        raise serializers.ValidationError(errors)
+
+    now = timezone.now()
+    SellDetail.objects.bulk_create(sell_details, batch_size=BULK_BATCH_SIZE)
+    SellAllocation.objects.bulk_create([
+        SellAllocation(sell_detail=sell_detail, purchase_detail=lot, quantity=deplete_qty)
+        for sell_detail, lot, deplete_qty in planned
+    ], batch_size=BULK_BATCH_SIZE)
+    _save_remaining_quantities(touched.values(), now)
+    _apply_item_deltas(deltas, since, now)
+    record_movements([
+        sale_movement(sell_detail, lot, deplete_qty, sell_detail.header.date)
+        for sell_detail, lot, deplete_qty in planned
+    ])
+    return headers
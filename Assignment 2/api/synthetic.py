@@ -0,0 +1,200 @@
+"""
+Synthetic warehouse data for benchmarks: items with skewed popularity and
+purchases and sales spread over several years. Sales are allocated FIFO in
+memory, in date order, and every table (details, allocations, the ledger) is
+written with bulk_create, so millions of rows load in minutes. The result is
+what posting the same documents in date order through the API would give.
+"""
+import random
+from bisect import bisect
+from collections import defaultdict, deque
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from django.db import transaction
+from django.utils import timezone
+from .cache import bump_item_versions
+from .models import Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, SellAllocation, StockMovement
+
+BATCH_SIZE = 1000 # Rows per INSERT/UPDATE statement
+UNITS = ['Pcs', 'Box', 'Kg', 'Pack', 'Roll']
+CATEGORIES = ['Books', 'Stationery', 'Electronics', 'Tools', 'Paint', 'Hardware', 'Cleaning', 'Office']
+
+class Popularity:
+    """
+    Pick items with Zipf-like weights: the item of rank r (in a shuffled
+    order) is picked in proportion to 1 / r ** skew. A skew of 0 is uniform;
+    at 1, the most popular 10% of 1,000 items get about 60% of the lines.
+    """
+    def __init__(self, items, skew, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cumulative = list(accumulate(1 / rank ** skew for rank in range(1, len(self.items) + 1)))
+        self.rng = rng
+
+    def pick(self):
+        return self.items[bisect(self.cumulative, self.rng.random() * self.cumulative[-1])]
+
+class SyntheticData:
+    """
+    Generate synthetic data. Codes start with prefix, so several data sets
+    can live side by side, and the same seed gives the same data. Headers are
+    written in transactions of about batch_size headers covering whole days.
+    A sale line never takes more than the stock bought on or before its date
+    (lines finding no stock are dropped), so stock never goes negative.
+    """
+    def __init__(self, items=1000, purchases=10_000, sales=10_000, lines=5, end_date=None, years=3,
+                 skew=1.0, seed=0, prefix='GEN', batch_size=1000):
+        self.item_count = items
+        self.purchase_count = purchases
+        self.sale_count = sales
+        self.max_lines = lines
+        self.end_date = end_date or date.today()
+        self.start_date = self.end_date - timedelta(days=365 * years - 1)
+        self.skew = skew
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.batch_size = batch_size
+
+    def exists(self):
+        """True if data with this prefix was generated before."""
+        return Item.all_objects.filter(code__startswith=f'{self.prefix}-I-').exists()
+
+    def schedule(self):
+        """[(date, kind, number), ...] of all headers in date order, purchases first on each date."""
+        days = (self.end_date - self.start_date).days + 1
+        headers = [(StockMovement.PURCHASE, n) for n in range(1, self.purchase_count + 1)]
+        headers += [(StockMovement.SALE, n) for n in range(1, self.sale_count + 1)]
+        return sorted((self.start_date + timedelta(days=self.rng.randrange(days)), kind, n) for kind, n in headers)
+
+    def batches(self, schedule):
+        """Split the schedule into batches of whole days with about batch_size headers."""
+        batch = []
+        for index, entry in enumerate(schedule):
+            batch.append(entry)
+            next_day = schedule[index + 1][0] if index + 1 < len(schedule) else None
+            if len(batch) >= self.batch_size and next_day != entry[0]:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def generate(self, progress=None):
+        """
+        Create the items and all documents. progress(written, total) is called
+        after each batch of headers. Returns the number of items, headers,
+        lines and ledger movements written.
+        """
+        counts = dict.fromkeys(['items', 'purchases', 'sales', 'purchase_lines', 'sale_lines', 'movements'], 0)
+        items = Item.objects.bulk_create((
+            Item(code=f'{self.prefix}-I-{n:06}', name=f'Item {n}', unit=self.rng.choice(UNITS),
+                 description=self.rng.choice(CATEGORIES))
+            for n in range(1, self.item_count + 1)
+        ), batch_size=BATCH_SIZE)
+        counts['items'] = len(items)
+        self.popularity = Popularity(items, self.skew, self.rng)
+        self.prices = {item.pk: self.rng.uniform(1, 500) for item in items}
+        self.lots = defaultdict(deque) # Open lots per item in FIFO order
+        self.stock = defaultdict(int)
+        self.balances = defaultdict(lambda: [0, Decimal(0)]) # Running ledger balance per item
+        self.sequences = {} # (item_id, date) -> last ledger sequence
+
+        schedule = self.schedule()
+        written = 0
+        for batch in self.batches(schedule):
+            with transaction.atomic():
+                for name, count in self.write_batch(batch).items():
+                    counts[name] += count
+            written += len(batch)
+            if progress is not None:
+                progress(written, len(schedule))
+
+        with transaction.atomic():
+            now = timezone.now()
+            for item in items:
+                item.stock, item.balance = self.balances[item.pk]
+                item.updated_at = now
+            Item.all_objects.bulk_update(items, ['stock', 'balance', 'updated_at'], batch_size=BATCH_SIZE)
+            bump_item_versions(item.pk for item in items)
+        return counts
+
+    def movement(self, kind, lot, day, quantity, sell_detail=None):
+        """A ledger movement placed after the item's previous one, with the running balances."""
+        item_id = lot.item_id
+        sequence = self.sequences[item_id, day] = self.sequences.get((item_id, day), 0) + 1
+        movement = StockMovement(item_id=item_id, date=day, sequence=sequence, kind=kind, purchase_detail=lot,
+                                 sell_detail=sell_detail, quantity=quantity, unit_price=lot.unit_price)
+        change_qty, change_value = movement.change()
+        balance = self.balances[item_id]
+        balance[0] += change_qty
+        balance[1] += change_value
+        movement.balance_qty, movement.balance = balance
+        return movement
+
+    def write_batch(self, batch):
+        purchase_headers, sell_headers = [], []
+        lots, sell_details, allocations, movements = [], [], [], []
+        reopened = {} # Lots of earlier batches depleted in this one
+        for day, kind, n in batch:
+            if kind == StockMovement.PURCHASE:
+                header = PurchaseHeader(code=f'{self.prefix}-P-{n:07}', date=day, description='Synthetic purchase')
+                purchase_headers.append(header)
+                for _ in range(self.rng.randint(1, self.max_lines)):
+                    item = self.popularity.pick()
+                    quantity = self.rng.randint(10, 100)
+                    unit_price = Decimal(self.prices[item.pk] * self.rng.uniform(0.9, 1.1)).quantize(Decimal('0.01'))
+                    lot = PurchaseDetail(header=header, item=item, date=day, quantity=quantity, unit_price=unit_price,
+                                         remaining_quantity=quantity)
+                    lots.append(lot)
+                    self.lots[item.pk].append(lot)
+                    self.stock[item.pk] += quantity
+                    movements.append(self.movement(kind, lot, day, quantity))
+                continue
+
+            header = SellHeader(code=f'{self.prefix}-S-{n:07}', date=day, description='Synthetic sale')
+            details = []
+            for _ in range(self.rng.randint(1, self.max_lines)):
+                item = self.popularity.pick()
+                quantity = min(self.rng.randint(1, 100), self.stock[item.pk])
+                if not quantity: # Nothing bought yet, or sold out
+                    continue
+                self.stock[item.pk] -= quantity
+                sell_detail = SellDetail(header=header, item=item, quantity=quantity)
+                details.append(sell_detail)
+                item_lots = self.lots[item.pk]
+                while quantity:
+                    lot = item_lots[0]
+                    deplete_qty = min(lot.remaining_quantity, quantity)
+                    allocations.append(SellAllocation(sell_detail=sell_detail, purchase_detail=lot, quantity=deplete_qty))
+                    movements.append(self.movement(kind, lot, day, deplete_qty, sell_detail))
+                    lot.remaining_quantity -= deplete_qty
+                    quantity -= deplete_qty
+                    if lot.pk is not None:
+                        reopened[lot.pk] = lot
+                    if lot.remaining_quantity == 0:
+                        item_lots.popleft()
+            if details: # The API rejects sales without details
+                sell_headers.append(header)
+                sell_details += details
+
+        # Parents first: bulk_create sets the primary keys the children refer to
+        PurchaseHeader.objects.bulk_create(purchase_headers, batch_size=BATCH_SIZE)
+        PurchaseDetail.objects.bulk_create(lots, batch_size=BATCH_SIZE)
+        SellHeader.objects.bulk_create(sell_headers, batch_size=BATCH_SIZE)
+        SellDetail.objects.bulk_create(sell_details, batch_size=BATCH_SIZE)
+        SellAllocation.objects.bulk_create(allocations, batch_size=BATCH_SIZE)
+        StockMovement.objects.bulk_create(movements, batch_size=BATCH_SIZE)
+        # One UPDATE per distinct remaining quantity (nearly all are 0)
+        ids_by_value = defaultdict(list)
+        for lot in reopened.values():
+            ids_by_value[lot.remaining_quantity].append(lot.pk)
+        for value, ids in ids_by_value.items():
+            for start in range(0, len(ids), BATCH_SIZE):
+                PurchaseDetail.all_objects.filter(pk__in=ids[start:start + BATCH_SIZE]).update(remaining_quantity=value)
+        return {
+            'purchases': len(purchase_headers),
+            'sales': len(sell_headers),
+            'purchase_lines': len(lots),
+            'sale_lines': len(sell_details),
+            'movements': len(movements),
+        }
@@ -1,3 +1,1447 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+import unittest.mock
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.http import JsonResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from .cache import CACHE_ALIAS, cache_metrics, get_item
+from .ledger import balance_at, rebuild_ledger
+from .profiling import ProfilingMiddleware, install_hooks, request_metrics
+from .models import Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, SellAllocation, StockMovement, StockSnapshot, ReportJob
+from .models import ArchivedItem, ArchivedPurchaseHeader, ArchivedPurchaseDetail, ArchivedSellHeader, ArchivedSellDetail, ArchivedSellAllocation
+from .reports import StockReport, build_snapshots, movements, purchases, sell_allocations
+from . import valuation
+from .jobs import claim_jobs, run_job
+from .synthetic import Popularity
+from .services import open_lots, post_purchase, post_sale, posting_metrics
+from .views import ItemViewSet, PurchaseHeaderViewSet, SellHeaderViewSet
+
+# Set WAREHOUSE_BENCHMARKS=1 to print throughput figures and run the slow benchmarks
+BENCHMARKS = os.environ.get('WAREHOUSE_BENCHMARKS') == '1'
+
+
+class WarehouseTestCase(TestCase):
+    """Common helpers for posting documents through the API."""
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear() # Row ids are reused after each test's rollback
+        self.client = APIClient()
+        self.item = Item.objects.create(code='I-001', name='History Book', unit='Pcs', description='Books')
+
+    def purchase(self, code, day, quantity, unit_price, item_code='I-001'):
+        if not PurchaseHeader.objects.filter(code=code).exists():
+            self.client.post('/purchase/', {'code': code, 'date': day, 'description': f'Buy {code}'}, format='json')
+        return self.client.post(f'/purchase/{code}/details/', {
+            'item_code': item_code, 'quantity': quantity, 'unit_price': unit_price,
+        }, format='json')
+
+    def sell(self, code, day, quantity, item_code='I-001'):
+        if not SellHeader.objects.filter(code=code).exists():
+            self.client.post('/sell/', {'code': code, 'date': day, 'description': f'Sell {code}'}, format='json')
+        return self.client.post(f'/sell/{code}/details/', {'item_code': item_code, 'quantity': quantity}, format='json')
+
+
+class FifoSaleTests(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.purchase('P-002', '2025-02-01', 10, 70)
+        self.purchase('P-001', '2025-01-01', 10, 60)
+        self.purchase('P-003', '2025-03-01', 10, 80)
+
+    def test_sale_depletes_oldest_lots_first(self):
+        response = self.sell('S-001', '2025-04-01', 15)
+        self.assertEqual(response.status_code, 201)
+
+        allocations = SellAllocation.objects.order_by('purchase_detail__date')
+        self.assertEqual(
+            [(a.purchase_detail.header.code, a.quantity) for a in allocations],
+            [('P-001', 10), ('P-002', 5)],
+        )
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock, 15)
+        self.assertEqual(self.item.balance, Decimal(10 * 70 - 5 * 70 + 10 * 80))
+
+    def test_sale_query_count_does_not_depend_on_lots_touched(self):
+        header = SellHeader.objects.create(code='S-001', date=date(2025, 4, 1), description='Sell')
+        with CaptureQueriesContext(connection) as one_lot:
+            self.client.post('/sell/S-001/details/', {'item_code': 'I-001', 'quantity': 5}, format='json')
+        with CaptureQueriesContext(connection) as three_lots:
+            self.client.post('/sell/S-001/details/', {'item_code': 'I-001', 'quantity': 24}, format='json')
+        self.assertEqual(header.details.count(), 2)
+        self.assertEqual(len(one_lot), len(three_lots))
+
+    def test_insufficient_stock_writes_nothing(self):
+        response = self.sell('S-001', '2025-04-01', 31)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SellDetail.objects.exists())
+        self.assertFalse(SellAllocation.objects.exists())
+        self.assertEqual(sum(PurchaseDetail.objects.values_list('remaining_quantity', flat=True)), 30)
+
+    def test_header_date_change_reorders_lots(self):
+        self.client.put('/purchase/P-003/', {'code': 'P-003', 'date': '2024-12-01', 'description': 'Back-dated'}, format='json')
+        self.sell('S-001', '2025-04-01', 5)
+        self.assertEqual(SellAllocation.objects.get().purchase_detail.header.code, 'P-003')
+
+
+class StockReportTests(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.purchase('P-001', '2025-01-01', 10, 60)
+        self.purchase('P-002', '2025-02-01', 10, 70)
+        self.sell('S-001', '2025-03-01', 15)
+
+    def report(self, start_date, end_date):
+        return self.client.get('/report/I-001/', {'start_date': start_date, 'end_date': end_date}).json()['result']
+
+    def test_report_replays_fifo_lots(self):
+        report = self.report('2025-02-01', '2025-03-31')
+        self.assertEqual(
+            [(row['code'], row['in_qty'], row['out_qty'], row['stock_qty'], row['stock_price']) for row in report['items']],
+            [
+                # P-001 is still in stock on 2025-02-01, although it is sold out now
+                ('P-002', 10, 0, [10, 10], [60.0, 70.0]),
+                ('S-001', 0, 10, [10], [70.0]),
+                ('S-001', 0, 5, [5], [70.0]),
+            ],
+        )
+        self.assertEqual(report['summary'], {'in_qty': 10, 'out_qty': 15, 'balance_qty': 5, 'balance': 350.0})
+
+    def test_sale_depletes_allocated_lot_when_prices_match(self):
+        # Back-dated purchase at the same price as the lot the sale was allocated from
+        self.purchase('P-000', '2024-12-01', 4, 60)
+        report = self.report('2024-12-01', '2025-03-31')
+        self.assertEqual(report['items'][-1]['stock_qty'], [4, 5])
+
+    def test_report_query_count_does_not_depend_on_transactions(self):
+        # The item, the nearest snapshot and the ledger range
+        with self.assertNumQueries(3):
+            self.report('2025-01-01', '2025-03-31')
+        for n in range(10):
+            self.purchase(f'P-1{n:02}', '2025-03-10', 5, 50 + n)
+            self.sell(f'S-1{n:02}', '2025-03-20', 3)
+        with self.assertNumQueries(3):
+            self.report('2025-01-01', '2025-03-31')
+
+    def stream(self, output):
+        response = self.client.get('/report/I-001/stream/', {
+            'start_date': '2025-01-01', 'end_date': '2025-03-31', 'format': output,
+        })
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_stream_matches_report(self):
+        report = self.report('2025-01-01', '2025-03-31')
+        lines = [json.loads(line) for line in self.stream('ndjson').splitlines()]
+        self.assertEqual(lines[0], {'item_code': 'I-001', 'name': 'History Book', 'unit': 'Pcs'})
+        self.assertEqual(lines[1:-1], report['items'])
+        self.assertEqual(lines[-1], {'summary': report['summary']})
+
+    def test_csv_stream_has_a_row_per_transaction_and_a_summary(self):
+        rows = list(csv.DictReader(io.StringIO(self.stream('csv'))))
+        self.assertEqual([row['code'] for row in rows], ['P-001', 'P-002', 'S-001', 'S-001', 'I-001'])
+        self.assertEqual(rows[1]['stock_qty'], '10 10')
+        self.assertEqual((rows[-1]['description'], rows[-1]['balance_qty']), ('Summary', '5'))
+
+    def test_stream_rejects_unknown_format(self):
+        response = self.client.get('/report/I-001/stream/', {
+            'start_date': '2025-01-01', 'end_date': '2025-03-31', 'format': 'xml',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class StockSnapshotTests(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(7)
+        for n in range(80):
+            day = date(2024, 1, 1) + timedelta(days=rng.randrange(366))
+            self.item.refresh_from_db()
+            if n % 3 == 2 and self.item.stock:
+                header = SellHeader.objects.create(code=f'S-{n}', date=day, description='Sell')
+                post_sale(header, self.item, rng.randint(1, self.item.stock))
+            else:
+                header = PurchaseHeader.objects.create(code=f'P-{n}', date=day, description='Buy')
+                post_purchase(header, self.item, rng.randint(1, 20), Decimal(rng.randrange(20, 40)) / 2)
+
+    def reports(self):
+        ranges = [(date(2024, 1, 1), date(2024, 12, 31)), (date(2024, 3, 15), date(2024, 6, 30)),
+                  (date(2024, 8, 1), date(2024, 8, 31)), (date(2025, 1, 1), date(2025, 1, 31))]
+        return [StockReport(self.item, start, end).as_dict() for start, end in ranges]
+
+    def test_reports_from_snapshots_match_full_replay(self):
+        expected = self.reports()
+        self.assertEqual(build_snapshots(self.item, date(2024, 12, 31)), 12)
+        self.assertEqual(self.reports(), expected)
+
+    def test_back_dated_posting_invalidates_later_snapshots(self):
+        build_snapshots(self.item, date(2024, 12, 31))
+        header = PurchaseHeader.objects.create(code='P-X', date=date(2024, 6, 10), description='Late')
+        post_purchase(header, self.item, 5, Decimal('12.50'))
+        self.assertEqual(StockSnapshot.objects.latest('date').date, date(2024, 5, 31))
+
+        expected = self.reports()
+        StockSnapshot.objects.all().delete()
+        self.assertEqual(self.reports(), expected)
+
+    def test_header_changes_invalidate_snapshots(self):
+        build_snapshots(self.item, date(2024, 12, 31))
+        sell = SellHeader.objects.filter(date__month__gt=3).order_by('date').last()
+        self.client.put(f'/sell/{sell.code}/', {'code': sell.code, 'date': '2024-03-20', 'description': 'Moved'}, format='json')
+        self.assertEqual(StockSnapshot.objects.latest('date').date, date(2024, 2, 29))
+
+        purchase = PurchaseHeader.objects.order_by('date').first()
+        self.client.delete(f'/purchase/{purchase.code}/')
+        self.assertFalse(StockSnapshot.objects.filter(date__gte=purchase.date).exists())
+
+    def test_ledger_matches_a_rebuild_after_header_changes(self):
+        sell = SellHeader.objects.order_by('date').last()
+        self.client.put(f'/sell/{sell.code}/', {'code': sell.code, 'date': '2024-02-02', 'description': 'Moved'}, format='json')
+        purchase = PurchaseHeader.objects.order_by('date')[3]
+        self.client.delete(f'/purchase/{purchase.code}/')
+        days = [date(2024, 1, 1) + timedelta(days=n) for n in range(0, 400, 7)]
+        posted = [balance_at(self.item, day) for day in days]
+        rebuild_ledger(self.item)
+        self.assertEqual([balance_at(self.item, day) for day in days], posted)
+
+    def test_command_builds_incrementally(self):
+        call_command('build_snapshots', until='2024-06-30', stdout=io.StringIO())
+        self.assertEqual(StockSnapshot.objects.count(), 6)
+        out = io.StringIO()
+        call_command('build_snapshots', until='2024-12-31', stdout=out)
+        self.assertIn('Built 6 snapshots', out.getvalue())
+
+
+class StockLedgerTests(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.purchase('P-001', '2025-01-01', 10, 60)
+        self.purchase('P-002', '2025-02-01', 10, 70)
+        self.sell('S-001', '2025-03-01', 15)
+
+    def ledger(self):
+        return list(StockMovement.objects.filter(item=self.item).order_by('date', 'sequence').values_list(
+            'date', 'kind', 'quantity', 'balance_qty', 'balance'
+        ))
+
+    def daily_balances(self):
+        """Balances at the end of each day with movements, which do not depend on the order within a day."""
+        days = sorted(set(StockMovement.objects.filter(item=self.item).values_list('date', flat=True)))
+        return {day: balance_at(self.item, day) for day in days}
+
+    def test_postings_write_running_balances(self):
+        self.assertEqual(self.ledger(), [
+            (date(2025, 1, 1), StockMovement.PURCHASE, 10, 10, Decimal('600.00')),
+            (date(2025, 2, 1), StockMovement.PURCHASE, 10, 20, Decimal('1300.00')),
+            (date(2025, 3, 1), StockMovement.SALE, 10, 10, Decimal('700.00')),
+            (date(2025, 3, 1), StockMovement.SALE, 5, 5, Decimal('350.00')),
+        ])
+        self.item.refresh_from_db()
+        self.assertEqual(self.ledger()[-1][3:], (self.item.stock, self.item.balance))
+
+    def test_back_dated_posting_shifts_later_balances(self):
+        self.purchase('P-000', '2024-12-01', 4, 50)
+        self.assertEqual([row[3:] for row in self.ledger()], [
+            (4, Decimal('200.00')), (14, Decimal('800.00')), (24, Decimal('1500.00')),
+            (14, Decimal('900.00')), (9, Decimal('550.00')),
+        ])
+        self.assertEqual(balance_at(self.item, date(2025, 1, 15)), (14, Decimal('800.00')))
+        self.assertEqual(balance_at(self.item, date(2024, 1, 1)), (0, Decimal('0.00')))
+
+    def test_header_changes_move_ledger_rows(self):
+        self.client.put('/purchase/P-002/', {'code': 'P-002', 'date': '2024-12-15', 'description': 'Moved'}, format='json')
+        self.assertEqual(self.ledger()[0][:4], (date(2024, 12, 15), StockMovement.PURCHASE, 10, 10))
+        self.client.delete('/sell/S-001/')
+        self.assertEqual(self.ledger()[-1][3:], (20, Decimal('1300.00')))
+        self.assertFalse(StockMovement.objects.filter(kind=StockMovement.SALE).exists())
+
+    def test_bulk_postings_match_a_rebuild(self):
+        self.client.post('/purchase/bulk/', [
+            {'code': f'P-1{n}', 'date': f'2025-0{1 + n % 4}-10', 'description': 'Import', 'details': [
+                {'item_code': 'I-001', 'quantity': 3, 'unit_price': f'{40 + n}.00'},
+            ] * 2} for n in range(6)
+        ], format='json')
+        self.client.post('/sell/bulk/', [
+            {'code': f'S-1{n}', 'date': f'2025-0{4 - n % 3}-20', 'description': 'Import', 'details': [
+                {'item_code': 'I-001', 'quantity': 4},
+            ]} for n in range(5)
+        ], format='json')
+        posted = self.daily_balances()
+        rebuild_ledger(self.item)
+        self.assertEqual(self.daily_balances(), posted)
+        self.item.refresh_from_db()
+        self.assertEqual(self.ledger()[-1][3:], (self.item.stock, self.item.balance))
+
+    def test_postings_match_a_rebuild(self):
+        # Documents back-dated or moved onto a day with later movements are placed where a rebuild puts them
+        self.purchase('P-004', '2025-04-01', 5, 90)
+        self.sell('S-003', '2025-03-10', 1)
+        self.purchase('P-003', '2025-03-01', 6, 80) # After S-001 was posted on that day
+        self.sell('S-002', '2025-03-01', 2)
+        self.client.patch('/purchase/P-004/', {'date': '2025-03-01'}, format='json') # Before P-003 (lower id)
+        self.client.patch('/sell/S-003/', {'date': '2025-03-01'}, format='json') # Between S-001 and S-002
+        ledger = lambda: list(StockMovement.objects.filter(item=self.item).order_by('date', 'sequence').values_list(
+            'date', 'sequence', 'kind', 'purchase_detail', 'sell_detail', 'quantity', 'balance_qty', 'balance'
+        ))
+        dates = {'start_date': '2025-01-01', 'end_date': '2025-12-31'}
+        posted, report = ledger(), self.client.get('/report/I-001/', dates).json()
+        self.assertEqual([row[2] for row in posted[2:]], [StockMovement.PURCHASE] * 2 + [StockMovement.SALE] * 4)
+
+        call_command('backfill_ledger', stdout=io.StringIO())
+        self.assertEqual(ledger(), posted)
+        self.assertEqual(self.client.get('/report/I-001/', dates).json(), report)
+        codes = [row['code'] for row in report['result']['items']]
+        self.assertEqual(codes[2:], ['P-004', 'P-003', 'S-001', 'S-001', 'S-003', 'S-002'])
+
+    def test_backfill_command_rebuilds_reports(self):
+        report = self.client.get('/report/I-001/', {'start_date': '2025-01-01', 'end_date': '2025-03-31'}).json()
+        StockMovement.objects.all().delete()
+        out = io.StringIO()
+        call_command('backfill_ledger', stdout=out)
+        self.assertIn('Wrote 4 movements', out.getvalue())
+        self.assertEqual(
+            self.client.get('/report/I-001/', {'start_date': '2025-01-01', 'end_date': '2025-03-31'}).json(), report
+        )
+
+    def test_balance_endpoint(self):
+        response = self.client.get('/balance/I-001/', {'date': '2025-02-15'})
+        self.assertEqual(response.json(), {'result': {
+            'item_code': 'I-001', 'date': '2025-02-15', 'balance_qty': 20, 'balance': 1300.0,
+        }})
+        with self.assertNumQueries(1): # The item is cached
+            self.client.get('/balance/I-001/', {'date': '2025-03-15'})
+        self.assertEqual(self.client.get('/balance/I-001/', {'date': '15-02-2025'}).status_code, 400)
+        self.assertEqual(self.client.get('/balance/I-404/').status_code, 404)
+
+
+class CacheTests(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.purchase('P-001', '2025-01-01', 10, 60)
+        cache_metrics.reset()
+
+    def report(self):
+        return self.client.get('/report/I-001/', {'start_date': '2025-01-01', 'end_date': '2025-12-31'}).json()['result']
+
+    def test_repeated_report_is_served_from_cache(self):
+        first = self.report()
+        with self.assertNumQueries(1): # Only the conditional GET check
+            self.assertEqual(self.report(), first)
+        self.assertEqual(cache_metrics.snapshot()['report'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_postings_invalidate_cached_reports(self):
+        self.report()
+        self.sell('S-001', '2025-02-01', 4)
+        self.assertEqual(self.report()['summary']['balance_qty'], 6)
+        self.purchase('P-002', '2025-03-01', 5, 70)
+        self.assertEqual(self.report()['summary']['balance_qty'], 11)
+        self.client.post('/purchase/bulk/', [{
+            'code': 'P-003', 'date': '2025-04-01', 'description': 'Import',
+            'details': [{'item_code': 'I-001', 'quantity': 1, 'unit_price': '10.00'}],
+        }], format='json')
+        self.assertEqual(self.report()['summary']['balance_qty'], 12)
+
+    def test_header_changes_invalidate_cached_reports(self):
+        self.report()
+        self.client.put('/purchase/P-001/', {'code': 'P-001', 'date': '2026-01-01', 'description': 'Moved'}, format='json')
+        self.assertEqual(self.report()['items'], [])
+
+    def test_header_text_changes_invalidate_cached_reports(self):
+        self.report()
+        self.client.put('/purchase/P-001/', {'code': 'P-100', 'date': '2025-01-01', 'description': 'Renamed'}, format='json')
+        row = self.report()['items'][0]
+        self.assertEqual((row['code'], row['description']), ('P-100', 'Renamed'))
+
+    def test_item_changes_invalidate_cached_items(self):
+        self.assertEqual(get_item('I-001').name, 'History Book')
+        self.client.put('/items/I-001/', {
+            'code': 'I-001', 'name': 'Old Books', 'unit': 'Pcs', 'description': 'Books',
+        }, format='json')
+        self.assertEqual(get_item('I-001').name, 'Old Books')
+        self.assertEqual(self.report()['name'], 'Old Books')
+
+        # The code moves to a new item
+        self.client.put('/items/I-001/', {'code': 'I-999', 'name': 'Old Books', 'unit': 'Pcs', 'description': 'Books'}, format='json')
+        new = Item.objects.create(code='I-001', name='New Books', unit='Pcs', description='Books')
+        self.assertEqual(get_item('I-001').pk, new.pk)
+        self.client.delete('/items/I-001/')
+        with self.assertRaises(Item.DoesNotExist):
+            get_item('I-001')
+
+    def test_item_lookups_hit_the_cache(self):
+        get_item('I-001')
+        with self.assertNumQueries(0):
+            get_item('I-001')
+        self.assertEqual(cache_metrics.snapshot()['item']['hits'], 1)
+
+
+class ValuationTests(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Item.objects.create(code='I-002', name='Math Book', unit='Pcs', description='Books')
+        Item.objects.create(code='I-003', name='Atlas', unit='Pcs', description='No transactions')
+        Item.objects.create(code='I-004', name='Gone', unit='Pcs', description='Deleted', is_deleted=True)
+        self.purchase('P-001', '2025-01-01', 10, 60)
+        self.purchase('P-001', '2025-01-01', 8, 15, item_code='I-002')
+        self.purchase('P-002', '2025-02-01', 10, 70)
+        self.sell('S-001', '2025-02-15', 15)
+        self.sell('S-001', '2025-02-15', 3, item_code='I-002')
+        self.purchase('P-000', '2024-12-01', 4, 55) # Back-dated
+        self.sell('S-002', '2025-03-15', 6)
+        self.purchase('P-003', '2025-03-20', 5, 80)
+        self.client.delete('/purchase/P-003/')
+
+    def valuation(self, end_date, start_date=None):
+        return {row['item_code']: row for row in valuation.StockValuation(end_date, start_date).rows()}
+
+    def test_valuation_matches_item_reports(self):
+        for start_date, end_date in [(None, date(2025, 12, 31)), (date(2025, 2, 1), date(2025, 2, 28)),
+                                     (date(2025, 1, 1), date(2025, 3, 31))]:
+            rows = self.valuation(end_date, start_date)
+            self.assertEqual(list(rows), ['I-001', 'I-002', 'I-003'])
+            for item in Item.objects.filter(is_deleted=False):
+                report = StockReport(item, start_date or date.min, end_date).as_dict()['summary']
+                row = rows[item.code]
+                self.assertEqual(
+                    (row['in_qty'], row['out_qty'], row['closing_qty']),
+                    (report['in_qty'], report['out_qty'], report['balance_qty'])
+                )
+                self.assertAlmostEqual(row['closing_value'], report['balance'])
+
+    def test_opening_and_closing_stock(self):
+        row = self.valuation(date(2025, 3, 31), date(2025, 2, 1))['I-001']
+        self.assertEqual(row, {
+            'item_code': 'I-001', 'name': 'History Book', 'unit': 'Pcs',
+            'opening_qty': 14, 'opening_value': 820.0,
+            'in_qty': 10, 'in_value': 700.0,
+            'out_qty': 21, 'out_value': 1310.0,
+            'closing_qty': 3, 'closing_value': 210.0,
+        })
+
+    def test_query_count_does_not_depend_on_items(self):
+        with self.assertNumQueries(3):
+            list(valuation.StockValuation(date(2025, 12, 31)).rows())
+        Item.objects.bulk_create(Item(code=f'X-{n}', name='X', unit='Pcs', description='X') for n in range(50))
+        self.purchase('P-100', '2025-05-01', 1, 10, item_code='X-7')
+        with self.assertNumQueries(3):
+            list(valuation.StockValuation(date(2025, 12, 31)).rows())
+
+    def test_stream_endpoint(self):
+        response = self.client.get('/valuation/', {'end_date': '2025-12-31'})
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line.get('item_code') for line in lines], ['I-001', 'I-002', 'I-003', None])
+        self.assertEqual(lines[-1]['summary']['closing_qty'], 3 + 5)
+
+        response = self.client.get('/valuation/', {'end_date': '2025-12-31', 'format': 'csv'})
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['item_code'] for row in rows], ['I-001', 'I-002', 'I-003', ''])
+        self.assertEqual(self.client.get('/valuation/', {'end_date': '31-12-2025'}).status_code, 400)
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('valuation', '--end-date', '2025-12-31', '--format', 'ndjson', stdout=output)
+        self.assertEqual(json.loads(output.getvalue().splitlines()[1])['closing_value'], 5 * 15.0)
+
+
+class ReportJobDirMixin:
+    """Write report job results to a temporary directory."""
+
+    def use_temporary_job_dir(self):
+        job_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, job_dir)
+        override = override_settings(REPORT_JOB_DIR=job_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        return job_dir
+
+
+class ReportJobTests(ReportJobDirMixin, WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.job_dir = self.use_temporary_job_dir()
+        self.purchase('P-001', '2025-01-01', 10, 60)
+        self.sell('S-001', '2025-02-01', 4)
+
+    def submit(self, start_date='2025-01-01', end_date='2025-12-31', item_code='I-001'):
+        return self.client.post('/report-jobs/', {
+            'item_code': item_code, 'start_date': start_date, 'end_date': end_date
+        }, format='json')
+
+    def run_queued_jobs(self):
+        for job in claim_jobs(10):
+            run_job(job)
+
+    def test_job_result_matches_streamed_report(self):
+        response = self.submit()
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual((job['status'], job['item_code'], job['result_url']), ('queued', 'I-001', None))
+        self.assertEqual(self.client.get(f"/report-jobs/{job['id']}/result/").status_code, 409)
+
+        self.run_queued_jobs()
+        job = self.client.get(f"/report-jobs/{job['id']}/").json()
+        self.assertEqual(job['status'], 'done')
+        response = self.client.get(job['result_url'])
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        result = gzip.decompress(b''.join(response.streaming_content)).decode()
+        streamed = self.client.get('/report/I-001/stream/', {'start_date': '2025-01-01', 'end_date': '2025-12-31'})
+        self.assertEqual(result, b''.join(streamed.streaming_content).decode())
+        self.assertEqual(job['result_size'], os.path.getsize(os.path.join(self.job_dir, f"report-{job['id']}.ndjson.gz")))
+
+    def test_identical_requests_share_the_pending_job(self):
+        first = self.submit()
+        second = self.submit()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(self.submit(end_date='2025-06-30').status_code, 202)
+        self.run_queued_jobs()
+        # A finished job is not reused, the data may have changed since
+        self.assertEqual(self.submit().status_code, 202)
+        self.assertEqual(ReportJob.objects.count(), 3)
+
+    def test_invalid_jobs_are_rejected(self):
+        self.assertEqual(self.submit(item_code='I-404').json(), {'item_code': ['Item not found.']})
+        self.assertEqual(self.submit(start_date='2025-02-01', end_date='2025-01-01').status_code, 400)
+        self.assertFalse(ReportJob.objects.exists())
+
+    def test_failed_job_records_the_error(self):
+        job_id = self.submit().json()['id']
+        with unittest.mock.patch.object(StockReport, 'stream_ndjson', side_effect=RuntimeError('disk full')):
+            with self.assertLogs('api.jobs', 'ERROR'):
+                self.run_queued_jobs()
+        job = self.client.get(f'/report-jobs/{job_id}/').json()
+        self.assertEqual((job['status'], job['error']), ('failed', 'disk full'))
+        self.assertEqual(os.listdir(self.job_dir), [])
+
+
+class AsyncViewTests(WarehouseTestCase):
+    """The async endpoints return the same responses as the DRF ones."""
+
+    def setUp(self):
+        super().setUp()
+        Item.objects.bulk_create(
+            Item(code=f'I-{n:03}', name=f'Item {n}', unit='Pcs', description='Books') for n in range(2, 8)
+        )
+        self.purchase('P-001', '2025-01-01', 10, 60)
+        self.sell('S-001', '2025-02-01', 4)
+
+    async def assertSameResponse(self, sync_url, async_url, **params):
+        expected = await self.async_client.get(sync_url, params)
+        response = await self.async_client.get(async_url, params)
+        self.assertEqual(response.status_code, expected.status_code)
+        # Next links point back at the endpoint they came from
+        self.assertEqual(json.loads(response.content.decode().replace('/async/', '/')), expected.json())
+        return response
+
+    async def test_item_list_pages_match(self):
+        response = await self.assertSameResponse('/items/', '/async/items/', page_size=3)
+        cursor = response.json()['next'].split('cursor=')[1]
+        await self.assertSameResponse('/items/', '/async/items/', page_size=3, cursor=cursor, fields='code,stock')
+
+    async def test_item_detail_matches(self):
+        await self.assertSameResponse('/items/I-001/', '/async/items/I-001/')
+        await self.assertSameResponse('/items/I-404/', '/async/items/I-404/')
+
+    async def test_report_matches(self):
+        await self.assertSameResponse('/report/I-001/', '/async/report/I-001/', start_date='2025-01-01', end_date='2025-12-31')
+        await self.assertSameResponse('/report/I-404/', '/async/report/I-404/', start_date='2025-01-01', end_date='2025-12-31')
+        await self.assertSameResponse('/report/I-001/', '/async/report/I-001/', start_date='2025', end_date='2025-12-31')
+
+
+class ProfilingTests(WarehouseTestCase):
+    """Request latency per URL name, Server-Timing headers and profiling of sampled requests."""
+
+    def setUp(self):
+        super().setUp()
+        install_hooks()
+        request_metrics.reset()
+        self.purchase('P-001', '2025-01-01', 10, 60)
+        request_metrics.reset()
+
+    def profiling(self, **options):
+        options = {'SAMPLE_RATE': 0.0, 'ALLOW_HEADER': True, 'SLOW_REQUEST_MS': 1000, 'DUPLICATE_QUERIES': 5, **options}
+        override = override_settings(WAREHOUSE_PROFILING=options)
+        override.enable()
+        self.addCleanup(override.disable)
+        return APIClient() # The middleware reads its settings when the client's handler loads it
+
+    def test_every_request_is_timed_by_url_name(self):
+        client = self.profiling()
+        for _ in range(3):
+            response = client.get('/items/I-001/')
+        client.get('/items/I-404/')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+$')
+        stats = client.get('/metrics/').json()['requests']['item-detail']
+        self.assertEqual((stats['count'], stats['errors'], stats['profiled']), (4, 0, 0))
+        self.assertIsNone(stats['queries_avg'])
+        self.assertTrue(0 < stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms'] <= stats['max_ms'])
+
+    def test_profiled_request_counts_queries_and_serializer_time(self):
+        client = self.profiling()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/purchase/P-001/details/', HTTP_X_PROFILE='1')
+        self.assertRegex(
+            response['Server-Timing'],
+            rf'^db;dur=[\d.]+;desc="{len(queries)} queries", serializer;dur=[\d.]+, total;dur=[\d.]+$'
+        )
+        stats = request_metrics.snapshot()['purchase-details']
+        self.assertEqual((stats['profiled'], stats['queries_avg'], stats['n_plus_one']), (1, len(queries), 0))
+        self.assertGreater(stats['serializer_ms_avg'], 0)
+
+        # The header is ignored unless allowed, a sample rate of 1 profiles everything
+        self.assertNotIn('db;', self.profiling(ALLOW_HEADER=False).get('/items/', HTTP_X_PROFILE='1')['Server-Timing'])
+        self.assertIn('db;', self.profiling(SAMPLE_RATE=1.0).get('/items/')['Server-Timing'])
+
+    async def test_async_views_are_profiled(self):
+        response = await self.async_client.get('/async/items/I-001/', headers={'X-Profile': '1'})
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    def test_repeated_queries_are_logged_as_n_plus_one(self):
+        def view(request):
+            for code in ('I-001', 'I-002', 'I-003'):
+                Item.objects.filter(code=code).exists()
+            return JsonResponse({})
+
+        with override_settings(WAREHOUSE_PROFILING={'SAMPLE_RATE': 1.0, 'DUPLICATE_QUERIES': 3}):
+            middleware = ProfilingMiddleware(view)
+        request = RequestFactory().get('/items/')
+        request.resolver_match = resolve('/items/')
+        with self.assertLogs('api.profiling', 'WARNING') as logs:
+            middleware(request)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['event'], record['url_name'], record['queries']), ('n_plus_one', 'item-list', 3))
+        self.assertEqual(record['duplicate_queries'][0]['count'], 3)
+        self.assertEqual(request_metrics.snapshot()['item-list']['n_plus_one'], 1)
+
+    def test_slow_requests_are_logged(self):
+        client = self.profiling(SLOW_REQUEST_MS=0)
+        with self.assertLogs('api.profiling', 'WARNING') as logs:
+            client.get('/report/I-001/', {'start_date': '2025-01-01', 'end_date': '2025-12-31'})
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(
+            (record['event'], record['method'], record['path'], record['url_name'], record['status']),
+            ('slow_request', 'GET', '/report/I-001/', 'report', 200)
+        )
+        self.assertNotIn('queries', record) # Not sampled
+
+
+class SoftDeleteTests(WarehouseTestCase):
+    """The default managers only see live rows; soft_delete() deletes in bulk."""
+
+    def setUp(self):
+        super().setUp()
+        for n in range(1, 5):
+            self.purchase(f'P-00{n}', f'2025-0{n}-01', 10, 50 + n)
+        self.sell('S-001', '2025-02-15', 12)
+        self.sell('S-002', '2025-04-15', 5)
+
+    def test_default_manager_hides_deleted_rows(self):
+        self.client.delete('/purchase/P-002/')
+        self.assertFalse(PurchaseHeader.objects.filter(code='P-002').exists())
+        header = PurchaseHeader.all_objects.get(code='P-002')
+        self.assertEqual((header.details.count(), PurchaseDetail.all_objects.filter(header=header).count()), (0, 1))
+        self.assertEqual(PurchaseHeader.objects.count(), 3)
+
+        # Deleted rows keep their codes until they are archived
+        response = self.client.post('/purchase/', {'code': 'P-002', 'date': '2025-05-01', 'description': 'Again'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/purchase/bulk/', [{'code': 'P-002', 'date': '2025-05-01', 'description': 'Again', 'details': [
+            {'item_code': 'I-001', 'quantity': 1, 'unit_price': '1.00'}
+        ]}], format='json')
+        self.assertEqual(response.json(), [{'code': ['purchase header with this code already exists.']}])
+        self.client.delete('/items/I-001/')
+        response = self.client.post('/items/', {'code': 'I-001', 'name': 'New', 'unit': 'Pcs', 'description': 'Books'}, format='json')
+        self.assertEqual(response.json(), {'code': ['item with this code already exists.']})
+
+    def test_bulk_soft_delete_matches_delete(self):
+        build_snapshots(self.item, date(2025, 4, 30))
+        report = lambda: self.client.get('/report/I-001/', {'start_date': '2025-01-01', 'end_date': '2025-12-31'}).json()['result']
+        report() # Cached
+        self.assertEqual(PurchaseHeader.objects.filter(code__in=['P-003', 'P-004']).soft_delete(), 2)
+        self.assertEqual(SellHeader.objects.filter(code='S-002').soft_delete(), 1)
+        self.assertEqual(SellHeader.objects.filter(code='S-002').soft_delete(), 0) # Already deleted
+
+        self.assertEqual(PurchaseDetail.objects.count(), 2)
+        self.assertFalse(SellDetail.objects.filter(header__code='S-002').exists())
+        self.assertFalse(StockSnapshot.objects.filter(date__gte=date(2025, 3, 1)).exists())
+        self.assertEqual([row['code'] for row in report()['items']], ['P-001', 'P-002', 'S-001', 'S-001'])
+        posted = [balance_at(self.item, date(2025, month, 28)) for month in range(1, 13)]
+        rebuild_ledger(self.item)
+        self.assertEqual([balance_at(self.item, date(2025, month, 28)) for month in range(1, 13)], posted)
+
+    def test_item_soft_delete_invalidates_the_cache(self):
+        get_item('I-001')
+        self.assertEqual(Item.objects.filter(code='I-001').soft_delete(), 1)
+        with self.assertRaises(Item.DoesNotExist):
+            get_item('I-001')
+        self.assertTrue(Item.all_objects.get(code='I-001').is_deleted)
+
+
+class ArchiveTests(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.purchase('P-001', '2025-01-01', 10, 60)
+        self.purchase('P-002', '2025-02-01', 10, 70)
+        self.purchase('P-003', '2025-03-01', 10, 80)
+        self.sell('S-001', '2025-01-15', 4) # From P-001
+        self.sell('S-002', '2025-02-15', 12) # From P-001 and P-002
+        Item.objects.create(code='I-002', name='Gone', unit='Pcs', description='Unused').delete()
+
+    def age(self, days):
+        """Move the deletion time of all deleted rows days back."""
+        for model in (Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail):
+            model.all_objects.filter(is_deleted=True).update(updated_at=timezone.now() - timedelta(days=days))
+
+    def archive(self, **options):
+        call_command('archive_deleted', stdout=io.StringIO(), **options)
+
+    def test_deleted_rows_move_to_the_archive(self):
+        self.client.delete('/sell/S-001/')
+        self.client.delete('/purchase/P-003/')
+        report = self.client.get('/report/I-001/', {'start_date': '2025-01-01', 'end_date': '2025-12-31'}).json()
+        sale = SellHeader.all_objects.get(code='S-001')
+        allocation = SellAllocation.all_objects.get(sell_detail__header=sale)
+        self.age(100)
+        self.archive(batch_size=1)
+
+        self.assertEqual(list(SellHeader.all_objects.values_list('code', flat=True)), ['S-002'])
+        self.assertEqual(list(PurchaseHeader.all_objects.order_by('code').values_list('code', flat=True)), ['P-001', 'P-002'])
+        self.assertEqual(list(Item.all_objects.values_list('code', flat=True)), ['I-001'])
+        archived = ArchivedSellAllocation.objects.get()
+        self.assertEqual(
+            (archived.id, archived.sell_detail_id, archived.purchase_detail_id, archived.quantity),
+            (allocation.pk, allocation.sell_detail_id, allocation.purchase_detail_id, 4)
+        )
+        self.assertEqual(ArchivedSellHeader.objects.get().code, 'S-001')
+        self.assertEqual(ArchivedSellDetail.objects.get().header_id, sale.pk)
+        self.assertEqual(ArchivedPurchaseDetail.objects.get().quantity, 10)
+        self.assertEqual(ArchivedPurchaseHeader.objects.get().code, 'P-003')
+        self.assertEqual(ArchivedItem.objects.get().code, 'I-002')
+        self.assertEqual(self.client.get('/report/I-001/', {'start_date': '2025-01-01', 'end_date': '2025-12-31'}).json(), report)
+        # Archived codes can be used again
+        response = self.client.post('/sell/', {'code': 'S-001', 'date': '2025-05-01', 'description': 'Again'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_recent_and_referenced_rows_stay(self):
+        self.client.delete('/purchase/P-002/') # Lot of the live sale S-002
+        self.client.delete('/sell/S-001/')
+        self.age(10)
+        self.archive()
+        self.assertFalse(ArchivedSellHeader.objects.exists())
+        self.archive(days=5)
+        self.assertEqual(ArchivedSellHeader.objects.get().code, 'S-001')
+        self.assertTrue(PurchaseHeader.all_objects.filter(code='P-002').exists())
+        self.assertFalse(ArchivedPurchaseHeader.objects.exists())
+
+        # Once the sale that used the lot is deleted and archived too, the purchase follows
+        self.client.delete('/sell/S-002/')
+        self.age(10)
+        self.archive(days=5)
+        self.assertEqual(ArchivedPurchaseHeader.objects.get().code, 'P-002')
+        self.assertEqual(ArchivedSellAllocation.objects.count(), 3)
+
+
+class BulkIngestTests(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Item.objects.create(code='I-002', name='Math Book', unit='Pcs', description='Books')
+
+    def bulk(self, kind, documents):
+        return self.client.post(f'/{kind}/bulk/', documents, format='json')
+
+    def purchases(self, count, lines=1, first=0):
+        return [{
+            'code': f'P-{first + n:05}', 'date': '2025-01-01', 'description': 'Import',
+            'details': [{'item_code': 'I-001', 'quantity': 10, 'unit_price': f'{50 + n}.00'}] * lines,
+        } for n in range(count)]
+
+    def test_bulk_purchases_update_items_and_lots(self):
+        response = self.bulk('purchase', [
+            {'code': 'P-001', 'date': '2025-01-01', 'description': 'Import', 'details': [
+                {'item_code': 'I-001', 'quantity': 10, 'unit_price': '60.00'},
+                {'item_code': 'I-002', 'quantity': 5, 'unit_price': '20.00'},
+            ]},
+            {'code': 'P-002', 'date': '2025-02-01', 'description': 'Import', 'details': [
+                {'item_code': 'I-001', 'quantity': 10, 'unit_price': '70.00'},
+            ]},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'headers': 2, 'details': 3})
+        self.assertEqual(
+            list(Item.objects.order_by('code').values_list('stock', 'balance')),
+            [(20, Decimal('1300.00')), (5, Decimal('100.00'))],
+        )
+        self.assertEqual(
+            list(PurchaseDetail.objects.order_by('id').values_list('header__code', 'date', 'remaining_quantity')),
+            [('P-001', date(2025, 1, 1), 10), ('P-001', date(2025, 1, 1), 5), ('P-002', date(2025, 2, 1), 10)],
+        )
+
+    def test_bulk_sales_deplete_fifo_in_payload_order(self):
+        self.bulk('purchase', self.purchases(3))
+        response = self.bulk('sell', [
+            {'code': 'S-001', 'date': '2025-03-01', 'description': 'Import', 'details': [{'item_code': 'I-001', 'quantity': 12}]},
+            {'code': 'S-002', 'date': '2025-02-01', 'description': 'Import', 'details': [{'item_code': 'I-001', 'quantity': 13}]},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(SellAllocation.objects.order_by('id').values_list('sell_detail__header__code', 'purchase_detail__header__code', 'quantity')),
+            [('S-001', 'P-00000', 10), ('S-001', 'P-00001', 2), ('S-002', 'P-00001', 8), ('S-002', 'P-00002', 5)],
+        )
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.stock, self.item.balance), (5, Decimal(5 * 52)))
+        self.assertEqual(sum(PurchaseDetail.objects.values_list('remaining_quantity', flat=True)), 5)
+
+    def test_bulk_sale_without_stock_writes_nothing(self):
+        self.bulk('purchase', self.purchases(1))
+        response = self.bulk('sell', [
+            {'code': 'S-001', 'date': '2025-03-01', 'description': 'Import', 'details': [{'item_code': 'I-001', 'quantity': 8}]},
+            {'code': 'S-002', 'date': '2025-03-01', 'description': 'Import', 'details': [
+                {'item_code': 'I-001', 'quantity': 1},
+                {'item_code': 'I-001', 'quantity': 5},
+            ]},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), [{}, {'details': [{}, {'quantity': ['Not enough stock to fulfill the sale.']}]}])
+        self.assertFalse(SellHeader.objects.exists())
+        self.assertEqual(PurchaseDetail.objects.get().remaining_quantity, 10)
+
+    def test_bulk_validation_errors_are_aligned_with_documents(self):
+        self.bulk('purchase', self.purchases(1))
+        documents = self.purchases(3)
+        documents[2]['code'] = 'P-00001'
+        documents[1]['details'] = [{'item_code': 'I-404', 'quantity': 1, 'unit_price': '1.00'}]
+        response = self.bulk('purchase', documents)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), [
+            {'code': ['purchase header with this code already exists.']},
+            {'details': [{'item_code': ['Item not found.']}]},
+            {'code': ['Duplicate code in this batch.']},
+        ])
+        self.assertEqual(PurchaseHeader.objects.count(), 1)
+
+    def test_bulk_query_count_does_not_depend_on_lines(self):
+        with CaptureQueriesContext(connection) as few:
+            self.bulk('purchase', self.purchases(2, lines=2))
+        with CaptureQueriesContext(connection) as many:
+            response = self.bulk('purchase', self.purchases(2, lines=40, first=2))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(few), len(many))
+
+
+class ListEndpointTests(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Item.objects.bulk_create(
+            Item(code=f'I-{n:03}', name=f'Item {n}', unit='Pcs', description='Books', is_deleted=n % 5 == 0)
+            for n in range(2, 26)
+        )
+
+    def pages(self, url):
+        """Follow the next links from url and return the pages' results."""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json()['results'])
+            url = response.json()['next']
+        return pages
+
+    def post_headers(self, kind, days, lines=1):
+        documents = [{
+            'code': f'{kind[0].upper()}-{n:03}', 'date': day, 'description': 'Import',
+            'details': [{'item_code': 'I-001', 'quantity': 1, 'unit_price': '10.00'}] * lines,
+        } for n, day in enumerate(days)]
+        self.client.post(f'/{kind}/bulk/', documents, format='json')
+
+    def test_items_are_paged_in_code_order(self):
+        pages = self.pages('/items/?page_size=7')
+        live = list(Item.objects.filter(is_deleted=False).order_by('code').values_list('code', flat=True))
+        self.assertEqual([len(page) for page in pages], [7, 7, 6])
+        self.assertEqual([item['code'] for page in pages for item in page], live)
+
+    def test_headers_are_paged_across_equal_dates(self):
+        self.post_headers('purchase', ['2025-02-01', '2025-01-01', '2025-01-01', '2025-01-01', '2025-03-01'])
+        pages = self.pages('/purchase/?page_size=2')
+        self.assertEqual(
+            [header['code'] for page in pages for header in page],
+            ['P-001', 'P-002', 'P-003', 'P-000', 'P-004'],
+        )
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/items/?cursor=bogus').status_code, 404)
+
+    def test_header_list_query_count_does_not_depend_on_page_size(self):
+        self.post_headers('purchase', ['2025-01-01'] * 30, lines=3)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/purchase/?page_size=2')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/purchase/?page_size=30')
+        self.assertEqual(len(response.json()['results']), 30)
+        self.assertEqual(response.json()['results'][0]['details'][0]['item_code'], 'I-001')
+        self.assertEqual(len(small), len(large))
+
+    def test_deep_pages_use_the_same_queries_as_the_first(self):
+        self.post_headers('purchase', ['2025-01-01'] * 20)
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get('/purchase/?page_size=5')
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(response.json()['next'])
+        self.assertEqual(len(first), len(deep))
+        self.assertNotIn('OFFSET', deep.captured_queries[0]['sql'])
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get('/items/?fields=code,stock')
+        self.assertEqual(set(response.json()['results'][0]), {'code', 'stock'})
+        self.assertEqual(set(self.client.get('/items/I-001/?fields=name').json()), {'name'})
+
+        self.post_headers('purchase', ['2025-01-01'] * 3)
+        with CaptureQueriesContext(connection) as without_details:
+            response = self.client.get('/purchase/?fields=code,date')
+        self.assertEqual(response.json()['results'][0], {'code': 'P-000', 'date': '2025-01-01'})
+        self.assertEqual(len(without_details), 2) # The conditional GET check and the page, no prefetch of the details
+
+    def test_unknown_sparse_field_is_rejected(self):
+        response = self.client.get('/items/?fields=code,price')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ['Unknown field: price']})
+
+
+class ConditionalGetTests(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.purchase('P-001', '2025-01-01', 10, 60)
+
+    def get(self, url, etag=None, **params):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(url, params, headers=headers)
+
+    def assertNotModified(self, url, response, **params):
+        """A poll with the ETag of response gets an empty 304 after a single query."""
+        with self.assertNumQueries(1):
+            poll = self.get(url, response['ETag'], **params)
+        self.assertEqual((poll.status_code, poll.content, poll['ETag']), (304, b'', response['ETag']))
+
+    def assertModified(self, url, response, **params):
+        poll = self.get(url, response['ETag'], **params)
+        self.assertEqual(poll.status_code, 200)
+        self.assertNotEqual(poll['ETag'], response['ETag'])
+        return poll
+
+    def test_item_detail(self):
+        response = self.get('/items/I-001/')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(response['Last-Modified'], http_date(Item.objects.get(code='I-001').updated_at.timestamp()))
+        self.assertNotModified('/items/I-001/', response)
+        poll = self.client.get('/items/I-001/', headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(poll.status_code, 304)
+        self.assertModified('/items/I-001/', response, fields='code') # Another representation
+
+        self.sell('S-001', '2025-02-01', 4) # Stock changes stamp the item
+        self.assertEqual(self.assertModified('/items/I-001/', response).json()['stock'], 6)
+        self.assertFalse(self.get('/items/I-002/').has_header('ETag'))
+
+    def test_item_list(self):
+        response = self.get('/items/')
+        self.assertNotModified('/items/', response)
+        self.client.post('/items/', {'code': 'I-002', 'name': 'Map', 'unit': 'Pcs', 'description': 'Maps'}, format='json')
+        response = self.assertModified('/items/', response)
+        self.client.delete('/items/I-002/')
+        self.assertModified('/items/', response)
+
+    def test_headers(self):
+        self.purchase('P-002', '2025-01-02', 5, 70)
+        detail, page = self.get('/purchase/P-001/'), self.get('/purchase/')
+        self.assertNotModified('/purchase/P-001/', detail)
+        self.assertNotModified('/purchase/', page)
+        self.assertNotModified('/sell/', self.get('/sell/'))
+
+        self.client.post('/purchase/P-002/details/', {'item_code': 'I-001', 'quantity': 1, 'unit_price': '10.00'}, format='json')
+        self.assertNotModified('/purchase/P-001/', detail)
+        page = self.assertModified('/purchase/', page)
+        self.client.delete('/purchase/P-001/')
+        self.assertEqual(self.get('/purchase/P-001/', detail['ETag']).status_code, 404)
+        self.assertModified('/purchase/', page)
+
+    def test_report(self):
+        dates = {'start_date': '2025-01-01', 'end_date': '2025-12-31'}
+        response = self.get('/report/I-001/', **dates)
+        self.assertNotModified('/report/I-001/', response, **dates) # No report built
+        self.assertModified('/report/I-001/', response, start_date='2025-01-01', end_date='2025-06-30')
+
+        self.sell('S-001', '2025-02-01', 4)
+        response = self.assertModified('/report/I-001/', response, **dates)
+        self.client.patch('/sell/S-001/', {'date': '2025-03-01'}, format='json') # Moves the ledger rows
+        response = self.assertModified('/report/I-001/', response, **dates)
+        self.client.delete('/sell/S-001/')
+        self.assertEqual(self.assertModified('/report/I-001/', response, **dates).json()['result']['summary']['balance_qty'], 10)
+
+    def test_report_after_header_text_change(self):
+        dates = {'start_date': '2025-01-01', 'end_date': '2025-12-31'}
+        response = self.get('/report/I-001/', **dates)
+        self.client.patch('/purchase/P-001/', {'description': 'Renamed'}, format='json')
+        poll = self.assertModified('/report/I-001/', response, **dates)
+        self.assertEqual(poll.json()['result']['items'][0]['description'], 'Renamed')
+        self.assertNotModified('/report/I-001/', poll, **dates)
+
+
+class IndexUsageTests(TestCase):
+    """The hot queries are planned with the composite and partial indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Mostly depleted lots and some deleted rows, as in a long-running warehouse
+        cls.items = Item.objects.bulk_create(
+            Item(code=f'I-{n:03}', name=f'Item {n}', unit='Pcs', description='Books', is_deleted=n % 10 == 0)
+            for n in range(50)
+        )
+        days = [date(2025, 1, 1) + timedelta(days=n) for n in range(200)]
+        purchase_headers = PurchaseHeader.objects.bulk_create(
+            PurchaseHeader(code=f'P-{n}', date=day, description='Buy', is_deleted=n % 10 == 0) for n, day in enumerate(days)
+        )
+        sell_headers = SellHeader.objects.bulk_create(
+            SellHeader(code=f'S-{n}', date=day, description='Sell', is_deleted=n % 10 == 0) for n, day in enumerate(days)
+        )
+        PurchaseDetail.objects.bulk_create(
+            PurchaseDetail(header=header, item=item, date=header.date, quantity=1, unit_price=10,
+                           remaining_quantity=1 if n >= 195 else 0)
+            for n, header in enumerate(purchase_headers) for item in cls.items
+        )
+        SellDetail.objects.bulk_create(
+            SellDetail(header=header, item=item, quantity=1) for header in sell_headers for item in cls.items
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('EXPLAIN output is only checked on SQLite and PostgreSQL')
+        if connection.vendor == 'postgresql':
+            # Tables this small are cheaper to scan; check that the indexes are usable
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        self.item = self.items[1]
+
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(index, queryset.explain())
+
+    def test_list_queries_use_live_indexes(self):
+        self.assertUsesIndex(ItemViewSet.queryset.all(), 'item_live_idx')
+        self.assertUsesIndex(PurchaseHeaderViewSet.queryset.all(), 'purchase_header_live_idx')
+        self.assertUsesIndex(SellHeaderViewSet.queryset.all(), 'sell_header_live_idx')
+
+    def test_ledger_queries_use_position_index(self):
+        self.assertUsesIndex(movements(self.item, date(2025, 3, 1), date(2025, 6, 1)), 'stock_movement_position_idx')
+        self.assertUsesIndex(
+            StockMovement.objects.filter(item=self.item, date__lte=date(2025, 3, 1)).order_by('-date', '-sequence')[:1],
+            'stock_movement_position_idx'
+        )
+
+    def test_report_queries_use_item_indexes(self):
+        self.assertUsesIndex(purchases(self.item, date(2025, 3, 1), date(2025, 6, 1)), 'purchase_item_date_idx')
+        self.assertUsesIndex(sell_allocations(self.item, date(2025, 3, 1), date(2025, 6, 1)), 'sell_item_header_idx')
+
+    def test_fifo_lookup_uses_open_lot_index(self):
+        self.assertUsesIndex(open_lots(self.item), 'purchase_open_lot_idx')
+
+
+class SyntheticDataTests(TestCase):
+    """generate_data writes what posting the same documents through the API would."""
+
+    def generate(self, **options):
+        options = {'items': 20, 'purchases': 80, 'sales': 80, 'years': 1, 'end_date': '2025-12-31', 'batch_size': 15,
+                   'stdout': io.StringIO(), **options}
+        call_command('generate_data', **options)
+
+    def test_generated_data_is_consistent(self):
+        self.generate()
+        self.assertEqual(PurchaseHeader.objects.count(), 80)
+        self.assertTrue(SellAllocation.objects.exists())
+        for detail in SellDetail.objects.annotate(allocated=Sum('allocations__quantity')):
+            self.assertEqual(detail.allocated, detail.quantity)
+        # FIFO never reaches a lot bought after the sale
+        self.assertFalse(SellAllocation.objects.filter(purchase_detail__date__gt=F('sell_detail__header__date')).exists())
+        for item in Item.objects.all():
+            lots = open_lots(item)
+            self.assertEqual(item.stock, sum(lot.remaining_quantity for lot in lots))
+            self.assertEqual(item.balance, sum(lot.remaining_quantity * lot.unit_price for lot in lots))
+            self.assertEqual(balance_at(item, date(2025, 12, 31)), (item.stock, item.balance))
+            ledger = list(StockMovement.objects.filter(item=item).order_by('date', 'sequence').values_list(
+                'date', 'sequence', 'kind', 'purchase_detail', 'sell_detail', 'quantity', 'balance_qty', 'balance'
+            ))
+            rebuild_ledger(item)
+            self.assertEqual(ledger, list(StockMovement.objects.filter(item=item).order_by('date', 'sequence').values_list(
+                'date', 'sequence', 'kind', 'purchase_detail', 'sell_detail', 'quantity', 'balance_qty', 'balance'
+            )))
+
+    def test_same_seed_gives_same_data_and_prefixes_do_not_clash(self):
+        self.generate(prefix='A')
+        self.generate(prefix='B')
+        rows = lambda prefix: list(PurchaseDetail.objects.filter(header__code__startswith=prefix).order_by('id').values_list(
+            'item__code', 'date', 'quantity', 'unit_price'
+        ))
+        self.assertEqual([(code[1:], *row) for code, *row in rows('A')], [(code[1:], *row) for code, *row in rows('B')])
+        with self.assertRaisesMessage(CommandError, 'Data with prefix A already exists'):
+            self.generate(prefix='A')
+
+    def test_item_popularity_is_skewed(self):
+        items = list(range(100))
+        for skew, low, high in ((0, 0.05, 0.15), (1, 0.5, 0.65)):
+            popularity = Popularity(items, skew, random.Random(0))
+            top = set(popularity.items[:10])
+            share = sum(popularity.pick() in top for _ in range(10_000)) / 10_000
+            self.assertTrue(low < share < high, (skew, share))
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_benchmark_writes_comparable_results_and_rolls_back(self):
+        call_command('generate_data', items=20, purchases=50, sales=30, years=1, stdout=io.StringIO())
+        before = (PurchaseDetail.objects.count(), SellDetail.objects.count(), StockMovement.objects.count(),
+                  list(Item.objects.order_by('id').values_list('stock', 'balance')))
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('benchmark', requests=5, warmup=1, output=output, stdout=io.StringIO())
+            with open(output) as f:
+                result = json.load(f)
+            self.assertEqual(list(result['scenarios']), ['item_list', 'item_detail', 'purchase', 'sale', 'report'])
+            self.assertEqual(result['dataset']['purchase_details'], before[0])
+            for name, stats in result['scenarios'].items():
+                self.assertEqual((stats['requests'], stats['errors']), (5, 0), name)
+                self.assertTrue(0 < stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms'] <= stats['max_ms'], name)
+                self.assertGreaterEqual(stats['queries_avg'], 1, name)
+
+            stdout = io.StringIO()
+            call_command('benchmark', 'sale', requests=5, warmup=1, compare=output, stdout=stdout)
+            self.assertRegex(stdout.getvalue(), r'\nsale +[\d.]+ -> [\d.]+ \([+-]\d+%\)')
+        # Postings were rolled back
+        self.assertEqual(before, (PurchaseDetail.objects.count(), SellDetail.objects.count(), StockMovement.objects.count(),
+                                  list(Item.objects.order_by('id').values_list('stock', 'balance'))))
+        with self.assertRaisesMessage(CommandError, 'Unknown scenarios: nope'):
+            call_command('benchmark', 'nope')
+
+
+@unittest.skipUnless(BENCHMARKS, 'set WAREHOUSE_BENCHMARKS=1 to run')
+class BulkIngestBenchmark(TestCase):
+    HEADERS = 5000
+    LINES = 10
+
+    def test_bulk_ingest_throughput(self):
+        client = APIClient()
+        Item.objects.bulk_create(
+            Item(code=f'I-{n}', name=f'Item {n}', unit='Pcs', description='Bulk') for n in range(500)
+        )
+        def documents(kind):
+            return [{
+                'code': f'{kind}-{n}', 'date': '2025-01-01', 'description': 'Import',
+                'details': [
+                    {'item_code': f'I-{(n * self.LINES + line) % 500}', 'quantity': 5 if kind == 'P' else 2, 'unit_price': '10.00'}
+                    for line in range(self.LINES)
+                ],
+            } for n in range(self.HEADERS)]
+        lines = self.HEADERS * self.LINES
+        for kind, url in (('P', '/purchase/bulk/'), ('S', '/sell/bulk/')):
+            payload = documents(kind)
+            start = time.perf_counter()
+            response = client.post(url, payload, format='json')
+            elapsed = time.perf_counter() - start
+            self.assertEqual(response.status_code, 201, response.content[:500])
+            print(f"\n{url}: {lines} lines in {elapsed:.2f}s ({60 * lines / elapsed:,.0f} lines/min)")
+
+
+@unittest.skipUnless(BENCHMARKS, 'set WAREHOUSE_BENCHMARKS=1 to run')
+class StockReportBenchmark(TestCase):
+    TRANSACTIONS = 100_000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = item = Item.objects.create(code='I-001', name='History Book', unit='Pcs', description='Books')
+        lots = cls.TRANSACTIONS // 2
+        cls.days = days = [date(2000, 1, 1) + timedelta(days=n // 20) for n in range(lots)]
+        purchase_headers = PurchaseHeader.objects.bulk_create(
+            PurchaseHeader(code=f'P-{n}', date=day, description='Buy') for n, day in enumerate(days)
+        )
+        sell_headers = SellHeader.objects.bulk_create(
+            SellHeader(code=f'S-{n}', date=day, description='Sell') for n, day in enumerate(days)
+        )
+        purchase_details = PurchaseDetail.objects.bulk_create(
+            PurchaseDetail(header=header, item=item, date=header.date, quantity=1, unit_price=10 + n % 7, remaining_quantity=0)
+            for n, header in enumerate(purchase_headers)
+        )
+        sell_details = SellDetail.objects.bulk_create(
+            SellDetail(header=header, item=item, quantity=1) for header in sell_headers
+        )
+        SellAllocation.objects.bulk_create(
+            SellAllocation(sell_detail=sell, purchase_detail=lot, quantity=1)
+            for sell, lot in zip(sell_details, purchase_details)
+        )
+        rebuild_ledger(item)
+
+    def traced_peak(self, func):
+        """Peak memory of func() in MB (tracing is slow, so it is measured on a separate run)."""
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+
+    def test_report_with_many_transactions(self):
+        def run():
+            return StockReport(self.item, self.days[0], self.days[-1]).as_dict()
+        start = time.perf_counter()
+        report = run()
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(report['items']), self.TRANSACTIONS)
+        self.assertEqual(report['summary']['balance_qty'], 0)
+        del report
+        print(f"\nReport over {self.TRANSACTIONS} transactions in {elapsed:.2f}s, peak {self.traced_peak(run):.1f} MB")
+
+    def test_streamed_report_with_many_transactions(self):
+        def request():
+            return self.client.get('/report/I-001/stream/', {
+                'start_date': self.days[0].isoformat(), 'end_date': self.days[-1].isoformat(),
+            }).streaming_content
+        start = time.perf_counter()
+        chunks = iter(request())
+        size = len(next(chunks))
+        first_chunk = time.perf_counter() - start
+        size += sum(len(chunk) for chunk in chunks)
+        elapsed = time.perf_counter() - start
+        peak = self.traced_peak(lambda: sum(len(chunk) for chunk in request()))
+        print(f"\nStreamed {size / 2**20:.1f} MB in {elapsed:.2f}s, first chunk after "
+              f"{1000 * first_chunk:.0f} ms, peak {peak:.1f} MB")
+
+    def test_recent_report_with_snapshots(self):
+        start_date = self.days[-1] - timedelta(days=30)
+        def run():
+            start = time.perf_counter()
+            report = StockReport(self.item, start_date, self.days[-1]).as_dict()
+            return report, time.perf_counter() - start
+        replayed, without = run()
+        start = time.perf_counter()
+        created = build_snapshots(self.item, self.days[-1])
+        build = time.perf_counter() - start
+        report, with_snapshots = run()
+        self.assertEqual(report, replayed)
+        print(f"\nLast 30 days of {self.TRANSACTIONS} transactions: {1000 * without:.0f} ms replaying history, "
+              f"{1000 * with_snapshots:.0f} ms from a snapshot ({created} snapshots built in {build:.2f}s)")
+
+
+@unittest.skipUnless(BENCHMARKS, 'set WAREHOUSE_BENCHMARKS=1 to run')
+class IndexBenchmark(TestCase):
+    """List, report and sale latency with a million purchase details."""
+    ITEMS = 1000
+    HEADERS = 50_000
+    LINES = 20
+    YEARS = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = items = Item.objects.bulk_create(
+            Item(code=f'I-{n:04}', name=f'Item {n}', unit='Pcs', description='Bulk', stock=1, is_deleted=n % 50 == 0)
+            for n in range(cls.ITEMS)
+        )
+        days = 365 * cls.YEARS
+        headers = PurchaseHeader.objects.bulk_create((
+            PurchaseHeader(code=f'P-{n}', date=date(2020, 1, 1) + timedelta(days=n * days // cls.HEADERS),
+                           description='Buy', is_deleted=n % 100 == 0)
+            for n in range(cls.HEADERS)
+        ), batch_size=5000)
+        # All but the latest lot of each item are depleted
+        PurchaseDetail.objects.bulk_create((
+            PurchaseDetail(header=header, item=items[(n * cls.LINES + line) % cls.ITEMS], date=header.date,
+                           quantity=1, unit_price=10, remaining_quantity=int(n >= cls.HEADERS - cls.ITEMS // cls.LINES))
+            for n, header in enumerate(headers) for line in range(cls.LINES)
+        ), batch_size=5000)
+        call_command('backfill_ledger', stdout=io.StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def timed(self, func, runs=20):
+        """Median latency of func() in ms."""
+        latencies = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            func()
+            latencies.append(1000 * (time.perf_counter() - start))
+        return sorted(latencies)[runs // 2]
+
+    def test_latency_with_a_million_details(self):
+        client = APIClient()
+        item = self.items[1]
+        client.post('/sell/', {'code': 'S-1', 'date': '2025-01-01', 'description': 'Sell'}, format='json')
+        sold = iter(item for item in self.items if not item.is_deleted) # Each item has one unit left
+        results = {
+            'item list': self.timed(lambda: client.get('/items/')),
+            'one-year report': self.timed(lambda: client.get(f'/report/{item.code}/', {
+                'start_date': '2023-01-01', 'end_date': '2023-12-31'
+            })),
+            'sale': self.timed(lambda: client.post('/sell/S-1/details/', {
+                'item_code': next(sold).code, 'quantity': 1
+            }, format='json')),
+        }
+        self.assertEqual(SellDetail.objects.count(), 20)
+        rows = PurchaseDetail.objects.count()
+        print(f"\n{rows:,} purchase details: " + ', '.join(f"{name} {ms:.1f} ms" for name, ms in results.items()))
+
+    def test_valuation_of_all_items(self):
+        # Serial only: worker threads use their own connections and cannot see the test's data
+        start = time.perf_counter()
+        rows = sum(1 for _ in valuation.StockValuation(date(2024, 12, 31)).rows())
+        print(f"\nValuation of {rows} items over 1,000,000 purchase details in {time.perf_counter() - start:.2f}s")
+
+
+@unittest.skipUnless(BENCHMARKS, 'set WAREHOUSE_BENCHMARKS=1 to run')
+class ProfilingBenchmark(WarehouseTestCase):
+    """Cost of the profiling middleware on a fast (cached) request."""
+    ROUNDS = 20
+    REQUESTS = 200
+
+    def test_middleware_overhead(self):
+        install_hooks()
+        without = [name for name in settings.MIDDLEWARE if name != 'api.profiling.ProfilingMiddleware']
+        configs = {
+            'without middleware': {'MIDDLEWARE': without},
+            'sampling off': {'WAREHOUSE_PROFILING': {'SAMPLE_RATE': 0.0, 'ALLOW_HEADER': False}},
+            'every request profiled': {'WAREHOUSE_PROFILING': {'SAMPLE_RATE': 1.0}},
+        }
+        clients = {}
+        for name, options in configs.items():
+            with override_settings(**options):
+                clients[name] = client = APIClient()
+                client.get('/items/I-001/') # Loads the middleware chain and fills the cache
+        # Rounds alternate between the configurations so drift affects them all alike
+        timings = {name: [] for name in configs}
+        for _ in range(self.ROUNDS):
+            for name, client in clients.items():
+                start = time.perf_counter()
+                for _ in range(self.REQUESTS):
+                    client.get('/items/I-001/')
+                timings[name].append((time.perf_counter() - start) / self.REQUESTS)
+        medians = {name: sorted(values)[self.ROUNDS // 2] for name, values in timings.items()}
+        baseline = medians['without middleware']
+        print('\nGET /items/{code}/: ' + ', '.join(
+            f"{name} {1e6 * seconds:.0f} us ({100 * (seconds / baseline - 1):+.1f}%)" for name, seconds in medians.items()
+        ))
+
+
+class ParallelValuationTests(TransactionTestCase):
+
+    def test_parallel_valuation_matches_serial(self):
+        items = Item.objects.bulk_create(
+            Item(code=f'I-{n:03}', name=f'Item {n}', unit='Pcs', description='Books') for n in range(25)
+        )
+        purchase_header = PurchaseHeader.objects.create(code='P-001', date=date(2025, 1, 1), description='Buy')
+        sell_header = SellHeader.objects.create(code='S-001', date=date(2025, 2, 1), description='Sell')
+        for n, item in enumerate(items):
+            post_purchase(purchase_header, item, 10, Decimal(10 + n))
+            post_sale(sell_header, item, n % 10)
+
+        serial = list(valuation.StockValuation(date(2025, 12, 31)).rows())
+        with unittest.mock.patch.object(valuation, 'RANGE_SIZE', 4):
+            parallel = valuation.StockValuation(date(2025, 12, 31), workers=3)
+            self.assertEqual(list(parallel.rows()), serial)
+        self.assertEqual(parallel.summary['closing_qty'], sum(10 - n % 10 for n in range(25)))
+
+
+class ReportWorkerTests(ReportJobDirMixin, TransactionTestCase):
+
+    def test_worker_runs_queued_jobs_in_its_pool(self):
+        self.use_temporary_job_dir()
+        item = Item.objects.create(code='I-001', name='History Book', unit='Pcs', description='Books')
+        header = PurchaseHeader.objects.create(code='P-001', date=date(2025, 1, 1), description='Buy')
+        post_purchase(header, item, 10, Decimal(60))
+        for month in range(1, 6):
+            ReportJob.objects.create(item=item, start_date=date(2025, month, 1), end_date=date(2025, 12, 31))
+        stale = ReportJob.objects.create(item=item, start_date=date(2024, 1, 1), end_date=date(2025, 12, 31),
+                                         status=ReportJob.RUNNING, started_at=timezone.now() - timedelta(days=1))
+
+        call_command('report_worker', '--threads', '2', '--poll', '0.01', '--once', stdout=io.StringIO())
+        self.assertEqual(set(ReportJob.objects.values_list('status', flat=True)), {ReportJob.DONE})
+        stale.refresh_from_db()
+        self.assertGreater(stale.started_at, timezone.now() - timedelta(hours=1)) # Requeued and run again
+
+
+class ConcurrentPostingTests(TransactionTestCase):
+    """Many threads posting sales and purchases for one item at the same time."""
+    THREADS = 8
+    SALES_PER_THREAD = 10
+
+    def test_concurrent_postings_keep_balances_consistent(self):
+        item = Item.objects.create(code='I-001', name='History Book', unit='Pcs', description='Books')
+        purchase_header = PurchaseHeader.objects.create(code='P-001', date=date(2025, 1, 1), description='Buy')
+        sell_header = SellHeader.objects.create(code='S-001', date=date(2025, 2, 1), description='Sell')
+        for price in range(10, 30):
+            post_purchase(purchase_header, item, 10, Decimal(price))
+        posting_metrics.reset()
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(self.SALES_PER_THREAD):
+                    post_sale(sell_header, item, 2)
+                    if i % 5 == 0:
+                        post_purchase(purchase_header, item, 1, Decimal(40 + n))
+            except Exception as exc: # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(errors, [])
+        sold = self.THREADS * self.SALES_PER_THREAD * 2
+        bought = 200 + self.THREADS * 2
+        item.refresh_from_db()
+        self.assertEqual(item.stock, bought - sold)
+        self.assertEqual(SellAllocation.objects.aggregate(total=Sum('quantity'))['total'], sold)
+        lots = PurchaseDetail.objects.aggregate(
+            remaining=Sum('remaining_quantity'),
+            value=Sum(F('remaining_quantity') * F('unit_price')),
+        )
+        self.assertEqual(lots['remaining'], item.stock)
+        self.assertEqual(lots['value'], item.balance)
+        if BENCHMARKS:
+            metrics = posting_metrics.snapshot()
+            print(f"\n{metrics['postings']} postings in {elapsed:.2f}s "
+                  f"({metrics['postings'] / elapsed:.0f}/s), {metrics['retries']} retries, "
+                  f"lock wait avg {metrics['lock_wait_avg_ms']:.2f} ms, max {metrics['lock_wait_max_ms']:.2f} ms")
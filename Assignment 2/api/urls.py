@@ -1,15 +1,25 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ItemViewSet, PurchaseHeaderViewSet, SellHeaderViewSet, PurchaseDetailListCreate, SellDetailListCreate, ReportView
+from . import async_views
+from .views import ItemViewSet, PurchaseHeaderViewSet, SellHeaderViewSet, PurchaseDetailListCreate, SellDetailListCreate, ReportView, ReportStreamView, BalanceView, ValuationStreamView, ReportJobViewSet, MetricsView
 
 router = DefaultRouter()
 router.register(r'items', ItemViewSet, basename='item')
 router.register(r'purchase', PurchaseHeaderViewSet, basename='purchase')
 router.register(r'sell', SellHeaderViewSet, basename='sell')
+router.register(r'report-jobs', ReportJobViewSet, basename='report-job')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('purchase/<str:header_code>/details/', PurchaseDetailListCreate.as_view(), name='purchase-details'),
     path('sell/<str:header_code>/details/', SellDetailListCreate.as_view(), name='sell-details'),
     path('report/<str:item_code>/', ReportView.as_view(), name='report'),
+    path('report/<str:item_code>/stream/', ReportStreamView.as_view(), name='report-stream'),
+    path('balance/<str:item_code>/', BalanceView.as_view(), name='balance'),
+    path('valuation/', ValuationStreamView.as_view(), name='valuation'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    # Async read endpoints, for ASGI servers
+    path('async/items/', async_views.item_list, name='async-item-list'),
+    path('async/items/<str:code>/', async_views.item_detail, name='async-item-detail'),
+    path('async/report/<str:item_code>/', async_views.report, name='async-report'),
 ]
\ No newline at end of file
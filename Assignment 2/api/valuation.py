@@ -0,0 +1,180 @@
+import csv
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from django.db import connection
+from django.db.models import DecimalField, F, Q, Sum
+from .models import Item, PurchaseDetail, SellAllocation
+from .reports import CHUNK_SIZE, _Echo
+
+RANGE_SIZE = 1000 # Items per range when the valuation runs in parallel
+
+COLUMNS = [
+    'item_code', 'name', 'unit',
+    'opening_qty', 'opening_value',
+    'in_qty', 'in_value',
+    'out_qty', 'out_value',
+    'closing_qty', 'closing_value'
+]
+AMOUNTS = COLUMNS[3:]
+
+def _sum(expression, condition):
+    return Sum(expression, filter=condition, default=0, output_field=DecimalField(max_digits=30, decimal_places=2))
+
+def purchase_totals(start, end, id_range=None):
+    """Purchased quantity and value per item before start and from start to end, ordered by item id."""
+    queryset = PurchaseDetail.objects.filter(date__lte=end, header__is_deleted=False)
+    if id_range is not None:
+        queryset = queryset.filter(item_id__gte=id_range[0], item_id__lte=id_range[1])
+    value = F('quantity') * F('unit_price')
+    before, during = Q(date__lt=start), Q(date__gte=start)
+    return queryset.values('item_id').annotate(
+        opening_qty=_sum('quantity', before),
+        opening_value=_sum(value, before),
+        period_qty=_sum('quantity', during),
+        period_value=_sum(value, during)
+    ).order_by('item_id')
+
+def sale_totals(start, end, id_range=None):
+    """
+    Sold quantity and FIFO cost per item before start and from start to end,
+    ordered by item id. Each allocation is valued at the price of the lot it
+    depleted.
+    """
+    queryset = SellAllocation.objects.filter(
+        sell_detail__header__date__lte=end,
+        sell_detail__header__is_deleted=False
+    )
+    if id_range is not None:
+        queryset = queryset.filter(sell_detail__item_id__gte=id_range[0], sell_detail__item_id__lte=id_range[1])
+    value = F('quantity') * F('purchase_detail__unit_price')
+    before, during = Q(sell_detail__header__date__lt=start), Q(sell_detail__header__date__gte=start)
+    return queryset.values(item_id=F('sell_detail__item_id')).annotate(
+        opening_qty=_sum('quantity', before),
+        opening_value=_sum(value, before),
+        period_qty=_sum('quantity', during),
+        period_value=_sum(value, during)
+    ).order_by('item_id')
+
+def _by_item(rows):
+    """Wrap rows ordered by item_id so they can be looked up in item id order."""
+    rows = iter(rows)
+    current = next(rows, None)
+    def take(item_id):
+        nonlocal current
+        while current is not None and current['item_id'] < item_id:
+            current = next(rows, None)
+        if current is not None and current['item_id'] == item_id:
+            return current
+        return None
+    return take
+
+def valuation_rows(start, end, id_range=None):
+    """
+    Yield one valuation row per live item (in id order) from three queries:
+    the items, purchase totals and sale totals, all grouped and ordered by
+    the database and merged here. The closing value is the value of the open
+    FIFO lots on the end date: everything purchased minus the cost of what
+    was sold, both up to the end date.
+    """
+    items = Item.objects.filter(is_deleted=False)
+    if id_range is not None:
+        items = items.filter(pk__gte=id_range[0], pk__lte=id_range[1])
+    bought = _by_item(purchase_totals(start, end, id_range).iterator(chunk_size=CHUNK_SIZE))
+    sold = _by_item(sale_totals(start, end, id_range).iterator(chunk_size=CHUNK_SIZE))
+    empty = {'opening_qty': 0, 'opening_value': Decimal(0), 'period_qty': 0, 'period_value': Decimal(0)}
+
+    for item in items.values('id', 'code', 'name', 'unit').order_by('id').iterator(chunk_size=CHUNK_SIZE):
+        purchases = bought(item['id']) or empty
+        sales = sold(item['id']) or empty
+        opening_qty = int(purchases['opening_qty'] - sales['opening_qty'])
+        opening_value = purchases['opening_value'] - sales['opening_value']
+        yield {
+            'item_code': item['code'],
+            'name': item['name'],
+            'unit': item['unit'],
+            'opening_qty': opening_qty,
+            'opening_value': float(opening_value),
+            'in_qty': int(purchases['period_qty']),
+            'in_value': float(purchases['period_value']),
+            'out_qty': int(sales['period_qty']),
+            'out_value': float(sales['period_value']),
+            'closing_qty': opening_qty + int(purchases['period_qty'] - sales['period_qty']),
+            'closing_value': float(opening_value + purchases['period_value'] - sales['period_value'])
+        }
+
+def item_ranges(size=RANGE_SIZE):
+    """Split the live items into (first_id, last_id) ranges of about size items."""
+    ids = list(Item.objects.filter(is_deleted=False).order_by('id').values_list('id', flat=True))
+    return [(ids[n], ids[min(n + size, len(ids)) - 1]) for n in range(0, len(ids), size)]
+
+def _range_rows(start, end, id_range):
+    """All valuation rows of one item range, computed in a worker thread with its own connection."""
+    try:
+        return list(valuation_rows(start, end, id_range))
+    finally:
+        connection.close()
+
+class StockValuation:
+    """
+    FIFO stock valuation of every item for a period: opening stock on the
+    start date, purchases and sales in the period and closing stock on the
+    end date, in quantity and value. With workers > 1 the items are split
+    into id ranges that are valued concurrently, each on its own database
+    connection; rows are still returned in item order.
+    """
+    STREAM_BATCH = 200 # Rows joined into each chunk of a streamed response
+
+    def __init__(self, end_date, start_date=None, workers=1):
+        self.start_date = start_date or date.min
+        self.end_date = end_date
+        self.workers = workers
+        self.summary = dict.fromkeys(AMOUNTS, 0)
+
+    def rows(self):
+        """Yield one row per item. The summary is complete once the generator is exhausted."""
+        if self.workers > 1:
+            with ThreadPoolExecutor(self.workers) as pool:
+                ranges = item_ranges()
+                results = pool.map(_range_rows, [self.start_date] * len(ranges), [self.end_date] * len(ranges), ranges)
+                rows = (row for chunk in results for row in chunk)
+                yield from self._summed(rows)
+        else:
+            yield from self._summed(valuation_rows(self.start_date, self.end_date))
+
+    def _summed(self, rows):
+        summary = self.summary
+        for row in rows:
+            for column in AMOUNTS:
+                summary[column] += row[column]
+            yield row
+
+    def _batched(self, lines):
+        """Join lines into chunks of STREAM_BATCH, so the server writes fewer, larger chunks."""
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= self.STREAM_BATCH:
+                yield ''.join(batch)
+                batch = []
+        if batch:
+            yield ''.join(batch)
+
+    def stream_ndjson(self):
+        """Yield one JSON line per item and a trailing {"summary": ...} line."""
+        def lines():
+            for row in self.rows():
+                yield json.dumps(row) + '\n'
+            yield json.dumps({'summary': self.summary}) + '\n'
+        return self._batched(lines())
+
+    def stream_csv(self):
+        """Yield a CSV row per item and a trailing summary row."""
+        writer = csv.writer(_Echo())
+        def lines():
+            yield writer.writerow(COLUMNS)
+            for row in self.rows():
+                yield writer.writerow([row[column] for column in COLUMNS])
+            yield writer.writerow(['', 'Summary', ''] + [self.summary[column] for column in AMOUNTS])
+        return self._batched(lines())
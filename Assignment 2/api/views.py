@@ -1,33 +1,91 @@
-from rest_framework import viewsets, generics
+from django.db.models import Prefetch
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import viewsets, generics, mixins, status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Item, PurchaseHeader, SellHeader, PurchaseDetail, SellDetail, SellAllocation
-from .serializers import ItemSerializer, PurchaseHeaderSerializer, SellHeaderSerializer, PurchaseDetailSerializer, SellDetailSerializer
-from datetime import datetime
+from .jobs import job_dir, submit_job
+from .ledger import balance_at
+from .models import Item, PurchaseHeader, SellHeader, PurchaseDetail, SellDetail, ReportJob
+from .serializers import (
+    ItemSerializer, PurchaseHeaderSerializer, SellHeaderSerializer, PurchaseDetailSerializer, SellDetailSerializer,
+    BulkPurchaseHeaderSerializer, BulkSellHeaderSerializer, ReportJobSerializer, requested_fields
+)
+from .cache import cache_metrics, get_item, get_report_dict
+from .conditional import ConditionalGetMixin, conditional_get, ledger_item
+from .profiling import request_metrics
+from .services import posting_metrics
+from .reports import StockReport
+from .valuation import StockValuation
+from datetime import date, datetime
 
-class ItemViewSet(viewsets.ModelViewSet):
+class ItemViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
-    CRUD operations for Items.
+    CRUD operations for Items. GET requests are conditional (ETag).
     """
-    queryset = Item.objects.filter(is_deleted=False)
+    ordering = ('code',) # Pagination order, served by item_live_idx
+    queryset = Item.objects.order_by(*ordering)
     serializer_class = ItemSerializer
     lookup_field = 'code'
 
-class PurchaseHeaderViewSet(viewsets.ModelViewSet):
+def bulk_create_documents(request, serializer_class):
+    """Validate and post a list of headers with nested details in one transaction."""
+    serializer = serializer_class(data=request.data, many=True)
+    serializer.is_valid(raise_exception=True)
+    headers = serializer.save()
+    return Response({
+        "headers": len(headers),
+        "details": sum(len(document['details']) for document in serializer.validated_data)
+    }, status=status.HTTP_201_CREATED)
+
+def prefetch_details(queryset, request, detail_model):
+    """
+    Prefetch the details of the headers with their items (two queries for a
+    whole page), unless ?fields= leaves the details out.
+    """
+    fields = requested_fields(request)
+    if fields is not None and 'details' not in fields:
+        return queryset
+    return queryset.prefetch_related(
+        Prefetch('details', queryset=detail_model.objects.select_related('item').order_by('id'))
+    )
+
+class PurchaseHeaderViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
-    CRUD operations for Purchase Headers.
+    CRUD operations for Purchase Headers. GET requests are conditional (ETag).
     """
-    queryset = PurchaseHeader.objects.filter(is_deleted=False)
+    ordering = ('date', 'id') # Pagination order, served by purchase_header_live_idx
+    queryset = PurchaseHeader.objects.order_by(*ordering)
     serializer_class = PurchaseHeaderSerializer
     lookup_field = 'code'
+    detail_model = PurchaseDetail
+
+    def get_queryset(self):
+        return prefetch_details(super().get_queryset(), self.request, PurchaseDetail)
 
-class SellHeaderViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create many purchase headers with their details (POST /purchase/bulk/)."""
+        return bulk_create_documents(request, BulkPurchaseHeaderSerializer)
+
+class SellHeaderViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
-    CRUD operations for Sell Headers.
+    CRUD operations for Sell Headers. GET requests are conditional (ETag).
     """
-    queryset = SellHeader.objects.filter(is_deleted=False)
+    ordering = ('date', 'id') # Pagination order, served by sell_header_live_idx
+    queryset = SellHeader.objects.order_by(*ordering)
     serializer_class = SellHeaderSerializer
     lookup_field = 'code'
+    detail_model = SellDetail
+
+    def get_queryset(self):
+        return prefetch_details(super().get_queryset(), self.request, SellDetail)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create many sell headers with their details (POST /sell/bulk/)."""
+        return bulk_create_documents(request, BulkSellHeaderSerializer)
 
 class PurchaseDetailListCreate(generics.ListCreateAPIView):
     """
@@ -38,12 +96,12 @@ class PurchaseDetailListCreate(generics.ListCreateAPIView):
     def get_queryset(self):
         """Filter details by header code, excluding deleted records."""
         header_code = self.kwargs['header_code']
-        return PurchaseDetail.objects.filter(header__code=header_code, header__is_deleted=False, is_deleted=False)
+        return PurchaseDetail.objects.filter(header__code=header_code, header__is_deleted=False).select_related('item')
     
     def get_serializer_context(self):
         """Pass header to serializer context."""
         context = super().get_serializer_context()
-        context['header'] = PurchaseHeader.objects.get(code=self.kwargs['header_code'], is_deleted=False)
+        context['header'] = PurchaseHeader.objects.get(code=self.kwargs['header_code'])
         return context
 
 class SellDetailListCreate(generics.ListCreateAPIView):
@@ -55,181 +113,173 @@ class SellDetailListCreate(generics.ListCreateAPIView):
     def get_queryset(self):
         """Filter details by header code, excluding deleted records."""
         header_code = self.kwargs['header_code']
-        return SellDetail.objects.filter(header__code=header_code, header__is_deleted=False, is_deleted=False)
+        return SellDetail.objects.filter(header__code=header_code, header__is_deleted=False).select_related('item')
     
     def get_serializer_context(self):
         """Pass header to serializer context."""
         context = super().get_serializer_context()
-        context['header'] = SellHeader.objects.get(code=self.kwargs['header_code'], is_deleted=False)
+        context['header'] = SellHeader.objects.get(code=self.kwargs['header_code'])
         return context
 
+class ReportError(Exception):
+    """Invalid report request; carries the error message and HTTP status."""
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def report_dates(params):
+    """The start and end dates of a report request."""
+    try:
+        start_date = datetime.strptime(params.get('start_date'), '%Y-%m-%d').date()
+        end_date = datetime.strptime(params.get('end_date'), '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        raise ReportError("Invalid date format. Use YYYY-MM-DD.", 400)
+    return start_date, end_date
+
+def get_report(params, item_code, item=None):
+    """Build a StockReport from the request query parameters, for item if it was loaded already."""
+    start_date, end_date = report_dates(params)
+    if item is None:
+        try:
+            item = get_item(item_code)
+        except Item.DoesNotExist:
+            raise ReportError("Item not found.", 404)
+    return StockReport(item, start_date, end_date)
+
 class ReportView(APIView):
     """
-    Generate a stock report for an item over a date range.
+    Generate a stock report for an item over a date range. Conditional: a
+    poll with a matching If-None-Match gets 304 without building the report.
     """
     def get(self, request, item_code):
-        # Parse query parameters
-        start_date_str = request.query_params.get('start_date')
-        end_date_str = request.query_params.get('end_date')
+        item = ledger_item(item_code)
+        if item is None:
+            return self.report(request, item_code) # 404
+        version = (item.pk, item.updated_at, item.last_movement)
+        return conditional_get(request, version, item.updated_at, lambda: self.report(request, item_code, item))
+
+    def report(self, request, item_code, item=None):
         try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-        except (ValueError, TypeError):
+            report = get_report(request.query_params, item_code, item)
+        except ReportError as error:
+            return Response({"error": error.message}, status=error.status)
+        return Response({"result": get_report_dict(report)})
+
+class BalanceView(APIView):
+    """
+    Stock quantity and value of an item at the end of a date (default: today),
+    read from the stock ledger.
+    """
+    def get(self, request, item_code):
+        try:
+            day = request.query_params.get('date')
+            day = datetime.strptime(day, '%Y-%m-%d').date() if day else date.today()
+        except ValueError:
             return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
-        
-        # Fetch item
         try:
-            item = Item.objects.get(code=item_code, is_deleted=False)
+            item = get_item(item_code)
         except Item.DoesNotExist:
             return Response({"error": "Item not found."}, status=404)
-        
-        # Initialize stock state before start_date
-        initial_purchases = PurchaseDetail.objects.filter(
-            item=item,
-            header__date__lt=start_date,
-            header__is_deleted=False
-        ).order_by('header__date')
-        stock_queue = [(pd, pd.remaining_quantity) for pd in initial_purchases if pd.remaining_quantity > 0]
-
-        # Fetch transactions within date range
-        purchases = PurchaseDetail.objects.filter(
-            item=item,
-            header__date__gte=start_date,
-            header__date__lte=end_date,
-            header__is_deleted=False
-        )
-        sell_allocations = SellAllocation.objects.filter(
-            sell_detail__item=item,
-            sell_detail__header__date__gte=start_date,
-            sell_detail__header__date__lte=end_date,
-            sell_detail__header__is_deleted=False
+        balance_qty, balance = balance_at(item, day)
+        return Response({"result": {
+            "item_code": item.code,
+            "date": day.isoformat(),
+            "balance_qty": balance_qty,
+            "balance": float(balance)
+        }})
+
+class ReportStreamView(View):
+    """
+    Stream a stock report as NDJSON (default) or CSV (?format=csv).
+    Transactions are written as they are computed, so memory use does not
+    grow with the date range. A plain Django view, so DRF content negotiation
+    does not claim the format parameter.
+    """
+    FORMATS = {
+        'ndjson': ('application/x-ndjson', 'stream_ndjson'),
+        'csv': ('text/csv', 'stream_csv'),
+    }
+
+    def get(self, request, item_code):
+        output = request.GET.get('format', 'ndjson')
+        if output not in self.FORMATS:
+            return JsonResponse({"error": "Invalid format. Use ndjson or csv."}, status=400)
+        try:
+            report = get_report(request.GET, item_code)
+        except ReportError as error:
+            return JsonResponse({"error": error.message}, status=error.status)
+
+        content_type, method = self.FORMATS[output]
+        response = StreamingHttpResponse(getattr(report, method)(), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="report-{item_code}.{output}"'
+        response['X-Accel-Buffering'] = 'no' # Ask nginx not to buffer the stream
+        return response
+
+class ValuationStreamView(View):
+    """
+    Stream the FIFO valuation of all items as NDJSON (default) or CSV
+    (?format=csv): stock on start_date (optional), movements up to end_date
+    and closing stock on end_date.
+    """
+    FORMATS = ReportStreamView.FORMATS
+
+    def get(self, request):
+        output = request.GET.get('format', 'ndjson')
+        if output not in self.FORMATS:
+            return JsonResponse({"error": "Invalid format. Use ndjson or csv."}, status=400)
+        try:
+            end_date = datetime.strptime(request.GET.get('end_date', ''), '%Y-%m-%d').date()
+            start_date = request.GET.get('start_date')
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        except ValueError:
+            return JsonResponse({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
+
+        valuation = StockValuation(end_date, start_date)
+        content_type, method = self.FORMATS[output]
+        response = StreamingHttpResponse(getattr(valuation, method)(), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="valuation-{end_date}.{output}"'
+        response['X-Accel-Buffering'] = 'no' # Ask nginx not to buffer the stream
+        return response
+
+class ReportJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Background stock reports: POST queues a job (or returns the pending job
+    for the same item and range), GET polls its status and GET .../result/
+    downloads the finished report as gzipped NDJSON.
+    """
+    queryset = ReportJob.objects.select_related('item')
+    serializer_class = ReportJobSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        job, created = submit_job(data['item_code'], data['start_date'], data['end_date'])
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK
         )
 
-        # Create ordered list of events
-        events = []
-        for pd in purchases:
-            events.append({
-                'type': 'purchase',
-                'date': pd.header.date,
-                'description': pd.header.description,
-                'code': pd.header.code,
-                'detail': pd
-            })
-        for allocation in sell_allocations:
-            events.append({
-                'type': 'sell',
-                'date': allocation.sell_detail.header.date,
-                'description': allocation.sell_detail.header.description,
-                'code': allocation.sell_detail.header.code,
-                'allocation': allocation
-            })
-        events.sort(key=lambda x: x['date'])
-
-        # Initialize report structure
-        report = {
-            'item_code': item.code,
-            'name': item.name,
-            'unit': item.unit,
-            'items': [],
-            'summary': {
-                'in_qty': 0,
-                'out_qty': 0,
-                'balance_qty': 0,
-                'balance': 0
-            }
-        }
-
-        # Current stock state
-        current_stock = [
-            {'qty': qty, 'price': float(pd.unit_price), 'total': float(qty * pd.unit_price)}
-            for pd, qty in stock_queue if qty > 0
-        ]
-        balance_qty = sum(stock['qty'] for stock in current_stock)
-        balance = sum(stock['total'] for stock in current_stock)
-
-        # Process each event
-        for event in events:
-            transaction = {
-                "date": event['date'].strftime('%d-%m-%Y'),
-                "description": event['description'],
-                "code": event['code'],
-                "in_qty": 0,
-                "in_price": 0,
-                "in_total": 0,
-                "out_qty": 0,
-                "out_price": 0,
-                "out_total": 0,
-                "stock_qty": [stock['qty'] for stock in current_stock],
-                "stock_price": [stock['price'] for stock in current_stock],
-                "stock_total": [stock['total'] for stock in current_stock],
-                "balance_qty": balance_qty,
-                "balance": balance
-            }
-
-            if event['type'] == 'purchase':
-                pd = event['detail']
-                in_qty = pd.quantity
-                in_price = float(pd.unit_price)
-                in_total = float(in_qty * in_price)
-                transaction.update({
-                    "in_qty": in_qty,
-                    "in_price": in_price,
-                    "in_total": in_total
-                })
-                # Update stock
-                current_stock.append({
-                    'qty': in_qty,
-                    'price': in_price,
-                    'total': in_total
-                })
-                balance_qty += in_qty
-                balance += in_total
-                report['summary']['in_qty'] += in_qty
-            
-            elif event['type'] == 'sell':
-                allocation = event['allocation']
-                pd = allocation.purchase_detail
-                qty = allocation.quantity
-                out_price = float(pd.unit_price)
-                out_total = float(qty * out_price)
-                transaction.update({
-                    "out_qty": qty,
-                    "out_price": out_price,
-                    "out_total": out_total
-                })
-                # Update stock: reduce or remove depleted batch
-                for stock in current_stock[:]:  # Use a copy to modify while iterating
-                    if stock['price'] == out_price and stock['qty'] > 0:
-                        if stock['qty'] > qty:
-                            stock['qty'] -= qty
-                            stock['total'] = float(stock['qty'] * stock['price'])
-                            qty = 0
-                        else:
-                            qty -= stock['qty']
-                            stock['qty'] = 0
-                            stock['total'] = 0
-                        if qty <= 0:
-                            break
-                # Remove depleted batches
-                current_stock = [stock for stock in current_stock if stock['qty'] > 0]
-                balance_qty -= allocation.quantity
-                balance -= out_total
-                report['summary']['out_qty'] += allocation.quantity
-            
-            # Update transaction with new stock state
-            transaction.update({
-                "stock_qty": [stock['qty'] for stock in current_stock],
-                "stock_price": [stock['price'] for stock in current_stock],
-                "stock_total": [stock['total'] for stock in current_stock],
-                "balance_qty": balance_qty,
-                "balance": balance
-            })
-            report['items'].append(transaction)
-
-        # Update summary
-        report['summary'].update({
-            "balance_qty": balance_qty,
-            "balance": balance
-        })
+    @action(detail=True, methods=['get'])
+    def result(self, request, pk=None):
+        job = self.get_object()
+        if job.status != ReportJob.DONE:
+            return Response({"error": f"Report job is {job.status}."}, status=status.HTTP_409_CONFLICT)
+        try:
+            result = open(job_dir() / job.result_file, 'rb')
+        except FileNotFoundError:
+            return Response({"error": "Report file no longer exists."}, status=status.HTTP_410_GONE)
+        return FileResponse(result, as_attachment=True, filename=job.result_file, content_type='application/gzip')
 
-        return Response({"result": report})
+class MetricsView(APIView):
+    """
+    In-process metrics of this worker: request latency percentiles per URL
+    name, cache hit rates and posting counters.
+    """
+    def get(self, request):
+        return Response({
+            "requests": request_metrics.snapshot(),
+            "cache": cache_metrics.snapshot(),
+            "postings": posting_metrics.snapshot()
+        })
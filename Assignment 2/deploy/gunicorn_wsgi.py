@@ -0,0 +1,31 @@
+"""
+Gunicorn configuration for serving the API over WSGI with threaded workers,
+the baseline for the ASGI profile in gunicorn_asgi.py.
+
+Run with:
+    pip install gunicorn
+    gunicorn -c deploy/gunicorn_wsgi.py warehouse.wsgi:application
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('WAREHOUSE_BIND', '127.0.0.1:8000')
+# Cached items and reports are invalidated by bumping versions in the cache
+# (api/cache.py). The default cache is local memory per process, where a bump
+# in one worker never reaches the others, so several workers need the shared
+# Redis cache (WAREHOUSE_REDIS_URL).
+shared_cache = bool(os.environ.get('WAREHOUSE_REDIS_URL'))
+workers = int(os.environ.get('WAREHOUSE_WORKERS', multiprocessing.cpu_count() * 2 + 1 if shared_cache else 1))
+if workers > 1 and not shared_cache:
+    raise SystemExit(
+        f"WAREHOUSE_WORKERS={workers} needs a shared cache: set WAREHOUSE_REDIS_URL, "
+        "or run a single worker, since the local memory cache is per process."
+    )
+worker_class = 'gthread'
+threads = int(os.environ.get('WAREHOUSE_THREADS', 4)) # Requests handled at once by each worker
+keepalive = 5
+backlog = 2048
+max_requests = 10_000
+max_requests_jitter = 1000
+graceful_timeout = 30
+timeout = 60
@@ -0,0 +1,157 @@
+"""
+Load test for the API: sends GET requests to one or more URLs from many
+concurrent keep-alive connections and reports latency percentiles and
+requests per second for each. Use it to compare the WSGI endpoints with
+their async versions, e.g. /items/ on a gunicorn_wsgi.py server and
+/async/items/ on a gunicorn_asgi.py server.
+
+Run with:
+    python loadtest.py URL [URL ...] [--concurrency N] [--duration S] [--output results.json]
+
+    python loadtest.py http://127.0.0.1:8001/items/ http://127.0.0.1:8002/async/items/ --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+class HTTPClient:
+    """A minimal HTTP/1.1 client on one connection, reconnecting when the server closes it."""
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        self.request = (
+            f"GET {self.path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+            f"Accept: application/json\r\nConnection: keep-alive\r\n\r\n"
+        ).encode()
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def get(self):
+        """Send the request and read the whole response. Returns the status code."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(self.request)
+        status, keep_alive = await asyncio.wait_for(self._response(), self.timeout)
+        if not keep_alive:
+            self.close()
+        return status
+
+    async def _response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by the server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        if 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while size := int((await self.reader.readline()).split(b';')[0], 16):
+                await self.reader.readexactly(size + 2) # Chunk and its CRLF
+            while await self.reader.readline() not in (b'\r\n', b'\n', b''): # Trailers
+                pass
+        else:
+            await self.reader.read() # Body ends when the connection closes
+            return status, False
+        return status, headers.get('connection') != 'close'
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def _connection(url, deadline, latencies, errors, timeout):
+    """Send requests one after another on one connection until the deadline."""
+    client = HTTPClient(url, timeout)
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await client.get()
+            except (OSError, EOFError, ValueError, IndexError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                client.close()
+                errors['connection'] += 1
+                continue
+            if status >= 400:
+                errors['status'] += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+    finally:
+        client.close()
+
+
+async def run(url, concurrency, duration, timeout=30.0):
+    """Load url from concurrency connections for duration seconds and return the results."""
+    latencies, errors = [], {'connection': 0, 'status': 0}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(_connection(url, deadline, latencies, errors, timeout) for _ in range(concurrency)))
+    return summarize(url, concurrency, latencies, errors, time.perf_counter() - start)
+
+
+def percentile(values, fraction):
+    """The value at fraction (0-1) of sorted values, by the nearest-rank method."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+def summarize(url, concurrency, latencies, errors, elapsed):
+    latencies.sort()
+    to_ms = lambda value: None if value is None else round(value * 1000, 2)
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': to_ms(percentile(latencies, 0.50)),
+        'p95_ms': to_ms(percentile(latencies, 0.95)),
+        'p99_ms': to_ms(percentile(latencies, 0.99)),
+        'max_ms': to_ms(latencies[-1] if latencies else None),
+    }
+
+
+def report(result, baseline=None):
+    errors = sum(result['errors'].values())
+    line = (f"{result['url']:<48}{result['requests']:>8} req {result['rps']:>9.1f} req/s"
+            f"  p50 {result['p50_ms'] or 0:8.2f} ms  p99 {result['p99_ms'] or 0:8.2f} ms  {errors:>5} errors")
+    if baseline is not None and baseline['rps']:
+        line += f"  ({result['rps'] / baseline['rps']:4.2f}x)"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test API endpoints and compare them.")
+    parser.add_argument('urls', nargs='+', help="URLs to load, one after another. The first is the baseline.")
+    parser.add_argument('--concurrency', type=int, default=100, help="Concurrent connections per URL.")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds to load each URL.")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Seconds of unrecorded load before each URL.")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Seconds before a request counts as failed.")
+    parser.add_argument('--output', help="Write the results to this file as JSON.")
+    args = parser.parse_args()
+
+    results = []
+    for url in args.urls:
+        if args.warmup:
+            asyncio.run(run(url, args.concurrency, args.warmup, args.timeout))
+        result = asyncio.run(run(url, args.concurrency, args.duration, args.timeout))
+        report(result, results[0] if results else None)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.profiling.ProfilingMiddleware', # First, so it times the whole request
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,6 +74,20 @@ TEMPLATES = [
 WSGI_APPLICATION = 'warehouse.wsgi.application'
 
 
+# Django REST Framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    # Keyset pagination on each view's `ordering`, see api/pagination.py
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+}
+
+# The bulk endpoints take a whole export in one request body; 5,000 headers of
+# 10 lines is about 3.3 MiB of JSON, over Django's 2.5 MiB default
+DATA_UPLOAD_MAX_MEMORY_SIZE = 32 * 1024 * 1024
+
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
@@ -79,7 +95,68 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so concurrent
+            # postings queue on the busy timeout instead of failing on upgrade
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file-backed test database uses SQLite's normal locking, which the
+        # concurrent posting tests rely on (in-memory shared cache does not wait)
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Item rows and report results are cached with exact, version-based
+# invalidation (see api/cache.py), so entries never expire on a timer.
+# Set WAREHOUSE_REDIS_URL to share the cache between processes.
+
+if os.environ.get('WAREHOUSE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['WAREHOUSE_REDIS_URL'],
+            'TIMEOUT': None,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'TIMEOUT': None,
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
     }
+
+WAREHOUSE_CACHE = 'default' # Cache alias used by api/cache.py
+
+
+# Background report jobs (see api/jobs.py and the report_worker command)
+
+REPORT_JOB_DIR = BASE_DIR / 'report_jobs'
+
+
+# Soft-deleted rows older than this are moved to the archive tables by the
+# archive_deleted command (see api/archive.py)
+
+WAREHOUSE_ARCHIVE_AFTER_DAYS = 90
+
+
+# Request profiling (see api/profiling.py): latency per URL name for every
+# request, and queries, N+1 detection and serializer time for a sample.
+# Sampling adds a few microseconds per query; with SAMPLE_RATE 0 only the
+# latency is recorded.
+
+WAREHOUSE_PROFILING = {
+    'SAMPLE_RATE': float(os.environ.get('WAREHOUSE_PROFILE_SAMPLE_RATE', 0)),
+    'ALLOW_HEADER': DEBUG, # Profile requests sent with `X-Profile: 1`
+    'SLOW_REQUEST_MS': 1000,
+    'DUPLICATE_QUERIES': 5,
 }
 
 